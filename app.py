@@ -2,6 +2,11 @@ import streamlit as st
 import importlib
 from login import login_page
 import session_utils
+from security_info import warm_for_session
+from universe_precompute import schedule_precompute
+from portfolio_history import start_recorder
+from holdings import TOTAL_CAPITAL
+from utils import session_headers
 
 # --- PAGE SETTINGS ---
 st.set_page_config(page_title="Gopal Mandloi Dashboard", layout="wide")
@@ -29,6 +34,8 @@ PAGES = {
     "GTT Order Place": "gtt_oco_place",
     "Square Off": "squareoff",
     "Auto Order (SL & Targets)": "auto_order",
+    "Order Latency": "latency_dashboard",
+    "Portfolio History": "portfolio_history_view",
     "Symbol Technical Details": "symbol_technical_details",
     "Batch Symbol Scanner": "definedge_batch_scan",
     "Candlestick Demo": "simple_chart_demo",
@@ -54,6 +61,15 @@ selected_page = st.sidebar.selectbox("Select Page", list(PAGES.keys()))
 io = session_utils.get_active_io()
 st.session_state["integrate_io"] = io
 
+# --- BACKGROUND WARM-UP (security info per account, universe features after close, portfolio snapshots) ---
+_session = st.session_state.get("integrate_session")
+if _session:
+    warm_for_session(session_headers(_session), _session["actid"])
+    # Post-close universe feature table (once per trading day, in the background)
+    schedule_precompute(st.secrets.get("integrate_api_session_key", "") or _session["api_session_key"])
+    # Portfolio history snapshots (intraday every 5 min, daily after close); one recorder per account
+    start_recorder(_session["actid"], session_headers(_session), TOTAL_CAPITAL)
+
 # --- PAGE LOADER ---
 try:
     page_module = importlib.import_module(PAGES[selected_page])
@@ -1,98 +1,177 @@
 import logging
-from session_utils import get_client_session
-from quotes import get_circuit_limits
-from holdings import get_holdings
-from positions import get_positions
-from utils import integrate_post
+import time
+import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from utils import api_request, session_headers
+from bulk_orders import run_batch, summarize
+from order_dispatch import HOUSEKEEPING
+from records import decode_holdings, decode_positions, holdings_payload, positions_payload
+from security_info import get_security_cache
 
 logging.basicConfig(level=logging.INFO)
 
+SL_PCT = 0.98
+TARGET_PCT = 1.12
+RECENT_TTL = 600  # seconds a submitted key is remembered while the GTT book catches up
+
+# Keys submitted by this process recently, so a rerun right after a batch
+# cannot place the same OCO again before it shows up in the GTT book
+_recent = {}
+
 def snap_to_tick(price, tick_size):
     # Snap price to nearest tick
     return round(round(price / tick_size) * tick_size, 2)
 
-def can_place_gtt(symbol, trigger_price):
-    lower, upper = get_circuit_limits(symbol)
-    if not (lower <= trigger_price <= upper):
-        logging.error(f"GTT order rejected: {symbol} trigger price {trigger_price} outside circuit limits ({lower}-{upper})")
-        return False, "CIRCUIT LIMIT ERROR"
-    return True, ""
+def oco_key(exchange, symbol, order_type="SELL"):
+    # One protective OCO per instrument and side
+    return f"{exchange}|{symbol}|{order_type}|OCO"
 
-def extract_qty(holding):
-    qty = int(float(holding.get("dp_qty", "0") or 0))
-    if qty == 0:
-        qty = int(float(holding.get("t1_qty", "0") or 0))
-    return qty
+def existing_oco_keys(gttlist):
+    keys = set()
+    for g in gttlist:
+        if g.get("condition") == "LMT_OCO":
+            keys.add(oco_key(g.get("exchange", ""), g.get("tradingsymbol", ""), g.get("order_type", "SELL")))
+    now = time.time()
+    for key, ts in list(_recent.items()):
+        if now - ts > RECENT_TTL:
+            del _recent[key]
+    return keys | set(_recent)
 
-def place_oco_order(symbol, exchange, qty, entry_price, tick_size, product_type="CNC", remarks="Auto OCO"):
-    sl_price = snap_to_tick(entry_price * 0.98, tick_size)
-    tgt_price = snap_to_tick(entry_price * 1.12, tick_size)
-    # Qty split (half-half, odd will go to SL)
-    tgt_qty = qty // 2
-    sl_qty = qty - tgt_qty
+def desired_legs(positions, holdings):
+    # positions/holdings: decoded records
+    legs = {}
+    # POSITIONS
+    for p in positions:
+        if p.net_qty <= 0 or p.buy_avg <= 0:
+            continue
+        legs[oco_key(p.exchange, p.tradingsymbol)] = {
+            "symbol": p.tradingsymbol, "exchange": p.exchange, "token": p.token, "qty": p.net_qty,
+            "entry_price": p.buy_avg, "tick_size": p.tick_size, "product_type": p.product_type,
+        }
+    # HOLDINGS (NSE only)
+    for h in holdings:
+        ts = h.listing("NSE")
+        if ts is None or h.sellable_qty <= 0 or h.avg_price <= 0:
+            continue
+        legs.setdefault(oco_key(ts.exchange, ts.tradingsymbol), {
+            "symbol": ts.tradingsymbol, "exchange": ts.exchange, "token": h.token, "qty": h.sellable_qty,
+            "entry_price": h.avg_price, "tick_size": ts.tick_size, "product_type": "CNC",
+        })
+    return legs
 
-    # Circuit check
-    sl_ok, _ = can_place_gtt(symbol, sl_price)
-    tgt_ok, _ = can_place_gtt(symbol, tgt_price)
-    if not sl_ok and not tgt_ok:
-        logging.warning(f"Skipping {symbol}: Both SL and Target outside circuit.")
-        return
-    payload = {
-        "tradingsymbol": symbol,
-        "exchange": exchange,
+def within(price, limits):
+    return limits is None or limits[0] <= price <= limits[1]
+
+def oco_payload(leg, remarks="Auto OCO"):
+    sl_price = snap_to_tick(leg["entry_price"] * SL_PCT, leg["tick_size"])
+    tgt_price = snap_to_tick(leg["entry_price"] * TARGET_PCT, leg["tick_size"])
+    # Qty split (half-half, odd will go to SL)
+    tgt_qty = leg["qty"] // 2
+    sl_qty = leg["qty"] - tgt_qty
+    return {
+        "tradingsymbol": leg["symbol"],
+        "exchange": leg["exchange"],
         "order_type": "SELL",
-        "product_type": product_type,
+        "product_type": leg["product_type"],
         "target_price": str(tgt_price),
         "stoploss_price": str(sl_price),
         "target_quantity": int(tgt_qty),
         "stoploss_quantity": int(sl_qty),
         "remarks": remarks
     }
-    resp = integrate_post("/ocoplaceorder", payload)
-    if resp.get("status", "").upper() == "ERROR":
-        logging.error(f"{symbol} OCO order failed: {resp.get('message', resp)}")
-    else:
-        logging.info(f"{symbol} OCO Order submitted! {resp}")
-    return resp
 
-def main():
-    try:
-        positions = get_positions() or []
-    except Exception:
-        positions = []
-    try:
-        holdings = get_holdings() or []
-    except Exception:
-        holdings = []
-    # POSITIONS
-    for p in positions:
-        symbol = p.get("tradingsymbol") or p.get("symbol")
-        qty = int(float(p.get("net_quantity") or p.get("netqty") or p.get("quantity") or p.get("Qty") or 0))
-        if qty <= 0:
-            continue
-        exchange = p.get("exchange")
-        product_type = p.get("product_type") or p.get("productType") or p.get("Product") or "INTRADAY"
-        entry_price = float(p.get("day_buy_avg") or p.get("total_buy_avg") or 0.0)
-        tick_size = float(p.get("ticksize") or 0.05)
-        if entry_price > 0:
-            place_oco_order(symbol, exchange, qty, entry_price, tick_size, product_type)
+def protect_portfolio(headers, dry_run=False):
+    # One pass: bulk-load book + GTTs, compute all OCOs, skip existing ones, submit the rest concurrently
+    t0 = time.monotonic()
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        f_pos = pool.submit(api_request, "GET", "/positions", headers)
+        f_hold = pool.submit(api_request, "GET", "/holdings", headers)
+        f_gtt = pool.submit(api_request, "GET", "/gttorders", headers)
+        positions = decode_positions(positions_payload(f_pos.result()))
+        holdings = decode_holdings(holdings_payload(f_hold.result()))
+        gttlist = f_gtt.result().get("pendingGTTOrderBook") or []
+    legs = desired_legs(positions, holdings)
+    existing = existing_oco_keys(gttlist)
+    todo = {key: leg for key, leg in legs.items() if key not in existing}
+    # Circuits and tick sizes from the per-day cache; only tokens not cached today are fetched
+    cache = get_security_cache()
+    cache.warm([(leg["exchange"], leg["token"]) for leg in todo.values()], headers)
+    for leg in todo.values():
+        info = cache.get(leg["exchange"], leg["token"])
+        if info is not None:
+            leg["tick_size"] = info.tick_size
 
-    # HOLDINGS (NSE only)
-    for h in holdings:
-        avg_buy_price = float(h.get("avg_buy_price", "0.0"))
-        qty = extract_qty(h)
-        if qty <= 0:
+    rows, calls = [], []
+    for key, leg in legs.items():
+        row = {"key": key, "symbol": leg["symbol"], "qty": leg["qty"], "status": "", "message": ""}
+        rows.append(row)
+        if key in existing:
+            row["status"] = "SKIPPED"
+            row["message"] = "OCO already exists"
+            continue
+        payload = oco_payload(leg)
+        row["stoploss"] = payload["stoploss_price"]
+        row["target"] = payload["target_price"]
+        limits = cache.circuits(leg["exchange"], leg["token"])
+        if not within(float(payload["stoploss_price"]), limits) and not within(float(payload["target_price"]), limits):
+            row["status"] = "SKIPPED"
+            row["message"] = f"Both SL and Target outside circuit {limits}"
+            logging.warning(f"Skipping {leg['symbol']}: Both SL and Target outside circuit.")
             continue
-        for ts_info in h.get("tradingsymbol", []):
-            if ts_info.get("exchange") != "NSE":
-                continue
-            symbol = ts_info.get("tradingsymbol", "")
-            exchange = ts_info.get("exchange", "")
-            tick_size = float(ts_info.get("ticksize", "0.05"))
-            product_type = "CNC"
-            entry_price = avg_buy_price if avg_buy_price > 0.0 else 0.0
-            if entry_price > 0:
-                place_oco_order(symbol, exchange, qty, entry_price, tick_size, product_type)
+        row["status"] = "DRY_RUN" if dry_run else "PENDING"
+        calls.append((key, "POST", "/ocoplaceorder", payload))
+
+    results = [] if dry_run else run_batch(calls, headers, priority=HOUSEKEEPING)
+    by_key = {r["id"]: r for r in results}
+    for row in rows:
+        r = by_key.get(row["key"])
+        if r:
+            row["status"] = r["status"]
+            row["message"] = r.get("message", "")
+            row["latency_ms"] = r.get("latency_ms")
+            if r["status"] == "OK":
+                _recent[row["key"]] = time.time()
+            else:
+                logging.error(f"{row['symbol']} OCO order failed: {row['message']}")
+    return {
+        "elapsed_ms": round((time.monotonic() - t0) * 1000, 1),
+        "desired": len(legs),
+        "existing": len(legs) - len(todo),
+        "summary": summarize(results) if results else None,
+        "rows": rows,
+    }
+
+def app():
+    st.header("Auto Order — Protect Holdings & Positions with OCO (SL / Target)")
+    st.caption(f"SL at {round((1 - SL_PCT) * 100)}% below and target at {round((TARGET_PCT - 1) * 100)}% above entry. "
+               "Instruments that already have a SELL OCO are skipped.")
+    session = st.session_state.get("integrate_session")
+    if not session:
+        st.error("No active session found!")
+        return
+    col1, col2 = st.columns(2)
+    if col1.button("Preview (Dry Run)"):
+        st.session_state["auto_order_report"] = protect_portfolio(session_headers(session), dry_run=True)
+    if col2.button("Place OCO Orders"):
+        st.session_state["auto_order_report"] = protect_portfolio(session_headers(session))
+    report = st.session_state.get("auto_order_report")
+    if report:
+        st.write(f"{report['desired']} instruments, {report['existing']} already protected — {report['elapsed_ms']} ms")
+        if report["summary"]:
+            s = report["summary"]
+            st.write(f"Submitted {s['sent']}: {s['ok']} OK, {s['failed']} failed")
+        st.dataframe(report["rows"], use_container_width=True)
+
+def main():
+    from session_utils import load_session_from_file
+    session = load_session_from_file()
+    if not session:
+        logging.error("No saved session (session.json).")
+        return
+    report = protect_portfolio(session_headers(session))
+    for row in report["rows"]:
+        logging.info(f"{row['symbol']}: {row['status']} {row['message']}")
+    logging.info(f"Done in {report['elapsed_ms']} ms")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,264 @@
+import time
+import threading
+import numpy as np
+import pandas as pd
+import candle_store
+from candle_store import ist_to_epoch, epoch_to_ist
+
+DEFAULT_TIMEFRAMES = (1, 5, 15)  # minutes
+DEFAULT_CAPACITY = 500  # closed bars kept in memory per token/timeframe
+
+# Column positions inside the OHLCV arrays
+O, H, L, C, V = range(5)
+
+class BarSeries:
+    # Rolling OHLCV bars for one token and one timeframe, stored in a
+    # preallocated ring buffer plus one "forming" bar.
+    def __init__(self, minutes, capacity=DEFAULT_CAPACITY):
+        self.minutes = minutes
+        self.seconds = minutes * 60
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.ohlcv = np.zeros((capacity, 5), dtype=np.float64)
+        self.count = 0  # closed bars written so far
+        self.cur_start = 0  # 0 means no forming bar
+        self.cur = np.zeros(5, dtype=np.float64)
+        self.cur_first = 0  # first/last tick time inside the forming bar
+        self.cur_last = 0
+
+    def last_closed_start(self):
+        if not self.count:
+            return 0
+        return int(self.times[(self.count - 1) % self.capacity])
+
+    def _write_closed(self, start, values):
+        i = self.count % self.capacity
+        self.times[i] = start
+        self.ohlcv[i] = values
+        self.count += 1
+        return (start, *values.tolist())
+
+    def _close_forming(self):
+        bar = self._write_closed(self.cur_start, self.cur)
+        self.cur_start = 0
+        return bar
+
+    def _open_forming(self, start, ts, o, h, l, c, v):
+        self.cur_start = start
+        self.cur[:] = (o, h, l, c, v)
+        self.cur_first = ts
+        self.cur_last = ts
+
+    def update(self, ts, price, volume):
+        # Returns the bar closed by this tick, if any
+        start = ts - ts % self.seconds
+        if self.cur_start and start < self.cur_start:
+            return None  # late tick for an already closed bar
+        if not self.cur_start and start <= self.last_closed_start():
+            return None  # e.g. the bar was completed and closed by a backfill
+        closed = None
+        if self.cur_start and start > self.cur_start:
+            closed = self._close_forming()
+        if not self.cur_start:
+            self._open_forming(start, ts, price, price, price, price, volume)
+        else:
+            cur = self.cur
+            if price > cur[H]:
+                cur[H] = price
+            if price < cur[L]:
+                cur[L] = price
+            cur[C] = price
+            cur[V] += volume
+            self.cur_last = ts
+        return closed
+
+    def flush(self, now):
+        # Close the forming bar once exchange time has passed its end
+        if self.cur_start and now >= self.cur_start + self.seconds:
+            return self._close_forming()
+        return None
+
+    def merge_bar(self, start, o, h, l, c, v, first=None, last=None):
+        # Merge an already aggregated bar (from backfill) aligned to this timeframe;
+        # first/last are the times of its earliest and latest minute
+        first = start if first is None else first
+        last = start if last is None else last
+        if start <= self.last_closed_start():
+            return []
+        if self.cur_start and start == self.cur_start:
+            cur = self.cur
+            if first < self.cur_first:
+                cur[O] = o
+                self.cur_first = first
+            if last > self.cur_last:
+                cur[C] = c
+                self.cur_last = last
+            cur[H] = max(cur[H], h)
+            cur[L] = min(cur[L], l)
+            cur[V] += v
+            if start + self.seconds <= time.time():
+                return [self._close_forming()]
+            return []
+        if self.cur_start and start < self.cur_start:
+            return [self._write_closed(start, np.array((o, h, l, c, v), dtype=np.float64))]
+        closed = []
+        if self.cur_start:
+            closed.append(self._close_forming())
+        self._open_forming(start, first, o, h, l, c, v)
+        self.cur_last = last
+        if start + self.seconds <= time.time():
+            closed.append(self._close_forming())
+        return closed
+
+    def to_frame(self, include_forming=True):
+        n = min(self.count, self.capacity)
+        idx = [(self.count - n + k) % self.capacity for k in range(n)]
+        times = self.times[idx]
+        values = self.ohlcv[idx]
+        if include_forming and self.cur_start:
+            times = np.append(times, self.cur_start)
+            values = np.vstack([values, self.cur])
+        df = pd.DataFrame(values, columns=["Open", "High", "Low", "Close", "Volume"])
+        df.insert(0, "Date", [epoch_to_ist(int(t)).replace(tzinfo=None) for t in times])
+        return df
+
+class BarAggregator:
+    # Turns live touchline ticks into 1m/5m/15m candles per token.
+    def __init__(self, timeframes=DEFAULT_TIMEFRAMES, capacity=DEFAULT_CAPACITY, store=True):
+        self.timeframes = tuple(timeframes)
+        self.capacity = capacity
+        self.store = store
+        self.series = {}  # scrip ("NSE|22") -> {minutes: BarSeries}
+        self.last_volume = {}  # scrip -> cumulative day volume seen so far
+        self.last_tick = {}  # scrip -> exchange time of the latest tick
+        self.resumed = {}  # scrip -> last tick time before a reconnect, until its backfill arrives
+        self.subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        # callback(scrip, minutes, (start_epoch, open, high, low, close, volume))
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def _slot(self, scrip):
+        slot = self.series.get(scrip)
+        if slot is None:
+            slot = {m: BarSeries(m, self.capacity) for m in self.timeframes}
+            self.series[scrip] = slot
+        return slot
+
+    def on_touchline(self, data):
+        # Adapter for WebSocketHandler(on_touchline=...)
+        lp = data.get("lp")
+        if lp in (None, ""):
+            return
+        scrip = f"{data.get('e')}|{data.get('tk')}"
+        try:
+            ts = int(data.get("ft") or time.time())
+            cum_volume = data.get("v")
+            self.on_tick(scrip, float(lp), float(cum_volume) if cum_volume not in (None, "") else None, ts)
+        except (TypeError, ValueError):
+            return
+
+    def reset_volume(self, scrips):
+        # Adapter for WebSocketHandler(on_reconnect=...), called before subscriptions are restored.
+        # The first tick after a reconnect only sets a new volume baseline; the outage's
+        # volume comes from the backfilled minute bars instead of one jump in the current bar.
+        with self._lock:
+            for scrip in scrips:
+                self.last_volume.pop(scrip, None)
+                if scrip in self.last_tick:
+                    self.resumed[scrip] = self.last_tick[scrip]
+
+    def on_tick(self, scrip, price, cum_volume, ts):
+        closed = []
+        with self._lock:
+            self.last_tick[scrip] = ts
+            volume = 0.0
+            if cum_volume is not None:
+                prev = self.last_volume.get(scrip)
+                if prev is not None and cum_volume > prev:
+                    volume = cum_volume - prev
+                self.last_volume[scrip] = cum_volume
+            for minutes, series in self._slot(scrip).items():
+                bar = series.update(ts, price, volume)
+                if bar:
+                    closed.append((minutes, bar))
+        self._publish(scrip, closed)
+
+    def flush(self, now=None):
+        # Close bars for tokens that have not ticked since a boundary passed
+        now = int(now or time.time())
+        for scrip in list(self.series):
+            closed = []
+            with self._lock:
+                for minutes, series in self.series[scrip].items():
+                    bar = series.flush(now)
+                    if bar:
+                        closed.append((minutes, bar))
+            self._publish(scrip, closed)
+
+    def backfill(self, scrip, bars):
+        # Adapter for WebSocketHandler(on_backfill=...): bars are 1-minute
+        # (datetime, open, high, low, close, volume) rows from the history API
+        minute_bars = sorted((ist_to_epoch(b[0]),) + tuple(b[1:6]) for b in bars)
+        closed = []
+        with self._lock:
+            before = self.resumed.pop(scrip, None)
+            for minutes, series in self._slot(scrip).items():
+                if before is not None:
+                    # Volume was reset at the reconnect: live ticks cover everything up to the
+                    # minute of the last tick before it, the history everything after
+                    rows = [b for b in minute_bars if b[0] > before - before % 60]
+                elif series.cur_start:
+                    # Skip minutes already seen live inside the forming bar
+                    seen_from = series.cur_first - series.cur_first % 60
+                    seen_to = series.cur_last - series.cur_last % 60
+                    rows = [b for b in minute_bars if not (seen_from <= b[0] <= seen_to)]
+                else:
+                    rows = minute_bars
+                for bucket in _group_bars(rows, series.seconds):
+                    for bar in series.merge_bar(*bucket):
+                        closed.append((minutes, bar))
+        self._publish(scrip, closed)
+
+    def _publish(self, scrip, closed):
+        if not closed:
+            return
+        if self.store:
+            segment, token = scrip.split("|", 1)
+            for minutes, bar in closed:
+                candle_store.append_bars(segment, token, f"{minutes}m", [bar])
+        for minutes, bar in closed:
+            for callback in list(self.subscribers):
+                try:
+                    callback(scrip, minutes, bar)
+                except Exception as e:
+                    print(f"Bar subscriber error: {e}")
+
+    def get_bars(self, scrip, minutes, include_forming=True):
+        with self._lock:
+            slot = self.series.get(scrip)
+            if not slot or minutes not in slot:
+                return pd.DataFrame(columns=["Date", "Open", "High", "Low", "Close", "Volume"])
+            return slot[minutes].to_frame(include_forming)
+
+def _group_bars(minute_bars, seconds):
+    # Aggregate sorted minute bars into buckets of `seconds`:
+    # [start, open, high, low, close, volume, first minute, last minute]
+    buckets = []
+    for t, o, h, l, c, v in minute_bars:
+        start = t - t % seconds
+        if buckets and buckets[-1][0] == start:
+            b = buckets[-1]
+            b[2] = max(b[2], h)
+            b[3] = min(b[3], l)
+            b[4] = c
+            b[5] += v
+            b[7] = t
+        else:
+            buckets.append([start, o, h, l, c, v, t, t])
+    return buckets
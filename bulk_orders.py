@@ -0,0 +1,53 @@
+import time
+from concurrent.futures import wait
+from order_dispatch import get_dispatcher, ENTRY, CANCEL
+
+DEFAULT_DEADLINE = 5.0  # seconds for a whole batch
+
+def run_batch(calls, headers, deadline=DEFAULT_DEADLINE, priority=ENTRY):
+    # calls: [(key, method, path, payload)]. Queued on the shared order dispatcher at one
+    # priority and sent concurrently within the order rate limit; returns one result row
+    # per call, in input order. Calls not answered before the deadline are reported as TIMEOUT.
+    if not calls:
+        return []
+    start = time.monotonic()
+    dispatcher = get_dispatcher()
+    futures = [dispatcher.submit(priority, method, path, payload, headers, timeout=deadline)
+               for _, method, path, payload in calls]
+    done_at = {}  # queue wait + round-trip per call
+    for i, future in enumerate(futures):
+        future.add_done_callback(lambda f, i=i: done_at.__setitem__(i, time.monotonic()))
+    wait(futures, timeout=deadline + 1)
+    results = []
+    for i, (call, future) in enumerate(zip(calls, futures)):
+        if not future.done():
+            results.append({"id": call[0], "status": "TIMEOUT", "message": "No response before deadline", "latency_ms": None})
+            continue
+        resp = future.result()
+        status = resp.get("status") if resp.get("status") in ("ERROR", "TIMEOUT") else "OK"
+        results.append({
+            "id": call[0],
+            "status": status,
+            "message": resp.get("message", ""),
+            "latency_ms": round((done_at[i] - start) * 1000, 1) if status != "TIMEOUT" and i in done_at else None,
+            "response": resp,
+        })
+    return results
+
+def cancel_orders(order_ids, headers, deadline=DEFAULT_DEADLINE):
+    # Cancel many orders in one concurrent round-trip; returns per-order results
+    calls = [(oid, "GET", f"/cancel/{oid}", None) for oid in dict.fromkeys(order_ids)]
+    results = run_batch(calls, headers, deadline=deadline, priority=CANCEL)
+    for row in results:
+        row["order_id"] = row.pop("id")
+    return results
+
+def summarize(results):
+    ok = sum(1 for r in results if r["status"] == "OK")
+    latencies = [r["latency_ms"] for r in results if r.get("latency_ms") is not None]
+    return {
+        "sent": len(results),
+        "ok": ok,
+        "failed": len(results) - ok,
+        "max_latency_ms": max(latencies) if latencies else None,
+    }
@@ -0,0 +1,62 @@
+import os
+import io
+import threading
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+
+# Local on-disk candle store. Files use the same CSV layout as the Definedge
+# history API (Dateandtime,Open,High,Low,Close,Volume,OI), one file per
+# segment/token/timeframe: candles/NSE/22_1m.csv
+CANDLE_DIR = "candles"
+IST = timezone(timedelta(hours=5, minutes=30))
+
+_lock = threading.Lock()
+
+def candle_path(segment, token, timeframe, base_dir=CANDLE_DIR):
+    return os.path.join(base_dir, str(segment).upper(), f"{token}_{timeframe}.csv")
+
+def epoch_to_ist(ts):
+    return datetime.fromtimestamp(ts, IST)
+
+def ist_to_epoch(dt):
+    # Naive datetimes from the history API are exchange (IST) time
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=IST)
+    return int(dt.timestamp())
+
+def append_bars(segment, token, timeframe, bars, base_dir=CANDLE_DIR):
+    # bars: iterable of (epoch_start, open, high, low, close, volume)
+    lines = [
+        f"{epoch_to_ist(t).strftime('%d%m%Y%H%M')},{o},{h},{l},{c},{int(v)},0\n"
+        for t, o, h, l, c, v in bars
+    ]
+    if not lines:
+        return
+    path = candle_path(segment, token, timeframe, base_dir)
+    with _lock:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a") as f:
+            f.writelines(lines)
+
+def parse_candles(text):
+    cols = ["Dateandtime", "Open", "High", "Low", "Close", "Volume", "OI"]
+    df = pd.read_csv(io.StringIO(text), header=None, names=cols, dtype={"Dateandtime": str})
+    df = df[df["Dateandtime"].notnull()]
+    df = df[df["Dateandtime"].astype(str).str.strip() != ""]
+    df["Date"] = pd.to_datetime(df["Dateandtime"].astype(str).str.zfill(12), format="%d%m%Y%H%M", errors="coerce")
+    df = df.dropna(subset=["Date"])
+    for col in ["Open", "High", "Low", "Close", "Volume"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df
+
+def load_candles(segment, token, timeframe, base_dir=CANDLE_DIR):
+    path = candle_path(segment, token, timeframe, base_dir)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=["Dateandtime", "Open", "High", "Low", "Close", "Volume", "OI", "Date"])
+    with _lock:
+        with open(path) as f:
+            text = f.read()
+    df = parse_candles(text)
+    # Later writes (e.g. backfill corrections) win over earlier ones
+    df = df.drop_duplicates(subset=["Date"], keep="last").sort_values("Date")
+    return df.reset_index(drop=True)
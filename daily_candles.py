@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import requests
+from candle_store import IST, load_candles, append_bars, parse_candles, ist_to_epoch
+
+# Daily candles (timeframe "day") kept up to date in the local candle store from the
+# history API. Only completed sessions are stored; each token is refreshed at most
+# once per trading day per process.
+HISTORY_URL = "https://data.definedgesecurities.com/sds/history/{}/{}/day/{}/{}"
+BACKFILL_DAYS = 400  # calendar days fetched when a token has no (or too short) stored history
+FETCH_WORKERS = 8
+
+_refreshed = {}  # (exchange, token) -> (trading day, backfill days) it was brought up to date for
+
+def today():
+    return datetime.now(IST).strftime("%Y-%m-%d")
+
+def last_session():
+    # Newest session the store can hold (today's candle is never stored): the previous weekday.
+    # Exchange holidays are not known here, so data after one reads as a session behind.
+    day = datetime.now(IST) - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day.strftime("%Y-%m-%d")
+
+def fetch_daily(exchange, token, api_key, since):
+    to = datetime.now(IST)
+    url = HISTORY_URL.format(exchange, token, since.strftime("%d%m%Y0000"), to.strftime("%d%m%Y1530"))
+    resp = requests.get(url, headers={"Authorization": api_key}, timeout=8)
+    if resp.status_code != 200 or not resp.text.strip():
+        return 0
+    df = parse_candles(resp.text)
+    # Today's candle is still moving
+    df = df[df["Date"].dt.strftime("%Y-%m-%d") < today()]
+    append_bars(exchange, token, "day", [
+        (ist_to_epoch(d.to_pydatetime()), o, h, l, c, v)
+        for d, o, h, l, c, v in zip(df["Date"], df["Open"], df["High"], df["Low"], df["Close"], df["Volume"].fillna(0))
+    ])
+    return len(df)
+
+def ensure_daily(pairs, api_key, backfill_days=BACKFILL_DAYS, workers=FETCH_WORKERS):
+    # Brings stored daily candles up to the last completed session; returns bars added
+    day = today()
+    todo = [p for p in dict.fromkeys(pairs) if p[1] and _refreshed.get(p, (None, 0)) < (day, backfill_days)]
+    if not todo or not api_key:
+        return 0
+    start = datetime.now(IST) - timedelta(days=backfill_days)
+
+    def refresh(pair):
+        stored = load_candles(pair[0], pair[1], "day")
+        if stored.empty or stored["Date"].iloc[0].to_pydatetime() > start.replace(tzinfo=None) + timedelta(days=7):
+            since = start  # nothing stored, or not far enough back for this caller
+        else:
+            since = stored["Date"].iloc[-1].to_pydatetime() + timedelta(days=1)
+        try:
+            added = fetch_daily(pair[0], pair[1], api_key, since) if since.strftime("%Y-%m-%d") < day else 0
+        except Exception as e:
+            print(f"Daily candle refresh failed for {pair}: {e}")
+            return 0
+        _refreshed[pair] = (day, backfill_days)
+        return added
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(refresh, todo))
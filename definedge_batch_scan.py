@@ -3,7 +3,9 @@ import pandas as pd
 import numpy as np
 import requests
 import io
+import time
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import plotly.graph_objs as go
 
 from master_loader import load_watchlist
@@ -66,96 +68,164 @@ def compute_rsi(series, period=14):
     rsi = 100 - (100 / (1 + rs))
     return rsi
 
+def scan_symbol(
+    row, api_key, days=120, ema_ltp_thr=0.95, ema_ratio_thr=0.95,
+    rsi_enabled=False, rsi_threshold=None, rsi_direction="Above",
+    ema_scan_enabled=False, ema_condition="Price above 20EMA", show_rs=True,
+    nifty_df=None
+):
+    # One watchlist row -> result dict, or None when it does not match. Fetch errors propagate.
+    segment = row['segment']
+    token = row['token']
+    symbol = row['symbol']
+    company = row['company'] if "company" in row else ""
+    if str(symbol).strip().lower() == NIFTY500_SYMBOL:
+        return None  # Skip Nifty 500 itself
+    from_dt, to_dt = get_time_range(days)
+    df = fetch_candles_definedge(segment, token, "day", from_dt, to_dt, api_key)
+    if len(df) < 50:
+        return None
+    df["EMA20"] = compute_ema(df["Close"], 20)
+    df["EMA50"] = compute_ema(df["Close"], 50)
+    df["RSI14"] = compute_rsi(df["Close"], 14)
+    ltp = df["Close"].iloc[-1]
+    ema20 = df["EMA20"].iloc[-1]
+    ema50 = df["EMA50"].iloc[-1]
+    rsi14 = df["RSI14"].iloc[-1]
+
+    rsi_status = ""
+    if rsi_enabled and rsi_threshold is not None:
+        if rsi_direction == "Above" and rsi14 > rsi_threshold:
+            rsi_status = f"RSI {rsi14:.1f} > {rsi_threshold}"
+        elif rsi_direction == "Below" and rsi14 < rsi_threshold:
+            rsi_status = f"RSI {rsi14:.1f} < {rsi_threshold}"
+        else:
+            return None
+
+    ema_status = ""
+    if ema_scan_enabled:
+        if ema_condition == "Price above 20EMA" and ltp > ema20:
+            ema_status = "LTP > 20EMA"
+        elif ema_condition == "Price below 20EMA" and ltp < ema20:
+            ema_status = "LTP < 20EMA"
+        elif ema_condition == "20EMA above 50EMA" and ema20 > ema50:
+            ema_status = "20EMA > 50EMA"
+        elif ema_condition == "20EMA below 50EMA" and ema20 < ema50:
+            ema_status = "20EMA < 50EMA"
+        else:
+            return None
+
+    # RS Calculation
+    rs_score, rs_flag = np.nan, ""
+    if show_rs and nifty_df is not None and not nifty_df.empty:
+        merged = pd.merge(
+            df[["Date", "Close"]],
+            nifty_df[["Date", "Close"]].rename(columns={"Close": "NiftyClose"}),
+            on="Date",
+            how="inner"
+        )
+        if len(merged) >= 2:
+            stock_return = merged["Close"].iloc[-1] / merged["Close"].iloc[0]
+            nifty_return = merged["NiftyClose"].iloc[-1] / merged["NiftyClose"].iloc[0]
+            if nifty_return != 0:
+                rs_score = stock_return / nifty_return
+                rs_flag = "Outperform" if rs_score > 1 else "Underperform"
+    elif show_rs:
+        rs_flag = "Nifty 500 data unavailable"
+
+    ema20_ltp = ema20 / ltp if ltp else np.nan
+    ema50_ema20 = ema50 / ema20 if ema20 else np.nan
+    if not ((ema20_ltp > ema_ltp_thr) and (ema50_ema20 > ema_ratio_thr)):
+        return None
+    return {
+        "Symbol": symbol,
+        "Company": company,
+        "LTP": ltp,
+        "20EMA": round(ema20, 2),
+        "50EMA": round(ema50, 2),
+        "RSI14": round(rsi14, 2),
+        "RS_Score": round(rs_score, 3) if show_rs and not np.isnan(rs_score) else "",
+        "RS_Flag": rs_flag if show_rs else "",
+        "EMA_Scan": ema_status,
+        "RSI_Scan": rsi_status,
+        "segment": segment,
+        "token": token
+    }
+
 def scan_symbols(
     master_df, api_key, updown_window=15, days=120, ema_ltp_thr=0.95, ema_ratio_thr=0.95,
     rsi_enabled=False, rsi_threshold=None, rsi_direction="Above",
     ema_scan_enabled=False, ema_condition="Price above 20EMA", show_rs=True,
-    nifty_df=None  # Pass the already-fetched Nifty 500 df for RS calc
+    nifty_df=None,  # Pass the already-fetched Nifty 500 df for RS calc
+    workers=1
 ):
-    result = []
-    for idx, row in master_df.iterrows():
-        segment = row['segment']
-        token = row['token']
-        symbol = row['symbol']
-        company = row['company'] if "company" in row else ""
-        if str(symbol).strip().lower() == NIFTY500_SYMBOL:
-            continue  # Skip Nifty 500 itself
+    params = dict(days=days, ema_ltp_thr=ema_ltp_thr, ema_ratio_thr=ema_ratio_thr,
+                  rsi_enabled=rsi_enabled, rsi_threshold=rsi_threshold, rsi_direction=rsi_direction,
+                  ema_scan_enabled=ema_scan_enabled, ema_condition=ema_condition, show_rs=show_rs,
+                  nifty_df=nifty_df)
+
+    def scan(row):
         try:
-            from_dt, to_dt = get_time_range(days)
-            df = fetch_candles_definedge(segment, token, "day", from_dt, to_dt, api_key)
-            if len(df) < 50:
-                continue
-            df["EMA20"] = compute_ema(df["Close"], 20)
-            df["EMA50"] = compute_ema(df["Close"], 50)
-            df["RSI14"] = compute_rsi(df["Close"], 14)
-            ltp = df["Close"].iloc[-1]
-            ema20 = df["EMA20"].iloc[-1]
-            ema50 = df["EMA50"].iloc[-1]
-            rsi14 = df["RSI14"].iloc[-1]
-
-            rsi_status = ""
-            if rsi_enabled and rsi_threshold is not None:
-                if rsi_direction == "Above" and rsi14 > rsi_threshold:
-                    rsi_status = f"RSI {rsi14:.1f} > {rsi_threshold}"
-                elif rsi_direction == "Below" and rsi14 < rsi_threshold:
-                    rsi_status = f"RSI {rsi14:.1f} < {rsi_threshold}"
-                else:
-                    continue
-
-            ema_status = ""
-            if ema_scan_enabled:
-                if ema_condition == "Price above 20EMA" and ltp > ema20:
-                    ema_status = "LTP > 20EMA"
-                elif ema_condition == "Price below 20EMA" and ltp < ema20:
-                    ema_status = "LTP < 20EMA"
-                elif ema_condition == "20EMA above 50EMA" and ema20 > ema50:
-                    ema_status = "20EMA > 50EMA"
-                elif ema_condition == "20EMA below 50EMA" and ema20 < ema50:
-                    ema_status = "20EMA < 50EMA"
-                else:
-                    continue
-
-            # RS Calculation
-            rs_score, rs_flag = np.nan, ""
-            if show_rs and nifty_df is not None and not nifty_df.empty:
-                merged = pd.merge(
-                    df[["Date", "Close"]],
-                    nifty_df[["Date", "Close"]].rename(columns={"Close": "NiftyClose"}),
-                    on="Date",
-                    how="inner"
-                )
-                if len(merged) >= 2:
-                    stock_return = merged["Close"].iloc[-1] / merged["Close"].iloc[0]
-                    nifty_return = merged["NiftyClose"].iloc[-1] / merged["NiftyClose"].iloc[0]
-                    if nifty_return != 0:
-                        rs_score = stock_return / nifty_return
-                        rs_flag = "Outperform" if rs_score > 1 else "Underperform"
-            elif show_rs:
-                rs_flag = "Nifty 500 data unavailable"
-
-            ema20_ltp = ema20 / ltp if ltp else np.nan
-            ema50_ema20 = ema50 / ema20 if ema20 else np.nan
-            if (
-                (ema20_ltp > ema_ltp_thr) and
-                (ema50_ema20 > ema_ratio_thr)
-            ):
-                result.append({
-                    "Symbol": symbol,
-                    "Company": company,
-                    "LTP": ltp,
-                    "20EMA": round(ema20, 2),
-                    "50EMA": round(ema50, 2),
-                    "RSI14": round(rsi14, 2),
-                    "RS_Score": round(rs_score, 3) if show_rs and not np.isnan(rs_score) else "",
-                    "RS_Flag": rs_flag if show_rs else "",
-                    "EMA_Scan": ema_status,
-                    "RSI_Scan": rsi_status,
-                    "segment": segment,
-                    "token": token
-                })
+            return scan_symbol(row, api_key, **params)
         except Exception:
-            continue
-    return pd.DataFrame(result)
+            return None
+
+    rows = [row for _, row in master_df.iterrows()]
+    if workers > 1:
+        # Network bound: fetch candles concurrently, keep watchlist order
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            result = list(pool.map(scan, rows))
+    else:
+        result = [scan(row) for row in rows]
+    return pd.DataFrame([r for r in result if r])
+
+def scan_features(
+    features, master_df, days=120, ema_ltp_thr=0.95, ema_ratio_thr=0.95,
+    rsi_enabled=False, rsi_threshold=None, rsi_direction="Above",
+    ema_scan_enabled=False, ema_condition="Price above 20EMA", show_rs=True
+):
+    # scan_symbol's conditions as column masks on the post-close feature table (universe_precompute).
+    # EMAs there use the full stored history, and RS uses the nearest precomputed window to `days`.
+    keys = master_df["segment"].astype(str).str.upper() + "|" + master_df["token"].astype(str)
+    df = features[features["id"].isin(set(keys)) & (features["Bars"] >= 50)].copy()
+    df = df[df["symbol"].astype(str).str.strip().str.lower() != NIFTY500_SYMBOL]
+    mask = (df["EMA20/LTP"] > ema_ltp_thr) & (df["EMA50/EMA20"] > ema_ratio_thr)
+    df["RSI_Scan"] = ""
+    if rsi_enabled and rsi_threshold is not None:
+        if rsi_direction == "Above":
+            mask &= df["RSI14"] > rsi_threshold
+            df["RSI_Scan"] = "RSI " + df["RSI14"].round(1).astype(str) + f" > {rsi_threshold}"
+        else:
+            mask &= df["RSI14"] < rsi_threshold
+            df["RSI_Scan"] = "RSI " + df["RSI14"].round(1).astype(str) + f" < {rsi_threshold}"
+    df["EMA_Scan"] = ""
+    if ema_scan_enabled:
+        conditions = {
+            "Price above 20EMA": (df["LTP"] > df["EMA20"], "LTP > 20EMA"),
+            "Price below 20EMA": (df["LTP"] < df["EMA20"], "LTP < 20EMA"),
+            "20EMA above 50EMA": (df["EMA20"] > df["EMA50"], "20EMA > 50EMA"),
+            "20EMA below 50EMA": (df["EMA20"] < df["EMA50"], "20EMA < 50EMA"),
+        }
+        cond, label = conditions[ema_condition]
+        mask &= cond
+        df["EMA_Scan"] = label
+    df = df[mask]
+    rs_col = "RS_3M" if days <= 100 else "RS_6M" if days <= 200 else "RS_1Y"
+    rs = df[rs_col]
+    return pd.DataFrame({
+        "Symbol": df["symbol"],
+        "Company": df["company"],
+        "LTP": df["LTP"],
+        "20EMA": df["EMA20"].round(2),
+        "50EMA": df["EMA50"].round(2),
+        "RSI14": df["RSI14"].round(2),
+        "RS_Score": rs.round(3).where(rs.notna(), "") if show_rs else "",
+        "RS_Flag": np.where(rs.isna(), "Nifty 500 data unavailable", np.where(rs > 1, "Outperform", "Underperform")) if show_rs else "",
+        "EMA_Scan": df["EMA_Scan"],
+        "RSI_Scan": df["RSI_Scan"],
+        "segment": df["exchange"],
+        "token": df["token"],
+    }).reset_index(drop=True)
 
 def plot_candlestick(df):
     df = df[df['Date'] <= pd.Timestamp.today()]
@@ -188,13 +258,6 @@ def show():
     st.sidebar.title("Watchlist & Scan filters")
     selected_watchlist = st.sidebar.selectbox("Select Watchlist CSV", WATCHLIST_FILES)
 
-    # Always load master.csv for Nifty 500 (for RS and chart)
-    try:
-        master_for_nifty = load_watchlist("master.csv")
-    except Exception as e:
-        st.error(f"Error loading master.csv for Nifty 500: {e}")
-        return
-
     # Load selected watchlist for scanning
     try:
         master_df = load_watchlist(selected_watchlist)
@@ -204,7 +267,6 @@ def show():
 
     ema_ltp_thr = st.sidebar.number_input("20EMA / LTP threshold", min_value=0.8, max_value=1.5, value=0.95, step=0.01)
     ema_ratio_thr = st.sidebar.number_input("50EMA / 20EMA threshold", min_value=0.8, max_value=1.5, value=0.95, step=0.01)
-    updown_window = st.sidebar.number_input("Updays/Downdays Window (days)", min_value=5, max_value=40, value=15, step=1)
     days = st.sidebar.number_input("Lookback Days", min_value=50, max_value=600, value=120, step=10)
 
     st.sidebar.markdown("---")
@@ -231,56 +293,77 @@ def show():
     st.sidebar.markdown("---")
     show_rs = st.sidebar.checkbox("Show Relative Strength vs Nifty 500", value=True)
 
-    # --- Fetch Nifty 500 data ONCE robustly, always from master.csv ---
-    nifty500_row = get_nifty500_row(master_for_nifty)
-    nifty_df = None
-    nifty500_error = ""
-    if nifty500_row is not None:
-        nseg, ntok = nifty500_row['segment'], nifty500_row['token']
+    workers = st.sidebar.number_input("Concurrent fetches", min_value=1, max_value=16, value=8, step=1)
+
+    from scan_runner import run_scan, save_results, load_latest, fetch_nifty500
+
+    from universe_precompute import load_features
+    features, features_meta = load_features()
+    source = "Live fetch"
+    if features is not None:
+        source = st.radio("Source", ["Precomputed table", "Live fetch"], horizontal=True,
+                          help=f"Feature table built {features_meta.get('built')} for session {features_meta.get('session')}")
+
+    params = dict(days=days, ema_ltp_thr=ema_ltp_thr, ema_ratio_thr=ema_ratio_thr,
+                  rsi_enabled=rsi_enabled, rsi_threshold=rsi_threshold, rsi_direction=rsi_direction,
+                  ema_scan_enabled=ema_scan_enabled, ema_condition=ema_condition, show_rs=show_rs)
+    if source == "Precomputed table" and st.button("Run Symbol Scan"):
+        start = time.perf_counter()
+        scan_df = scan_features(features, master_df, **params)
+        elapsed = time.perf_counter() - start
+        stats = {"symbols": len(master_df), "matched": len(scan_df), "errors": 0, "workers": 0,
+                 "elapsed_s": round(elapsed, 3), "source": "feature table", "session": features_meta.get("session")}
+        save_results(scan_df, {"watchlist": selected_watchlist, "params": params, "stats": stats})
+    elif source == "Live fetch" and st.button("Run Symbol Scan"):
+        nifty_df, nifty500_error = fetch_nifty500(api_key, days) if show_rs else (None, "")
+        if nifty500_error:
+            st.warning(f"Relative strength unavailable: {nifty500_error}")
+        bar = st.progress(0.0, text="Scanning symbols, please wait...")
+        scan_df, stats = run_scan(master_df, api_key, params, workers=int(workers), nifty_df=nifty_df,
+                                  progress=lambda done, total: bar.progress(done / total, text=f"{done}/{total} scanned"))
+        save_results(scan_df, {"watchlist": selected_watchlist, "params": params, "stats": stats})
+
+    # Results come from the newest saved scan, whether run here or by `python scan_runner.py` (e.g. from cron)
+    scan_df, meta = load_latest()
+    if meta is None:
+        st.info("Select watchlist and filters, then click 'Run Symbol Scan' to find matching symbols and visualize price action.")
+        return
+    stats = meta["stats"]
+    st.caption(f"Latest scan: {meta['created']} on {meta['watchlist']} — {stats['matched']}/{stats['symbols']} matched, "
+               f"{stats['errors']} errors, {stats['elapsed_s']} s "
+               + (f"from the {stats['source']} (session {stats.get('session')})" if stats.get("source")
+                  else f"with {stats['workers']} workers"))
+    with st.expander("Scan parameters and timing"):
+        st.json(meta)
+    if scan_df.empty:
+        st.warning("No symbols matched the criteria.")
+        return
+    st.dataframe(scan_df)
+    days = meta["params"].get("days", days)
+
+    cols = st.columns(2)
+    with cols[0]:
+        st.subheader("Nifty 500 Chart")
+        nifty_df, nifty500_error = fetch_nifty500(api_key, days)
+        if nifty_df is not None and not nifty_df.empty:
+            st.plotly_chart(plot_candlestick(nifty_df), use_container_width=True)
+        else:
+            st.warning(f"Nifty 500 chart data not available. {nifty500_error}")
+
+    with cols[1]:
+        symbol_sel = st.selectbox("See candlestick for symbol:", scan_df["Symbol"])
+        row = scan_df[scan_df["Symbol"] == symbol_sel].iloc[0]
+        segment, token = row["segment"], row["token"]
         from_dt, to_dt = get_time_range(days)
         try:
-            nifty_df = fetch_candles_definedge(nseg, ntok, "day", from_dt, to_dt, api_key)
-            if nifty_df.empty:
-                nifty500_error = "Nifty 500 candle data empty."
+            df = fetch_candles_definedge(segment, token, "day", from_dt, to_dt, api_key)
+            st.subheader(f"{symbol_sel} Chart")
+            st.plotly_chart(plot_candlestick(df), use_container_width=True)
         except Exception as e:
-            nifty500_error = str(e)
-    else:
-        nifty500_error = "'Nifty 500' symbol not found in master.csv."
-
-    if st.button("Run Symbol Scan"):
-        st.info("Scanning symbols, please wait...")
-        scan_df = scan_symbols(
-            master_df, api_key, updown_window, days, ema_ltp_thr, ema_ratio_thr,
-            rsi_enabled, rsi_threshold, rsi_direction,
-            ema_scan_enabled, ema_condition, show_rs,
-            nifty_df=nifty_df
-        )
-        if scan_df.empty:
-            st.warning("No symbols matched the criteria.")
-            return
-        st.dataframe(scan_df)
-
-        cols = st.columns(2)
-        with cols[0]:
-            st.subheader("Nifty 500 Chart")
-            if nifty_df is not None and not nifty_df.empty:
-                st.plotly_chart(plot_candlestick(nifty_df), use_container_width=True)
-            else:
-                st.warning(f"Nifty 500 chart data not available. {nifty500_error}")
-
-        with cols[1]:
-            symbol_sel = st.selectbox("See candlestick for symbol:", scan_df["Symbol"])
-            row = scan_df[scan_df["Symbol"] == symbol_sel].iloc[0]
-            segment, token = row["segment"], row["token"]
-            from_dt, to_dt = get_time_range(days)
-            try:
-                df = fetch_candles_definedge(segment, token, "day", from_dt, to_dt, api_key)
-                st.subheader(f"{symbol_sel} Chart")
-                st.plotly_chart(plot_candlestick(df), use_container_width=True)
-            except Exception as e:
-                st.error(f"Error fetching candle data: {e}")
-
-    st.info("Select watchlist and filters, then click 'Run Symbol Scan' to find matching symbols and visualize price action.")
+            st.error(f"Error fetching candle data: {e}")
+
+def app():
+    show()
 
 if __name__ == "__main__":
     show()
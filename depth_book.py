@@ -0,0 +1,134 @@
+import time
+import numpy as np
+
+LEVELS = 5
+
+# Rows of DepthBook.levels
+BID_PX, BID_QTY, BID_ORDERS, ASK_PX, ASK_QTY, ASK_ORDERS = range(6)
+
+# Noren depth fields: bp1..bp5 / bq1..bq5 / bo1..bo5 for bids, sp/sq/so for asks
+_FIELD_INDEX = {}
+for _i in range(LEVELS):
+    for _prefix, _row in (("bp", BID_PX), ("bq", BID_QTY), ("bo", BID_ORDERS),
+                          ("sp", ASK_PX), ("sq", ASK_QTY), ("so", ASK_ORDERS)):
+        _FIELD_INDEX[f"{_prefix}{_i + 1}"] = (_row, _i)
+
+class DepthBook:
+    # 5-level market depth for one token, updated in place from "dk"/"df" messages
+    __slots__ = ("e", "tk", "levels", "ltp", "total_buy_qty", "total_sell_qty", "updated")
+
+    def __init__(self, e, tk):
+        self.e = e
+        self.tk = tk
+        self.levels = np.zeros((6, LEVELS), dtype=np.float64)
+        self.ltp = 0.0
+        self.total_buy_qty = 0.0
+        self.total_sell_qty = 0.0
+        self.updated = 0.0
+
+    def apply(self, data):
+        levels = self.levels
+        for k, v in data.items():
+            idx = _FIELD_INDEX.get(k)
+            try:
+                if idx is not None:
+                    levels[idx] = float(v)
+                elif k == "lp":
+                    self.ltp = float(v)
+                elif k == "tbq":
+                    self.total_buy_qty = float(v)
+                elif k == "tsq":
+                    self.total_sell_qty = float(v)
+            except (TypeError, ValueError):
+                continue
+        self.updated = time.time()
+        return self
+
+    @property
+    def best_bid(self):
+        return self.levels[BID_PX, 0]
+
+    @property
+    def best_ask(self):
+        return self.levels[ASK_PX, 0]
+
+    def is_ready(self):
+        return self.best_bid > 0 or self.best_ask > 0
+
+    def spread(self):
+        if self.best_bid > 0 and self.best_ask > 0:
+            return self.best_ask - self.best_bid
+        return np.nan
+
+    def mid(self):
+        if self.best_bid > 0 and self.best_ask > 0:
+            return (self.best_ask + self.best_bid) / 2
+        return np.nan
+
+    def imbalance(self, depth=LEVELS):
+        # +1 = all size on the bid, -1 = all size on the ask
+        bid = self.levels[BID_QTY, :depth].sum()
+        ask = self.levels[ASK_QTY, :depth].sum()
+        total = bid + ask
+        return (bid - ask) / total if total else 0.0
+
+    def cum_size_to(self, price, side):
+        # Quantity available to a BUY up to `price` (asks) or to a SELL down to `price` (bids)
+        if side == "BUY":
+            px, qty = self.levels[ASK_PX], self.levels[ASK_QTY]
+            mask = (px > 0) & (px <= price)
+        else:
+            px, qty = self.levels[BID_PX], self.levels[BID_QTY]
+            mask = (px > 0) & (px >= price)
+        return float(qty[mask].sum())
+
+    def limit_price_for(self, side, quantity):
+        # Worst visible price needed to fill `quantity` immediately, or None if the book is too thin
+        if side == "BUY":
+            px, qty = self.levels[ASK_PX], self.levels[ASK_QTY]
+        else:
+            px, qty = self.levels[BID_PX], self.levels[BID_QTY]
+        filled = np.cumsum(np.where(px > 0, qty, 0))
+        hit = np.nonzero(filled >= quantity)[0]
+        if not len(hit) or px[hit[0]] <= 0:
+            return None
+        return float(px[hit[0]])
+
+    def to_message(self):
+        # Full "dk"-style message for this book (used to ship books between processes)
+        msg = {"t": "dk", "e": self.e, "tk": self.tk, "lp": self.ltp,
+               "tbq": self.total_buy_qty, "tsq": self.total_sell_qty}
+        for field, idx in _FIELD_INDEX.items():
+            msg[field] = float(self.levels[idx])
+        return msg
+
+    def to_frame_rows(self):
+        return [
+            {
+                "Bid Orders": int(self.levels[BID_ORDERS, i]),
+                "Bid Qty": int(self.levels[BID_QTY, i]),
+                "Bid": self.levels[BID_PX, i],
+                "Ask": self.levels[ASK_PX, i],
+                "Ask Qty": int(self.levels[ASK_QTY, i]),
+                "Ask Orders": int(self.levels[ASK_ORDERS, i]),
+            }
+            for i in range(LEVELS)
+        ]
+
+class DepthBooks:
+    def __init__(self):
+        self.books = {}
+
+    def apply(self, data):
+        key = (data.get("e"), data.get("tk"))
+        book = self.books.get(key)
+        if book is None:
+            book = DepthBook(*key)
+            self.books[key] = book
+        return book.apply(data)
+
+    def get(self, exchange, token):
+        return self.books.get((exchange, str(token)))
+
+    def __len__(self):
+        return len(self.books)
@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 from utils import integrate_post
+from order_dispatch import HOUSEKEEPING
 
 def app():
     # Load master file (assuming it's extracted to "master.csv" in the project root)
@@ -49,7 +50,7 @@ def app():
             }
             if remarks:
                 payload["remarks"] = remarks
-            resp = integrate_post("/gttplaceorder", payload)
+            resp = integrate_post("/gttplaceorder", payload, priority=HOUSEKEEPING)
             if resp.get("status", "").upper() == "ERROR":
                 st.error(f"Failed: {resp.get('message', resp)}")
             else:
@@ -86,7 +87,7 @@ def app():
             }
             if remarks:
                 payload["remarks"] = remarks
-            resp = integrate_post("/ocoplaceorder", payload)
+            resp = integrate_post("/ocoplaceorder", payload, priority=HOUSEKEEPING)
             if resp.get("status", "").upper() == "ERROR":
                 st.error(f"Failed: {resp.get('message', resp)}")
             else:
@@ -1,5 +1,9 @@
 import streamlit as st
-from utils import integrate_get, integrate_post
+from utils import integrate_get, integrate_post, get_session_headers
+import gtt_reconcile
+from order_dispatch import HOUSEKEEPING
+import trailing_engine
+from live_feed import get_live_feed
 import requests
 
 def gtt_modify_form(order):
@@ -39,7 +43,7 @@ def gtt_modify_form(order):
             }
             if remarks:
                 payload["remarks"] = remarks
-            resp = integrate_post("/gttmodify", payload)
+            resp = integrate_post("/gttmodify", payload, priority=HOUSEKEEPING)
             status = resp.get('status') or resp.get('message') or resp
             if resp.get("status") == "ERROR":
                 st.error(f"Modify Failed: {resp.get('message','Error')}")
@@ -97,6 +101,74 @@ def show():
     else:
         st.info("No pending GTT/OCO orders.")
 
+    st.markdown("---")
+    trailing_sync_panel()
+
+def trailing_sync_panel():
+    session = st.session_state.get("integrate_session")
+    if not session:
+        return
+    st.subheader("Sync Trailing Stops (Holdings)")
+    st.caption("Diffs the trailing SL for every NSE holding against the GTT book and only places, modifies or cancels what changed.")
+    headers = get_session_headers()
+    prune = st.checkbox("Cancel SELL stop GTTs for symbols no longer held", False, key="gtt_sync_prune")
+    c1, c2, c3 = st.columns(3)
+    preview = c1.button("Preview Changes")
+    apply = c2.button("Apply Changes")
+    if preview or apply:
+        try:
+            st.session_state["gtt_sync_report"] = gtt_reconcile.reconcile(
+                gtt_reconcile.trailing_stop_desired(headers), headers,
+                prune=prune, dry_run=preview, ratchet=True)
+        except Exception as e:
+            st.error(str(e))
+    actid = session["actid"]
+    nightly = actid in gtt_reconcile.nightly_jobs
+    if c3.button("Disable Nightly Sync" if nightly else "Enable Nightly Sync (15:45 IST)"):
+        if nightly:
+            gtt_reconcile.cancel_nightly_trailing(actid)
+        else:
+            gtt_reconcile.schedule_nightly_trailing(actid, headers)
+        st.rerun()
+    report = st.session_state.get("gtt_sync_report") or gtt_reconcile.last_reports.get(actid)
+    show_sync_report(report)
+    live_trailing_panel(actid)
+
+def show_sync_report(report):
+    if report:
+        if report["error"]:
+            st.error(f"GTT book fetch failed: {report['error']}")
+        elif not report["rows"]:
+            st.success(f"GTT book already in sync ({report['elapsed_ms']} ms).")
+        else:
+            st.write(f"{report['actions']} change(s) — {report['elapsed_ms']} ms")
+            st.dataframe(report["rows"], use_container_width=True)
+
+def live_trailing_panel(actid):
+    st.subheader("Live Trailing Engine")
+    st.caption("Follows every tick from the live feed, ratchets stops up only and pushes changes to the GTT book in batches.")
+    feed = get_live_feed()
+    engine = trailing_engine.get_engine(actid)
+    if engine is None:
+        if feed is None or not feed.is_running():
+            st.info("Start the live feed (Tradebot page) to run the trailing engine.")
+            return
+        if st.button("Start Trailing Engine"):
+            try:
+                trailing_engine.start_engine(feed)
+            except Exception as e:
+                st.error(str(e))
+            st.rerun()
+        return
+    if st.button("Stop Trailing Engine"):
+        trailing_engine.stop_engine(actid)
+        st.rerun()
+    st.write(engine.stats())
+    st.dataframe(engine.rows(), use_container_width=True)
+    if engine.last_report:
+        st.caption("Last push")
+        show_sync_report(engine.last_report)
+
 # Correct the error: Streamlit expects an app() function for page scripts.
 def app():
     show()
@@ -0,0 +1,313 @@
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta
+from utils import api_request, api_get_many
+from bulk_orders import run_batch, summarize
+from order_dispatch import HOUSEKEEPING
+from auto_order import snap_to_tick
+from stop_rules import trailing_stop
+from candle_store import IST
+from scheduler import get_scheduler
+from security_info import get_security_cache
+from records import decode_holdings, holdings_payload
+
+STOP_LIMIT_BUFFER = 0.005  # stop GTTs sell up to 0.5% below the trigger so gaps still fill
+PRICE_TOLERANCE = 0.001  # treat levels within 0.1% as unchanged
+
+# Desired protection per instrument:
+#   {"exchange", "tradingsymbol", "quantity", "stop", "target" (optional), "product_type", "tick_size"}
+# A stop alone maps to a LTP_BELOW SELL GTT, or to the stop leg of a SELL OCO already in the
+# book; stop + target maps to a SELL OCO.
+
+def leg_key(exchange, tradingsymbol):
+    return f"{exchange}|{tradingsymbol}"
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _same(a, b):
+    return abs(_float(a) - _float(b)) <= max(abs(_float(b)) * PRICE_TOLERANCE, 0.01)
+
+def existing_protection(gttlist):
+    # {key: [gtt, ...]} for SELL stop GTTs and SELL OCOs (LTP_ABOVE alerts are left alone)
+    existing = {}
+    for g in gttlist:
+        if g.get("order_type") != "SELL" or g.get("condition") not in ("LTP_BELOW", "LMT_OCO"):
+            continue
+        existing.setdefault(leg_key(g.get("exchange", ""), g.get("tradingsymbol", "")), []).append(g)
+    return existing
+
+def _gtt_payload(want):
+    tick = want.get("tick_size") or 0.05
+    stop = snap_to_tick(want["stop"], tick)
+    return {
+        "exchange": want["exchange"],
+        "tradingsymbol": want["tradingsymbol"],
+        "condition": "LTP_BELOW",
+        "alert_price": str(stop),
+        "order_type": "SELL",
+        "price": str(snap_to_tick(stop * (1 - STOP_LIMIT_BUFFER), tick)),
+        "quantity": str(int(want["quantity"])),
+        "product_type": want.get("product_type", "CNC"),
+        "remarks": "Trailing SL",
+    }
+
+def _oco_payload(want):
+    tick = want.get("tick_size") or 0.05
+    qty = int(want["quantity"])
+    return {
+        "exchange": want["exchange"],
+        "tradingsymbol": want["tradingsymbol"],
+        "order_type": "SELL",
+        "product_type": want.get("product_type", "CNC"),
+        "target_price": str(snap_to_tick(want["target"], tick)),
+        "stoploss_price": str(snap_to_tick(want["stop"], tick)),
+        "target_quantity": qty // 2,
+        "stoploss_quantity": qty - qty // 2,
+        "remarks": "Trailing SL",
+    }
+
+def _matches(gtt, want, ratchet=False):
+    if want.get("target"):
+        payload = _oco_payload(want)
+        return (
+            gtt.get("condition") == "LMT_OCO"
+            and _same(gtt.get("stoploss_price", gtt.get("alert_price")), payload["stoploss_price"])
+            and _same(gtt.get("target_price", gtt.get("price")), payload["target_price"])
+        )
+    payload = _gtt_payload(want)
+    same_price = _same(gtt.get("alert_price"), payload["alert_price"])
+    if ratchet:
+        # Trailing stops only move up: a higher existing stop is kept
+        same_price = same_price or _float(gtt.get("alert_price")) > _float(payload["alert_price"])
+    return (
+        gtt.get("condition") == "LTP_BELOW"
+        and same_price
+        and int(_float(gtt.get("quantity"))) == int(want["quantity"])
+    )
+
+def _oco_stop(gtt):
+    return _float(gtt.get("stoploss_price", gtt.get("alert_price")))
+
+def _oco_stop_matches(gtt, want, ratchet=False):
+    # A SELL OCO (e.g. from auto_order) already protects the holding; only its stop leg is compared
+    stop = snap_to_tick(want["stop"], want.get("tick_size") or 0.05)
+    return _same(_oco_stop(gtt), stop) or (ratchet and _oco_stop(gtt) > stop)
+
+def _oco_stop_payload(gtt, want):
+    # Move only the stop leg; target price and leg quantities stay as the OCO's owner set them
+    tick = want.get("tick_size") or 0.05
+    qty = int(_float(gtt.get("quantity"))) or int(want["quantity"])
+    return {
+        "alert_id": gtt.get("alert_id"),
+        "exchange": want["exchange"],
+        "tradingsymbol": want["tradingsymbol"],
+        "order_type": "SELL",
+        "product_type": gtt.get("product_type") or want.get("product_type", "CNC"),
+        "target_price": str(gtt.get("target_price", gtt.get("price"))),
+        "stoploss_price": str(snap_to_tick(want["stop"], tick)),
+        "target_quantity": int(_float(gtt.get("target_quantity"))) or qty // 2,
+        "stoploss_quantity": int(_float(gtt.get("stoploss_quantity"))) or qty - qty // 2,
+        "remarks": gtt.get("remarks") or "Trailing SL",
+    }
+
+def book_stops(gttlist):
+    # {key: highest SELL stop trigger in the book}, counting the stop leg of an OCO
+    stops = {}
+    for key, gtts in existing_protection(gttlist).items():
+        stops[key] = max(_oco_stop(g) if g.get("condition") == "LMT_OCO" else _float(g.get("alert_price"))
+                         for g in gtts)
+    return stops
+
+def needs_push(stop, book_stop, tick_size=0.05):
+    # True when the book has no stop for the holding, or one below the desired (tick-snapped) stop
+    if book_stop is None:
+        return True
+    stop = snap_to_tick(stop, tick_size or 0.05)
+    return stop > book_stop and not _same(book_stop, stop)
+
+def _cancel_call(gtt):
+    aid = gtt.get("alert_id")
+    path = f"/ococancel/{aid}" if gtt.get("condition") == "LMT_OCO" else f"/gttcancel/{aid}"
+    return ("GET", path, None)
+
+def plan(desired, gttlist, prune=False, ratchet=False):
+    # Minimal list of actions: [{"key", "action", "method", "path", "payload", "detail"}].
+    # Entries with stop=None are left exactly as they are (e.g. no price available).
+    existing = existing_protection(gttlist)
+    actions = []
+
+    def add(key, action, call, detail=""):
+        method, path, payload = call
+        actions.append({"key": key, "action": action, "method": method, "path": path,
+                        "payload": payload, "detail": detail})
+
+    for want in desired:
+        key = leg_key(want["exchange"], want["tradingsymbol"])
+        have = existing.pop(key, [])
+        if want.get("stop") is None:
+            continue
+        is_oco = bool(want.get("target"))
+        oco = next((g for g in have if g.get("condition") == "LMT_OCO"), None)
+        if not is_oco and oco is not None:
+            # Stop-only protection over an existing OCO: keep the OCO (and its target), trail its stop
+            if not _oco_stop_matches(oco, want, ratchet):
+                payload = _oco_stop_payload(oco, want)
+                if _float(payload["stoploss_price"]) < _float(payload["target_price"]):
+                    add(key, "modify", ("POST", "/ocomodify", payload),
+                        f"OCO SL {_oco_stop(oco)} -> {payload['stoploss_price']} (TGT {payload['target_price']} kept)")
+            for g in have:
+                if g is not oco:
+                    add(key, "cancel", _cancel_call(g), f"extra {g.get('condition')} {g.get('alert_id')}")
+            continue
+        keep = next((g for g in have if _matches(g, want, ratchet)), None)
+        if keep is not None:
+            for g in have:
+                if g is not keep:
+                    add(key, "cancel", _cancel_call(g), f"duplicate {g.get('alert_id')}")
+            continue
+        same_kind = [g for g in have if (g.get("condition") == "LMT_OCO") == is_oco]
+        if same_kind:
+            target = same_kind[0]
+            if is_oco:
+                payload = dict(_oco_payload(want), alert_id=target.get("alert_id"))
+                add(key, "modify", ("POST", "/ocomodify", payload), f"SL {payload['stoploss_price']} / TGT {payload['target_price']}")
+            else:
+                payload = dict(_gtt_payload(want), alert_id=target.get("alert_id"))
+                add(key, "modify", ("POST", "/gttmodify", payload), f"SL {target.get('alert_price')} -> {payload['alert_price']}")
+            for g in have:
+                if g is not target:
+                    add(key, "cancel", _cancel_call(g), f"extra {g.get('alert_id')}")
+        else:
+            for g in have:
+                add(key, "cancel", _cancel_call(g), f"replace {g.get('condition')} {g.get('alert_id')}")
+            if is_oco:
+                payload = _oco_payload(want)
+                add(key, "place", ("POST", "/ocoplaceorder", payload), f"SL {payload['stoploss_price']} / TGT {payload['target_price']}")
+            else:
+                payload = _gtt_payload(want)
+                add(key, "place", ("POST", "/gttplaceorder", payload), f"SL {payload['alert_price']}")
+    if prune:
+        for key, have in existing.items():
+            for g in have:
+                add(key, "cancel", _cancel_call(g), "no longer wanted")
+    return actions
+
+def execute(actions, headers):
+    calls = [(i, a["method"], a["path"], a["payload"]) for i, a in enumerate(actions)]
+    results = run_batch(calls, headers, priority=HOUSEKEEPING)
+    rows = []
+    for action, result in zip(actions, results):
+        rows.append({"key": action["key"], "action": action["action"], "detail": action["detail"],
+                     "status": result["status"], "message": result.get("message", ""),
+                     "latency_ms": result.get("latency_ms")})
+    return rows, summarize(results) if results else None
+
+def reconcile(desired, headers, prune=False, dry_run=False, ratchet=False):
+    # Fetch the GTT book once, diff, and apply only the deltas concurrently
+    t0 = time.monotonic()
+    book = api_request("GET", "/gttorders", headers)
+    if book.get("status") == "ERROR":
+        return {"error": book.get("message"), "rows": [], "actions": 0, "summary": None, "elapsed_ms": 0}
+    actions = plan(desired, book.get("pendingGTTOrderBook") or [], prune=prune, ratchet=ratchet)
+    if dry_run:
+        rows = [{"key": a["key"], "action": a["action"], "detail": a["detail"], "status": "DRY_RUN"} for a in actions]
+        summary = None
+    else:
+        rows, summary = execute(actions, headers)
+    return {"error": None, "rows": rows, "actions": len(actions), "summary": summary,
+            "elapsed_ms": round((time.monotonic() - t0) * 1000, 1)}
+
+def nse_holdings(headers):
+    # Decoded NSE holdings with a sellable quantity and an entry price
+    resp = api_request("GET", "/holdings", headers)
+    if resp.get("status") == "ERROR":
+        # Never reconcile against an empty list: with prune it would cancel every stop
+        raise RuntimeError(f"Holdings fetch failed: {resp.get('message')}")
+    return [h for h in decode_holdings(holdings_payload(resp))
+            if h.exchange == "NSE" and h.sellable_qty > 0 and h.avg_price > 0]
+
+def trailing_stop_desired(headers):
+    # Desired stop per NSE holding from the trailing SL rules in stop_rules
+    holdings = nse_holdings(headers)
+    quotes = api_get_many([f"/quotes/{h.exchange}/{h.token}" for h in holdings], headers)
+    cache = get_security_cache()
+    desired = []
+    for h in holdings:
+        ltp = _float(quotes.get(f"/quotes/{h.exchange}/{h.token}", {}).get("ltp"))
+        # Without a price the rule would fall back to the initial SL, so leave the GTT alone
+        stop = trailing_stop(h.avg_price, ltp)[0] if ltp > 0 else None
+        desired.append({
+            "exchange": h.exchange, "tradingsymbol": h.tradingsymbol, "quantity": h.sellable_qty,
+            "stop": stop, "product_type": "CNC",
+            "tick_size": cache.tick_size(h.exchange, h.token, h.tick_size),
+        })
+    return desired
+
+def seconds_until(hhmm):
+    # Seconds until the next HH:MM in IST
+    now = datetime.now(IST)
+    hour, minute = (int(x) for x in hhmm.split(":"))
+    run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if run <= now:
+        run += timedelta(days=1)
+    return (run - now).total_seconds()
+
+def schedule_reconcile(desired_fn, headers, interval=86400, initial_delay=None, prune=False, ratchet=False, on_done=None):
+    # Periodic reconcile on the shared scheduler; the work runs on its own thread
+    # because scheduler jobs must not block
+    def run():
+        try:
+            report = reconcile(desired_fn(headers), headers, prune=prune, ratchet=ratchet)
+        except Exception as e:
+            report = {"error": str(e), "rows": [], "actions": 0, "summary": None, "elapsed_ms": 0}
+        if on_done:
+            on_done(report)
+
+    return get_scheduler().call_every(
+        interval, lambda: threading.Thread(target=run, name="gtt_reconcile", daemon=True).start(),
+        name="gtt_reconcile", initial_delay=initial_delay
+    )
+
+# Nightly trailing-stop jobs per account, kept process-wide so reruns don't duplicate them
+nightly_jobs = {}
+last_reports = {}
+
+def schedule_nightly_trailing(actid, headers, at="15:45"):
+    old = nightly_jobs.pop(actid, None)
+    if old:
+        old.cancel()
+    nightly_jobs[actid] = schedule_reconcile(
+        trailing_stop_desired, headers, interval=86400, initial_delay=seconds_until(at), ratchet=True,
+        on_done=lambda report: last_reports.__setitem__(actid, report)
+    )
+    return nightly_jobs[actid]
+
+def cancel_nightly_trailing(actid):
+    job = nightly_jobs.pop(actid, None)
+    if job:
+        job.cancel()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync trailing stop GTTs for holdings with the GTT book")
+    parser.add_argument("--dry-run", action="store_true", help="print the plan without sending it")
+    parser.add_argument("--prune", action="store_true", help="cancel SELL stop GTTs for symbols no longer held")
+    args = parser.parse_args()
+
+    from session_utils import load_session_from_file
+    from utils import session_headers
+
+    session = load_session_from_file()
+    if not session:
+        raise SystemExit("No saved session (session.json). Log in through the dashboard first.")
+    headers = session_headers(session)
+    report = reconcile(trailing_stop_desired(headers), headers, prune=args.prune, dry_run=args.dry_run, ratchet=True)
+    if report["error"]:
+        raise SystemExit(f"GTT book fetch failed: {report['error']}")
+    for row in report["rows"]:
+        print(f"{row['action']:<7} {row['key']:<28} {row['status']:<8} {row['detail']} {row.get('message', '')}")
+    print(f"{report['actions']} action(s) in {report['elapsed_ms']} ms")
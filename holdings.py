@@ -5,7 +5,10 @@ import requests
 from datetime import datetime, timedelta
 import io
 import numpy as np
-from utils import integrate_get
+from utils import get_session_headers
+from live_feed import get_live_feed
+from portfolio_engine import get_portfolio
+from universe_precompute import prev_close as table_prev_close
 
 # ==== CONFIG ====
 TOTAL_CAPITAL = 1400000
@@ -20,19 +23,11 @@ def safe_float(val, default=0.0):
     except Exception:
         return default
 
-def get_ltp(exchange, token, api_key):
-    url = f"https://integrate.definedgesecurities.com/dart/v1/quotes/{exchange}/{token}"
-    headers = {"Authorization": api_key}
-    try:
-        resp = requests.get(url, headers=headers, timeout=5)
-        if resp.status_code == 200:
-            data = resp.json()
-            return safe_float(data.get("ltp", 0))
-    except Exception:
-        pass
-    return 0.0
-
 def get_prev_close(exchange, token, api_key):
+    # Post-close feature table first; the history API only for instruments it doesn't cover
+    cached = table_prev_close(exchange, token)
+    if cached:
+        return cached
     # Handles weekends/holidays automatically
     today = datetime.now()
     max_lookback = 7
@@ -60,31 +55,6 @@ def get_prev_close(exchange, token, api_key):
         pass
     return 0.0
 
-def get_positions(api_key):
-    url = "https://integrate.definedgesecurities.com/dart/v1/positions"
-    headers = {"Authorization": api_key}
-    try:
-        resp = requests.get(url, headers=headers, timeout=7)
-        if resp.status_code == 200:
-            return resp.json().get("positions", [])
-    except Exception:
-        pass
-    return []
-
-def resolve_symbol_info(h):
-    # Always prefer NSE if available
-    tslist = h.get("tradingsymbol")
-    if isinstance(tslist, list):
-        for s in tslist:
-            if isinstance(s, dict) and s.get("exchange", "").upper() == "NSE":
-                return s
-        # fallback to first available
-        if tslist and isinstance(tslist[0], dict):
-            return tslist[0]
-    elif isinstance(tslist, dict):
-        return tslist
-    return {}
-
 def highlight_pnl(val):
     try:
         v = float(val)
@@ -93,81 +63,44 @@ def highlight_pnl(val):
     except: pass
     return ''
 
+def summary(engine, cash_in_hand, live):
+    # Totals are kept up to date per tick by the portfolio engine; with the live feed
+    # running this block alone reruns every second
+    @st.fragment(run_every=1 if live else None)
+    def render():
+        totals = engine.totals
+        c1, c2, c3, c4, c5, c6 = st.columns(6)
+        c1.metric("Total Capital", f"₹{TOTAL_CAPITAL:,.0f}")
+        c2.metric("Invested", f"₹{totals['invested']:,.0f}")
+        c3.metric("Current Value", f"₹{totals['current']:,.0f}")
+        c4.metric("Cash in Hand", f"₹{cash_in_hand:,.0f}")
+        c5.metric("Today P&L", f"₹{totals['today_pnl']:,.0f}")
+        c6.metric("Overall P&L", f"₹{totals['pnl']:,.0f}")
+        if engine.positions.keys:
+            st.caption(f"Day positions: realized ₹{totals['realized']:,.0f} | "
+                       f"open (non-holding) P&L ₹{totals['position_pnl']:,.0f}")
+        if live:
+            st.caption(f"Live: {engine.ticks} price updates applied")
+    render()
+
 def app():
     st.title("Holdings Details Dashboard")
     st.caption("Detailed, real-time portfolio analytics and allocation")
 
     api_key = get_api_key()
-    master_df = None  # If you want to use for token lookup etc
-
-    # Fetch all data
-    holdings_data = integrate_get("/holdings")
-    holdings = holdings_data.get("data", [])
-
-    positions = get_positions(api_key)
-    # Map (exchange, token/isin) to realized/unrealized P&L, net qty, etc.
-    pos_map = {}
-    for p in positions:
-        ex = p.get("exchange", "").upper()
-        token = str(p.get("token", ""))
-        isin = p.get("isin", "")
-        k = (ex, token)
-        pos_map[k] = p
-
-    rows = []
-    total_invested = 0
-    total_current = 0
-    total_today_pnl = 0
-    total_overall_pnl = 0
-    total_realized_pnl = 0
-
-    for h in holdings:
-        s = resolve_symbol_info(h)
-        symbol = s.get("tradingsymbol", "N/A")
-        exchange = s.get("exchange", "NSE")
-        token = str(s.get("token", ""))
-        isin = s.get("isin", "")
-        qty = safe_float(h.get("dp_qty", 0)) + safe_float(h.get("t1_qty", 0))
-        avg_buy = safe_float(h.get("avg_buy_price", 0))
-        invested = qty * avg_buy
-
-        ltp = get_ltp(exchange, token, api_key)
-        prev_close = get_prev_close(exchange, token, api_key)
-        current_value = qty * ltp
-        today_chg_pct = ((ltp - prev_close) / prev_close * 100) if prev_close else 0
-        today_pnl = (ltp - prev_close) * qty if prev_close else 0
-        overall_pnl = (ltp - avg_buy) * qty if avg_buy else 0
-
-        # Realized P&L logic (partial sell case) - using positions API
-        # Try by token+exchange, fallback to 0 if not found
-        realized_pnl = 0.0
-        pos = pos_map.get((exchange.upper(), token))
-        if pos:
-            realized_pnl = safe_float(pos.get("realized_pnl", 0))
-        total_qty = qty
-        total_invested += invested
-        total_current += current_value
-        total_today_pnl += today_pnl
-        total_overall_pnl += overall_pnl
-        total_realized_pnl += realized_pnl
-
-        rows.append({
-            "Symbol": symbol,
-            "Exchange": exchange,
-            "ISIN": isin,
-            "Avg Buy": avg_buy,
-            "Total Qty": total_qty,
-            "LTP": ltp,
-            "Prev Close": prev_close,
-            "Invested": invested,
-            "Current Value": current_value,
-            "Today % Chg": today_chg_pct,
-            "Today P&L": today_pnl,
-            "Overall P&L": overall_pnl,
-            "Realized P&L": realized_pnl,
-        })
-
-    df = pd.DataFrame(rows)
+    session = st.session_state.get("integrate_session") or {}
+    feed = get_live_feed()
+    refresh = st.button("Refresh Holdings")
+    engine = get_portfolio(session.get("actid"), get_session_headers(),
+                           prev_close_fn=lambda e, t: get_prev_close(e, t, api_key), feed=feed, force=refresh)
+    if not engine.keys:
+        st.warning("No holdings found.")
+        return
+    live = feed is not None and feed.is_running()
+    totals = engine.totals
+    total_invested = totals["invested"]
+
+    df = engine.frame().rename(columns={"Entry": "Avg Buy", "Qty": "Total Qty", "P&L": "Overall P&L"})
     df = df.sort_values("Invested", ascending=False)
     # Portfolio percent allocation
     df["Portfolio %"] = (df["Invested"] / TOTAL_CAPITAL * 100).round(2)
@@ -182,13 +115,7 @@ def app():
 
     # ==== SUMMARY ====
     st.subheader("Summary")
-    c1, c2, c3, c4, c5, c6 = st.columns(6)
-    c1.metric("Total Capital", f"₹{TOTAL_CAPITAL:,.0f}")
-    c2.metric("Invested", f"₹{total_invested:,.0f}")
-    c3.metric("Current Value", f"₹{total_current:,.0f}")
-    c4.metric("Cash in Hand", f"₹{cash_in_hand:,.0f}")
-    c5.metric("Today P&L", f"₹{total_today_pnl:,.0f}")
-    c6.metric("Overall P&L", f"₹{total_overall_pnl:,.0f}")
+    summary(engine, cash_in_hand, live)
 
     # ==== PIE CHART ====
     st.subheader("Portfolio Allocation")
@@ -7,7 +7,12 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
 import io
-from utils import integrate_get
+from utils import get_session_headers
+from live_feed import get_live_feed
+from portfolio_engine import get_portfolio
+from trailing_engine import get_engine
+from risk_analytics import portfolio_risk
+from universe_precompute import lookup as feature_row, prev_close as table_prev_close
 
 def is_number(val):
     try:
@@ -48,24 +53,10 @@ def get_token(symbol, segment, master_df):
             return row3.iloc[0]['token']
     return None
 
-def get_ltp(exchange, token, api_session_key):
-    if not exchange or not token:
-        return None
-    url = f"https://integrate.definedgesecurities.com/dart/v1/quotes/{exchange}/{token}"
-    headers = {"Authorization": api_session_key}
-    try:
-        resp = requests.get(url, headers=headers, timeout=5)
-        if resp.status_code == 200:
-            ltp = resp.json().get("ltp", None)
-            try:
-                return float(ltp) if ltp is not None else None
-            except Exception:
-                return None
-    except Exception:
-        pass
-    return None
-
 def get_prev_close(exchange, token, api_session_key):
+    cached = table_prev_close(exchange, token)
+    if cached:
+        return cached
     today = datetime.now()
     for i in range(1, 5):
         prev_day = today - timedelta(days=i)
@@ -226,12 +217,6 @@ def minervini_sell_signals(df, lookback_days=15):
         signals['warnings'].append("⚠️ Heavy volume down day - Consider exiting position")
     return signals
 
-def open_risk_status(open_risk):
-    if open_risk <= 0:
-        return "Risk Free (Profit Locked)"
-    else:
-        return "At Risk"
-
 def minervini_high_vs_ema20_interpretation(high, ema20):
     if not is_number(ema20) or ema20 == 0 or pd.isnull(high) or pd.isnull(ema20):
         return "", ""
@@ -247,110 +232,83 @@ def minervini_high_vs_ema20_interpretation(high, ema20):
         interp = "✅ Healthy: High is within reasonable range of 20 EMA"
     return diff_pct_rounded, interp
 
+def show_holding_technicals(portfolio):
+    # Instant lookups on the post-close feature table (universe_precompute)
+    rows = []
+    for (exchange, token), symbol, mark in zip(portfolio.keys, portfolio.symbol, portfolio.mark):
+        f = feature_row(exchange, token)
+        if f is None:
+            continue
+        price = mark if mark > 0 else f["LTP"]
+        rows.append({
+            "Symbol": symbol, "Price": price, "RSI D": f["RSI14"], "RSI W": f["RSI14_W"], "RSI M": f["RSI14_M"],
+            "vs 20EMA %": (price / f["EMA20"] - 1) * 100, "vs 50EMA %": (price / f["EMA50"] - 1) * 100,
+            "vs 200EMA %": (price / f["EMA200"] - 1) * 100, "From 52W High %": (price / f["High52W"] - 1) * 100,
+            "RS 3M": f["RS_3M"], "RS 6M": f["RS_6M"], "Updays": f["Updays"], "Downdays": f["Downdays"],
+            "Avg Vol 20": f["AvgVol20"],
+        })
+    st.subheader("Holding Technicals (precomputed after close)")
+    if not rows:
+        st.info("No feature table yet — it is built after market close (or run `python universe_precompute.py`).")
+        return
+    st.dataframe(pd.DataFrame(rows).round(2), use_container_width=True)
+
+def show_portfolio_risk(portfolio, api_key):
+    st.subheader("Portfolio Risk (Beta, Correlation, VaR vs Nifty 500)")
+    c1, c2 = st.columns(2)
+    confidence = c1.radio("VaR confidence", [95, 99], horizontal=True, format_func=lambda c: f"{c}%")
+    values = np.where(portfolio.current > 0, portfolio.current, portfolio.invested)
+    try:
+        with st.spinner("Loading daily candles..."):
+            risk = portfolio_risk(portfolio.keys, list(portfolio.symbol), values, api_key, confidence)
+    except Exception as e:
+        st.warning(f"Risk analytics unavailable: {e}")
+        return
+    if risk["table"].empty:
+        st.info("Not enough stored daily history for any holding yet.")
+        return
+    c2.caption(f"{risk['days']} sessions {risk['start']:%d %b %Y} → {risk['end']:%d %b %Y}, "
+               f"computed in {risk['elapsed_ms']:.1f} ms")
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Portfolio Beta", f"{risk['portfolio_beta']:.2f}")
+    m2.metric("Annual Volatility", f"{risk['portfolio_vol'] * 100:.1f}%")
+    m3.metric(f"1-day VaR {confidence}% (Historical)", f"₹{risk['hist_var']:,.0f}")
+    m4.metric(f"1-day VaR {confidence}% (Parametric)", f"₹{risk['param_var']:,.0f}")
+    if risk["missing"]:
+        st.caption("Left out (short history): " + ", ".join(risk["missing"]))
+    st.dataframe(risk["table"].sort_values("Risk Share %", ascending=False), use_container_width=True)
+    fig = px.imshow(risk["corr"], color_continuous_scale="RdBu_r", zmin=-1, zmax=1,
+                    title="Correlation of Daily Returns")
+    fig.update_layout(height=max(400, 18 * len(risk["corr"])))
+    st.plotly_chart(fig, use_container_width=True)
+
 def app():
     st.title("Holdings Details Dashboard")
 
     api_session_key = st.secrets.get("integrate_api_session_key", "")
     master_df = load_master()
-    data = integrate_get("/holdings")
-    holdings = data.get("data", [])
-    if not holdings:
+    session = st.session_state.get("integrate_session") or {}
+    feed = get_live_feed()
+    portfolio = get_portfolio(session.get("actid"), get_session_headers(),
+                              prev_close_fn=lambda e, t: get_prev_close(e, t, api_session_key), feed=feed)
+    if not portfolio.keys:
         st.warning("No holdings found.")
         return
 
-    rows = []
-    for h in holdings:
-        ts = h.get("tradingsymbol")
-        if isinstance(ts, list):
-            if ts:
-                if isinstance(ts[0], dict):
-                    tsym = ts[0].get("tradingsymbol", "N/A")
-                    exch = ts[0].get("exchange", h.get("exchange", "NSE"))
-                    segment = ts[0].get("segment", exch)
-                else:
-                    tsym = str(ts[0])
-                    exch = h.get("exchange", "NSE")
-                    segment = exch
-            else:
-                tsym = "N/A"
-                exch = h.get("exchange", "NSE")
-                segment = exch
-        elif isinstance(ts, dict):
-            tsym = ts.get("tradingsymbol", "N/A")
-            exch = ts.get("exchange", h.get("exchange", "NSE"))
-            segment = ts.get("segment", exch)
-        else:
-            tsym = str(ts) if ts is not None else "N/A"
-            exch = h.get("exchange", "NSE")
-            segment = exch
-
-        isin = h.get("isin", "")
-        product = h.get("product", "")
-        try:
-            qty = float(h.get("dp_qty", 0) or 0)
-        except Exception:
-            qty = 0.0
-        try:
-            entry = float(h.get("avg_buy_price", 0) or 0)
-        except Exception:
-            entry = 0.0
-        invested = entry * qty
-
-        token = get_token(tsym, segment, master_df)
-        ltp = get_ltp(exch, token, api_session_key) if token else None
-        if not (is_number(ltp) and ltp > 0):
-            ltp = get_prev_close(exch, token, api_session_key) if token else None
-
-        if is_number(ltp) and ltp > 0:
-            current_value = ltp * qty
-            pnl = current_value - invested
-        else:
-            current_value = ""
-            pnl = ""
-
-        initial_sl = round(entry * 0.98, 2)
-        status = "Initial SL"
-        trailing_sl = initial_sl
-        if is_number(ltp) and ltp > 0 and is_number(entry) and entry > 0:
-            change_pct = 100 * (ltp - entry) / entry if entry else 0
-            if change_pct >= 30:
-                trailing_sl = round(entry * 1.20, 2)
-                status = "Excellent Profit (SL at Entry +20%)"
-            elif change_pct >= 20:
-                trailing_sl = round(entry * 1.10, 2)
-                status = "Good Profit (SL at Entry +10%)"
-            elif change_pct >= 10:
-                trailing_sl = round(entry, 2)
-                status = "Safe (Breakeven SL)"
-        else:
-            change_pct = ""
-
-        open_risk = (trailing_sl - entry) * qty
-        open_risk_label = open_risk_status(open_risk)
-
-        rows.append({
-            "Symbol": tsym,
-            "Exchange": exch,
-            "ISIN": isin,
-            "Product": product,
-            "Qty": qty,
-            "Entry": entry,
-            "Invested": invested,
-            "Current Price": ltp if is_number(ltp) and ltp > 0 else "",
-            "Current Value": current_value,
-            "P&L": pnl,
-            "Change %": round(change_pct, 2) if change_pct != "" else "",
-            "Status": status,
-            "Stop Loss": trailing_sl,
-            "Open Risk": open_risk,
-            "Open Risk Status": open_risk_label,
-            "DP Free Qty": h.get("dp_free_qty", ""),
-            "Pledge Qty": h.get("pledge_qty", ""),
-            "Collateral Qty": h.get("collateral_qty", ""),
-            "T1 Qty": h.get("t1_qty", ""),
-        })
-
-    df = pd.DataFrame(rows)
+    df = portfolio.frame()
+    df["Current Price"] = np.where(portfolio.mark > 0, portfolio.mark, np.nan)
+    engine = get_engine(session.get("actid"))
+    if engine:
+        # The trailing engine's stop is ratcheted from every tick, not just the current price
+        for i, key in enumerate(portfolio.keys):
+            live = engine.states.get(key)
+            if live is not None and live.stop > df.at[i, "Stop Loss"]:
+                df.at[i, "Stop Loss"], df.at[i, "Status"] = live.stop, live.status
+        df["Open Risk"] = (df["Stop Loss"] - df["Entry"]) * df["Qty"]
+    df["Open Risk Status"] = np.where(df["Open Risk"] <= 0, "Risk Free (Profit Locked)", "At Risk")
+    df = df[["Symbol", "Exchange", "ISIN", "Product", "Qty", "Entry", "Invested", "Current Price",
+             "Current Value", "P&L", "Change %", "Status", "Stop Loss", "Open Risk", "Open Risk Status",
+             "DP Free Qty", "Pledge Qty", "Collateral Qty", "T1 Qty"]]
     if df.empty:
         st.warning("No active holdings with quantity > 0.")
         return
@@ -405,6 +363,9 @@ def app():
     fig_risk.update_layout(xaxis_title="Stock", yaxis_title="Current Value (₹)")
     st.plotly_chart(fig_risk, use_container_width=True)
 
+    show_portfolio_risk(portfolio, api_session_key)
+    show_holding_technicals(portfolio)
+
     show_table = st.toggle("Show Holdings Table", value=False)
     if show_table:
         st.subheader("Holdings Details Table (with Trailing SL & Open Risk)")
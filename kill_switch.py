@@ -0,0 +1,175 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils import api_request
+from bulk_orders import run_batch, summarize
+from order_dispatch import EXIT
+from records import decode_holdings, decode_positions, holdings_payload, positions_payload
+
+OPEN_STATUSES = {"OPEN", "PARTIALLY_FILLED", "TRIGGER_PENDING"}
+KILL_DEADLINE = 20.0  # seconds for all cancel/exit legs
+
+SNAPSHOT_PATHS = {
+    "orders": "/orders",
+    "positions": "/positions",
+    "holdings": "/holdings",
+    "gtt": "/gttorders",
+}
+
+def _norm_status(s):
+    return str(s).replace(" ", "_").upper()
+
+def take_snapshot(headers):
+    # Orders, positions, holdings and GTTs fetched in parallel (one round-trip)
+    with ThreadPoolExecutor(max_workers=len(SNAPSHOT_PATHS)) as pool:
+        futures = {name: pool.submit(api_request, "GET", path, headers) for name, path in SNAPSHOT_PATHS.items()}
+        raw = {name: f.result() for name, f in futures.items()}
+    return {
+        "orders": raw["orders"].get("orders") or [],
+        "positions": decode_positions(positions_payload(raw["positions"])),
+        "holdings": decode_holdings(holdings_payload(raw["holdings"])),
+        "gtt": raw["gtt"].get("pendingGTTOrderBook") or [],
+        "errors": {name: r.get("message") for name, r in raw.items() if r.get("status") == "ERROR"},
+    }
+
+def _exit_order(exchange, tradingsymbol, side, qty, product_type):
+    return {
+        "exchange": exchange,
+        "tradingsymbol": tradingsymbol,
+        "order_type": side,
+        "quantity": str(qty),
+        "price": "0",
+        "price_type": "MARKET",
+        "product_type": product_type,
+        "validity": "DAY",
+        "remarks": "kill switch",
+    }
+
+def plan_cancels(snapshot):
+    # [(leg_id, method, path, payload, leg)] for every open order, GTT and OCO
+    legs = []
+    for o in snapshot["orders"]:
+        if _norm_status(o.get("order_status", "")) in OPEN_STATUSES:
+            oid = o.get("order_id")
+            legs.append((f"order:{oid}", "GET", f"/cancel/{oid}", None, "cancel order"))
+    for g in snapshot["gtt"]:
+        aid = g.get("alert_id")
+        if g.get("condition") == "LMT_OCO":
+            legs.append((f"oco:{aid}", "GET", f"/ococancel/{aid}", None, "cancel OCO"))
+        else:
+            legs.append((f"gtt:{aid}", "GET", f"/gttcancel/{aid}", None, "cancel GTT"))
+    return legs
+
+def _sold_today(positions, holdings):
+    # Holdings sold during the day show up as negative CNC positions: {holding index: qty sold}
+    by_listing, by_isin = {}, {}
+    for i, h in enumerate(holdings):
+        for s in h.listings:
+            by_listing[(s.exchange, s.tradingsymbol)] = i
+        if h.isin:
+            by_isin[h.isin] = i
+    sold = {}
+    for p in positions:
+        if p.product_type != "CNC" or p.net_qty >= 0:
+            continue
+        i = by_listing.get((p.exchange, p.tradingsymbol), by_isin.get(p.isin) if p.isin else None)
+        if i is not None:
+            sold[i] = sold.get(i, 0) - p.net_qty
+    return sold
+
+def plan_exits(snapshot, include_holdings=True):
+    # [(leg_id, method, path, payload, leg)] market exits for positions and holdings
+    legs = []
+    for p in snapshot["positions"]:
+        # A short CNC position is a holding already sold today, not something to buy back
+        if p.net_qty == 0 or (p.product_type == "CNC" and p.net_qty < 0):
+            continue
+        side = "SELL" if p.net_qty > 0 else "BUY"
+        payload = _exit_order(p.exchange, p.tradingsymbol, side, abs(p.net_qty), p.product_type)
+        legs.append((f"position:{p.tradingsymbol}", "POST", "/placeorder", payload, "exit position"))
+    if include_holdings:
+        sold = _sold_today(snapshot["positions"], snapshot["holdings"])
+        for i, h in enumerate(snapshot["holdings"]):
+            qty = h.sellable_qty - sold.get(i, 0)
+            if qty <= 0 or not h.listings:
+                continue
+            payload = _exit_order(h.exchange, h.tradingsymbol, "SELL", qty, "CNC")
+            legs.append((f"holding:{h.tradingsymbol}", "POST", "/placeorder", payload, "exit holding"))
+    return legs
+
+def plan_legs(snapshot, include_holdings=True):
+    # Returns [(leg_id, method, path, payload, leg)] — cancels first, then exits
+    return plan_cancels(snapshot) + plan_exits(snapshot, include_holdings)
+
+def flatten(headers, include_holdings=True, dry_run=False, deadline=KILL_DEADLINE):
+    # One snapshot, then two concurrent batches: every cancel, and only once those are answered
+    # every market exit. An exit sent while a sell order or GTT still blocks the quantity is
+    # rejected by the broker, so the exits are planned from a fresh book after the cancels.
+    t0 = time.monotonic()
+    snapshot = take_snapshot(headers)
+    t_snap = time.monotonic()
+    cancels = plan_cancels(snapshot)
+    if dry_run:
+        legs = cancels + plan_exits(snapshot, include_holdings)
+        results = [{"id": leg[0], "status": "DRY_RUN", "message": "", "latency_ms": None} for leg in legs]
+        t_cancel = t_snap
+    else:
+        results = run_batch([leg[:4] for leg in cancels], headers, deadline=deadline, priority=EXIT)
+        t_cancel = time.monotonic()
+        if cancels:
+            # Cancelled orders may have part-filled; exit what is held now
+            fresh = take_snapshot(headers)
+            for name in ("positions", "holdings"):
+                if name not in fresh["errors"]:
+                    snapshot[name] = fresh[name]
+        exits = plan_exits(snapshot, include_holdings)
+        remaining = max(deadline - (time.monotonic() - t_snap), 5.0)
+        results += run_batch([leg[:4] for leg in exits], headers, deadline=remaining, priority=EXIT)
+        legs = cancels + exits
+    t_end = time.monotonic()
+    kinds = {leg[0]: leg[4] for leg in legs}
+    rows = [
+        {"leg": kinds[r["id"]], "id": r["id"], "status": r["status"],
+         "message": r.get("message", ""), "latency_ms": r.get("latency_ms")}
+        for r in results
+    ]
+    return {
+        "snapshot_ms": round((t_snap - t0) * 1000, 1),
+        "cancel_ms": round((t_cancel - t_snap) * 1000, 1),
+        "legs_ms": round((t_end - t_snap) * 1000, 1),
+        "total_ms": round((t_end - t0) * 1000, 1),
+        "snapshot_errors": snapshot["errors"],
+        "cancel_failures": [r["id"] for r in results[:len(cancels)] if r["status"] != "OK"] if not dry_run else [],
+        "summary": summarize(results) if results else {"sent": 0, "ok": 0, "failed": 0, "max_latency_ms": None},
+        "legs": rows,
+    }
+
+def print_report(report):
+    print(f"Snapshot {report['snapshot_ms']} ms | cancels {report['cancel_ms']} ms | legs {report['legs_ms']} ms | "
+          f"total {report['total_ms']} ms")
+    for name, msg in report["snapshot_errors"].items():
+        print(f"  snapshot {name} failed: {msg}")
+    if report["cancel_failures"]:
+        print(f"  cancels not confirmed (their exits may be rejected): {', '.join(report['cancel_failures'])}")
+    for row in report["legs"]:
+        print(f"  {row['leg']:<14} {row['id']:<30} {row['status']:<8} {row['latency_ms'] or '-':>8}  {row['message']}")
+    s = report["summary"]
+    print(f"{s['ok']}/{s['sent']} legs OK, {s['failed']} failed")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cancel all open orders/GTTs and market-exit every position")
+    parser.add_argument("--no-holdings", action="store_true", help="leave delivery holdings untouched")
+    parser.add_argument("--dry-run", action="store_true", help="show the legs without sending them")
+    parser.add_argument("--yes", action="store_true", help="do not ask for confirmation")
+    args = parser.parse_args()
+
+    from session_utils import load_session_from_file
+    from utils import session_headers
+
+    session = load_session_from_file()
+    if not session:
+        raise SystemExit("No saved session (session.json). Log in through the dashboard first.")
+    if not args.yes and not args.dry_run:
+        if input("Flatten everything at MARKET? Type KILL to confirm: ").strip() != "KILL":
+            raise SystemExit("Aborted.")
+    print_report(flatten(session_headers(session), include_holdings=not args.no_holdings, dry_run=args.dry_run))
@@ -0,0 +1,38 @@
+import streamlit as st
+import plotly.graph_objs as go
+from order_latency import get_tracker, STAGES
+from live_feed import get_live_feed
+from order_dispatch import get_dispatcher
+
+def app():
+    st.header("Order Latency — Submit → Ack → First Update → Fill")
+    tracker = get_tracker()
+    feed = get_live_feed()
+    if feed is None or not feed.is_running() or not feed.handler.order_subscribed:
+        st.info("First-update and fill times need the live feed with order updates (start it from the Tradebot page).")
+
+    dispatch = get_dispatcher().metrics()
+    st.subheader("Dispatch Queue")
+    st.caption(f"{dispatch['in_flight']} in flight on {dispatch['workers']} workers; wait = time queued before sending")
+    st.dataframe(dispatch["classes"], use_container_width=True)
+
+    rows = tracker.percentiles()
+    if not rows:
+        st.info("No orders submitted from this app process yet.")
+        return
+
+    st.subheader("Percentiles by Endpoint / Price Type")
+    st.dataframe(rows, use_container_width=True)
+
+    keys = sorted({(r["endpoint"], r["price_type"]) for r in rows})
+    c1, c2 = st.columns(2)
+    endpoint, price_type = c1.selectbox("Endpoint / Price Type", keys, format_func=lambda k: f"{k[0]} {k[1]}".strip())
+    stage = c2.selectbox("Stage", STAGES)
+    labels, counts = tracker.histogram(endpoint, price_type, stage)
+    fig = go.Figure(data=[go.Bar(x=labels, y=counts)])
+    fig.update_layout(height=320, xaxis_title="ms since submit", yaxis_title="orders", xaxis=dict(type="category"))
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.subheader("Recent Orders")
+    st.dataframe(tracker.recent(50), use_container_width=True)
+    st.download_button("Export CSV", tracker.export_csv(), file_name="order_latency.csv", mime="text/csv")
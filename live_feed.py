@@ -0,0 +1,256 @@
+import time
+import uuid
+import threading
+import streamlit as st
+from websocket_handler import WebSocketHandler
+from sharded_feed import ShardedFeed
+from bar_aggregator import BarAggregator
+from tick_recorder import TickRecorder
+from scheduler import get_scheduler
+from order_store import OrderStore
+from order_latency import get_tracker
+from records import invalidate_book
+from utils import integrate_get, session_headers
+
+SESSION_TTL = 1800  # drop interest of browser sessions not seen for 30 min
+
+class TickBus:
+    # Fan-out of live feed events ("touchline", "depth", "order") to any number of consumers
+    def __init__(self):
+        self.subscribers = {"touchline": [], "depth": [], "order": []}
+        self.published = {"touchline": 0, "depth": 0, "order": 0}
+        self._lock = threading.Lock()
+
+    def subscribe(self, kind, callback):
+        with self._lock:
+            if callback not in self.subscribers[kind]:
+                self.subscribers[kind] = self.subscribers[kind] + [callback]
+
+    def unsubscribe(self, kind, callback):
+        with self._lock:
+            self.subscribers[kind] = [cb for cb in self.subscribers[kind] if cb != callback]
+
+    def publish(self, kind, item):
+        self.published[kind] += 1
+        for callback in self.subscribers[kind]:
+            try:
+                callback(item)
+            except Exception as e:
+                print(f"TickBus {kind} subscriber error: {e}")
+
+class LiveFeed:
+    # One broker connection per account, shared by every Streamlit session.
+    # Sessions register the scrips they care about; the feed subscribes the union.
+    def __init__(self, actid):
+        self.actid = actid
+        self.uid = None
+        self.ws_session_key = None
+        self.api_session_key = None
+        self.bus = TickBus()
+        self.aggregator = BarAggregator()
+        self.bus.subscribe("touchline", self.aggregator.on_touchline)
+        self.last_order = None
+        self.bus.subscribe("order", self._remember_order)
+        self.orders = OrderStore()
+        self.bus.subscribe("order", self.orders.apply)
+        self.bus.subscribe("order", get_tracker().on_order_event)
+        self.bus.subscribe("order", self._invalidate_book)
+        self.handler = None
+        self.started_at = None
+        self.interest = {}  # session_id -> {"touchline": set, "depth": set, "orders": bool, "seen": ts}
+        self._lock = threading.Lock()
+        self._jobs = []
+
+    def _remember_order(self, data):
+        self.last_order = data
+
+    def _invalidate_book(self, data):
+        # Fills change holdings/positions; the next reader refetches the shared book
+        if data.get("fillshares") or str(data.get("status", "")).upper() == "COMPLETE":
+            invalidate_book(self.actid)
+
+    def set_session_keys(self, uid, ws_session_key, api_session_key):
+        self.uid = uid
+        self.ws_session_key = ws_session_key
+        self.api_session_key = api_session_key
+
+    def is_running(self):
+        return self.handler is not None
+
+    def start(self, max_idle_time=0, auto_reconnect=True, record_ticks=False, shards=1, use_processes=False):
+        with self._lock:
+            if self.handler is not None:
+                return False
+            kwargs = dict(
+                on_touchline=lambda snap: self.bus.publish("touchline", snap),
+                on_depth=lambda book: self.bus.publish("depth", book),
+                on_order=lambda data: self.bus.publish("order", data),
+                auto_disconnect_on_blur=False,
+                max_idle_time=max_idle_time,
+                auto_reconnect=auto_reconnect,
+                api_session_key=self.api_session_key,
+                on_backfill=self.aggregator.backfill,
+                on_reconnect=self.aggregator.reset_volume,
+                recorder=TickRecorder() if record_ticks else None
+            )
+            if shards > 1:
+                # Same bus and aggregator, subscriptions spread over several connections
+                self.handler = ShardedFeed(self.uid, self.actid, self.ws_session_key,
+                                           shards=shards, use_processes=use_processes, **kwargs)
+            else:
+                self.handler = WebSocketHandler(self.uid, self.actid, self.ws_session_key, **kwargs)
+            self.handler.connect()
+            self.started_at = time.time()
+            scheduler = get_scheduler()
+            self._jobs = [
+                scheduler.call_every(1, self.aggregator.flush, name="bar_flush"),
+                scheduler.call_every(60, self._prune_sessions, name="feed_prune"),
+            ]
+        self._sync_subscriptions()
+        return True
+
+    def stop(self):
+        with self._lock:
+            handler, self.handler = self.handler, None
+            for job in self._jobs:
+                job.cancel()
+            self._jobs = []
+        if handler:
+            handler.disconnect()
+        self.orders.gap = True
+
+    def register(self, session_id, touchline=(), depth=(), orders=False):
+        with self._lock:
+            entry = self.interest.setdefault(session_id, {"touchline": set(), "depth": set(), "orders": False})
+            entry["touchline"].update(touchline)
+            entry["depth"].update(depth)
+            entry["orders"] = entry["orders"] or orders
+            entry["seen"] = time.time()
+        self._sync_subscriptions()
+
+    def set_interest(self, session_id, touchline=(), depth=(), orders=False):
+        # Replace (not extend) a session's interest
+        with self._lock:
+            self.interest[session_id] = {
+                "touchline": set(touchline), "depth": set(depth), "orders": orders, "seen": time.time()
+            }
+        self._sync_subscriptions()
+
+    def touch(self, session_id):
+        entry = self.interest.get(session_id)
+        if entry:
+            entry["seen"] = time.time()
+
+    def unregister(self, session_id):
+        with self._lock:
+            self.interest.pop(session_id, None)
+        self._sync_subscriptions()
+
+    def _prune_sessions(self):
+        cutoff = time.time() - SESSION_TTL
+        with self._lock:
+            stale = [sid for sid, entry in self.interest.items() if entry.get("seen", 0) < cutoff]
+            for sid in stale:
+                del self.interest[sid]
+        if stale:
+            self._sync_subscriptions()
+
+    def wanted(self):
+        with self._lock:
+            touchline, depth, orders = set(), set(), False
+            for entry in self.interest.values():
+                touchline |= entry["touchline"]
+                depth |= entry["depth"]
+                orders = orders or entry["orders"]
+        return touchline, depth, orders
+
+    def _sync_subscriptions(self):
+        handler = self.handler
+        if handler is None:
+            return
+        touchline, depth, orders = self.wanted()
+        add = touchline - handler.subscribed_touchline
+        remove = handler.subscribed_touchline - touchline
+        if add:
+            handler.subscribe_touchline(sorted(add))
+        if remove:
+            handler.unsubscribe_touchline(sorted(remove))
+        add = depth - handler.subscribed_depth
+        remove = handler.subscribed_depth - depth
+        if add:
+            handler.subscribe_depth(sorted(add))
+        if remove:
+            handler.unsubscribe_depth(sorted(remove))
+        if orders and not handler.order_subscribed:
+            handler.subscribe_order_update()
+        elif not orders and handler.order_subscribed:
+            handler.unsubscribe_order_update()
+            self.orders.gap = True
+
+    def api_headers(self):
+        return session_headers({"api_session_key": self.api_session_key, "actid": self.actid, "uid": self.uid})
+
+    def order_book(self):
+        # Orders from the websocket-fed store; REST resync only at startup or after a gap
+        reconnects = self.handler.get_metrics().get("reconnect_count") if self.handler else None
+        if self.orders.needs_resync(reconnects):
+            self.orders.resync(self.api_headers(), reconnects)
+        return self.orders.all()
+
+    def get_touchline(self, exchange, token):
+        return self.handler.touchlines.get(exchange, token) if self.handler else None
+
+    def get_depth(self, exchange, token):
+        return self.handler.depth_books.get(exchange, token) if self.handler else None
+
+    def metrics(self):
+        m = self.handler.get_metrics() if self.handler else {"connected": False}
+        m["sessions"] = len(self.interest)
+        m["touchline_tokens"] = len(self.handler.subscribed_touchline) if self.handler else 0
+        m["depth_tokens"] = len(self.handler.subscribed_depth) if self.handler else 0
+        m["order_events"] = self.orders.events
+        m["uptime_sec"] = round(time.time() - self.started_at, 1) if self.handler and self.started_at else 0
+        return m
+
+@st.cache_resource(show_spinner=False)
+def _shared_feed(actid):
+    return LiveFeed(actid)
+
+def get_live_feed(session=None):
+    # Process-wide feed for the logged-in account (kept across reruns, pages and tabs)
+    session = session or st.session_state.get("integrate_session")
+    if not session:
+        return None
+    feed = _shared_feed(session["actid"])
+    feed.set_session_keys(session["uid"], session["ws_session_key"], session.get("api_session_key"))
+    return feed
+
+def get_session_id():
+    if "live_feed_session_id" not in st.session_state:
+        st.session_state["live_feed_session_id"] = uuid.uuid4().hex
+    return st.session_state["live_feed_session_id"]
+
+def get_live_book(exchange, token, subscribe=True):
+    # Depth book from the shared live feed, if it is running. When the token is
+    # not subscribed yet, register this session's interest so the next rerun has depth.
+    feed = get_live_feed()
+    if feed is None or not feed.is_running() or not exchange or not token:
+        return None
+    book = feed.get_depth(exchange, token)
+    if book is not None and book.is_ready():
+        return book
+    if subscribe:
+        feed.register(get_session_id(), depth=[f"{exchange}|{token}"])
+    return None
+
+def get_order_book():
+    # Order list for pages: the live order store when the shared feed is running,
+    # otherwise a single REST call
+    feed = get_live_feed()
+    if feed is None or not feed.is_running():
+        return integrate_get("/orders").get("orders", [])
+    session_id = get_session_id()
+    entry = feed.interest.get(session_id)
+    if not entry or not entry["orders"]:
+        feed.register(session_id, orders=True)
+    return feed.order_book()
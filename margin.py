@@ -1,5 +1,7 @@
 import streamlit as st
-from utils import integrate_post
+from utils import integrate_post, get_session_headers
+from security_info import get_security_cache
+from margin_estimator import estimate, basket_pairs, broker_margin, record_sample
 import pandas as pd
 import json
 
@@ -26,6 +28,19 @@ def load_master_symbols():
     df = df.drop_duplicates(subset=["symbol", "series"])
     return df.sort_values("symbol")
 
+def show_estimate(basket):
+    # Instant estimate from cached VaR/ELM/delivery margins; only uncached symbols are fetched (once a day)
+    cache = get_security_cache()
+    pairs = cache.missing(basket_pairs(basket, cache))
+    if pairs:
+        with st.spinner("Fetching margin data..."):
+            cache.warm(pairs, get_session_headers())
+    est = estimate(basket, cache)
+    st.markdown(f"##### Estimated Margin: ₹{est['total']:,.2f}")
+    st.dataframe(pd.DataFrame(est["legs"]), use_container_width=True)
+    if est["missing"]:
+        st.caption(f"No cached margin data or price for: {', '.join(est['missing'])} (estimate may be off; confirm with the broker)")
+
 def show():
     st.header("Basket Margin Calculator")
     st.write("Calculate required margin for a basket of orders.")
@@ -72,6 +87,7 @@ def show():
     basket_orders = st.session_state.get("basket_orders", [])
     if basket_orders:
         st.dataframe(pd.DataFrame(basket_orders))
+        show_estimate(basket_orders)
     else:
         st.info("No orders in basket yet.")
 
@@ -79,7 +95,7 @@ def show():
     with st.form("basket_margin"):
         st.markdown("##### Edit Basket (JSON, advanced users only)")
         basket_str = st.text_area("Basket Orders JSON (list)", value=json.dumps(basket_orders, indent=2), height=150)
-        submit = st.form_submit_button("Calculate Margin")
+        submit = st.form_submit_button("Confirm Margin with Broker")
         if submit:
             try:
                 basket = json.loads(basket_str)
@@ -88,6 +104,13 @@ def show():
                 data = {"basketlists": basket}
                 resp = integrate_post("/margin", data)
                 st.success("Margin calculation successful!")
+                if resp.get("status") != "ERROR":
+                    # Recorded even when the margin field is not recognised, so the response shape is kept
+                    record_sample(basket, resp)
+                broker = broker_margin(resp)
+                if broker is not None:
+                    local = estimate(basket)["total"]
+                    st.write(f"Broker: ₹{broker:,.2f} | Local estimate: ₹{local:,.2f}")
                 st.json(resp)
             except json.JSONDecodeError:
                 st.error("Invalid JSON format. Please check your input.")
@@ -0,0 +1,143 @@
+import argparse
+import glob
+import json
+import os
+import time
+from security_info import SecurityInfo, get_security_cache
+
+# Cash-segment margin estimate from the per-day security info cache (varMargin and elmMargin are
+# percentages of order value; a delivery buy needs the full value). The broker /margin call is
+# only made to confirm.
+SAMPLES_DIR = "margin_samples"  # recorded from the Basket Margin page
+MIN_VAR_ELM_PCT = 20.0  # exchange floor for VaR + ELM in the cash segment
+FULL_PCT = 100.0
+TOLERANCE_PCT = 2.0  # allowed difference against recorded broker numbers
+# Field holding the margin the basket blocks, as a string like "43102.50". Samples are recorded
+# whatever the response looks like, so an unknown shape shows up in the regression test.
+RESPONSE_KEYS = ("marginused", "margin_used", "total_margin", "margin")
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def margin_pct(info, product_type, order_type):
+    # Percent of order value blocked for one leg
+    if product_type == "CNC":
+        # Delivery buys are paid in full; delivery sells go against holdings
+        return 0.0 if order_type == "SELL" else FULL_PCT
+    if info is None or not info.fetched:
+        return FULL_PCT
+    return min(max(info.var_margin + info.elm_margin, MIN_VAR_ELM_PCT), FULL_PCT)
+
+def reference_price(item, info):
+    price = _float(item.get("price"))
+    if item.get("price_type") != "MARKET" and price > 0:
+        return price
+    if info and info.last_price > 0:
+        return info.last_price
+    return price
+
+def lookup(item, cache=None):
+    cache = cache or get_security_cache()
+    return cache.lookup(item.get("exchange"), item.get("token"), item.get("tradingsymbol"))
+
+def estimate_leg(item, info):
+    qty = int(_float(item.get("quantity")))
+    price = reference_price(item, info)
+    pct = margin_pct(info, item.get("product_type", "CNC"), item.get("order_type", "BUY"))
+    return {
+        "tradingsymbol": item.get("tradingsymbol"),
+        "order_type": item.get("order_type"),
+        "product_type": item.get("product_type"),
+        "quantity": qty,
+        "price": price,
+        "value": round(qty * price, 2),
+        "margin_pct": round(pct, 2),
+        "margin": round(qty * price * pct / 100, 2),
+        "cached": bool(info and info.fetched),
+    }
+
+def estimate(basket, cache=None):
+    # {"legs": [...], "total": float, "missing": [symbols without cached margin data or price]}
+    legs = [estimate_leg(item, lookup(item, cache)) for item in basket]
+    missing = [leg["tradingsymbol"] for leg in legs if not leg["cached"] or not leg["price"]]
+    return {"legs": legs, "total": round(sum(leg["margin"] for leg in legs), 2), "missing": missing}
+
+def basket_pairs(basket, cache=None):
+    cache = cache or get_security_cache()
+    pairs = []
+    for item in basket:
+        info = lookup(item, cache)
+        if info:
+            pairs.append((info.exchange, info.token))
+    return pairs
+
+def broker_margin(resp):
+    if resp.get("status") == "ERROR":
+        return None
+    for key in RESPONSE_KEYS:
+        if key in resp:
+            return _float(resp[key])
+    return None
+
+def record_sample(basket, resp, cache=None):
+    # Keep the broker's answer next to our inputs so the estimate can be checked later
+    cache = cache or get_security_cache()
+    infos = [lookup(item, cache) for item in basket]
+    sample = {
+        "recorded": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "basket": basket,
+        "secinfo": [info.to_dict() if info else None for info in infos],
+        "response": resp,
+    }
+    os.makedirs(SAMPLES_DIR, exist_ok=True)
+    path = os.path.join(SAMPLES_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}_{len(basket)}.json")
+    with open(path, "w") as f:
+        json.dump(sample, f, indent=1)
+    return path
+
+def load_samples(dirs=(SAMPLES_DIR,)):
+    # [(name, sample)] for every recorded basket, oldest first
+    paths = sorted(p for d in dirs for p in glob.glob(os.path.join(d, "*.json")))
+    samples = []
+    for path in paths:
+        with open(path) as f:
+            samples.append((os.path.basename(path), json.load(f)))
+    return samples
+
+def replay(sample):
+    # Re-run the estimator on a recorded basket with the security info recorded at the time
+    legs = []
+    for item, row in zip(sample["basket"], sample["secinfo"]):
+        info = None
+        if row:
+            row = dict(row)
+            info = SecurityInfo(row.pop("exchange"), row.pop("token"), **row)
+        legs.append(estimate_leg(item, info))
+    return round(sum(leg["margin"] for leg in legs), 2)
+
+def compare(sample, tolerance_pct=TOLERANCE_PCT):
+    # {"broker", "estimate", "diff_pct", "ok"}; broker is None when the response has no margin field
+    broker = broker_margin(sample.get("response") or {})
+    est = replay(sample)
+    if broker is None:
+        return {"broker": None, "estimate": est, "diff_pct": None, "ok": False}
+    diff_pct = abs(est - broker) / broker * 100 if broker else (0.0 if not est else 100.0)
+    return {"broker": broker, "estimate": est, "diff_pct": round(diff_pct, 2), "ok": diff_pct <= tolerance_pct}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare local margin estimates with recorded /margin responses")
+    parser.add_argument("--dir", action="append", help=f"sample directory (default: {SAMPLES_DIR})")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE_PCT, help="allowed difference in percent")
+    args = parser.parse_args()
+    samples = load_samples(args.dir or (SAMPLES_DIR,))
+    for name, sample in samples:
+        r = compare(sample, args.tolerance)
+        if r["broker"] is None:
+            print(f"BAD {name:<32} no margin field in response: {sorted(sample.get('response') or {})}")
+        else:
+            print(f"{'OK ' if r['ok'] else 'BAD'} {name:<32} broker {r['broker']:>12.2f}  "
+                  f"estimate {r['estimate']:>12.2f}  diff {r['diff_pct']:.2f}%")
+    print(f"{len(samples)} sample(s)" if samples else "No margin samples found")
@@ -0,0 +1,136 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+from utils import api_request
+from rate_limit import order_bucket
+
+# Priority classes, lowest number first. Exits reduce risk, so they always go first;
+# GTT/OCO housekeeping (auto OCO, trailing sync) only uses what is left of the rate limit.
+EXIT, CANCEL, ENTRY, HOUSEKEEPING = 0, 1, 2, 3
+PRIORITY_NAMES = {EXIT: "EXIT", CANCEL: "CANCEL/MODIFY", ENTRY: "ENTRY", HOUSEKEEPING: "HOUSEKEEPING"}
+WORKERS = 8
+RESERVED_WORKERS = 2  # only take EXIT and CANCEL work, so a bulk job can never occupy every worker
+DEFAULT_TIMEOUT = 10.0
+WAIT_SAMPLES = 1000
+
+class DispatchRequest:
+    __slots__ = ("priority", "method", "path", "payload", "headers", "deadline", "enqueued", "future")
+
+    def __init__(self, priority, method, path, payload, headers, deadline):
+        self.priority = priority
+        self.method = method
+        self.path = path
+        self.payload = payload
+        self.headers = headers
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.future = Future()
+
+class OrderDispatcher:
+    # One process-wide queue and worker pool for every order, cancel, modify and GTT call.
+    # A worker takes a rate-limit token first and only then pops the most urgent request,
+    # so tokens always go to the highest priority waiting at that moment.
+    def __init__(self, workers=WORKERS, reserved=RESERVED_WORKERS):
+        self.workers = workers
+        self.reserved = reserved
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self.depth = {p: 0 for p in PRIORITY_NAMES}
+        self.sent = {p: 0 for p in PRIORITY_NAMES}
+        self.expired = {p: 0 for p in PRIORITY_NAMES}
+        self.waits = {p: deque(maxlen=WAIT_SAMPLES) for p in PRIORITY_NAMES}  # queue wait in ms
+        self.in_flight = 0
+
+    def _start(self):
+        # Called with the condition held
+        if self._threads:
+            return
+        for i in range(self.workers):
+            max_priority = CANCEL if i < self.reserved else HOUSEKEEPING
+            t = threading.Thread(target=self._loop, args=(max_priority,), name=f"dispatch_{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, priority, method, path, payload, headers, timeout=DEFAULT_TIMEOUT):
+        # Returns a Future resolving to the broker response (or an ERROR/TIMEOUT dict)
+        req = DispatchRequest(priority, method, path, payload, headers, time.monotonic() + timeout)
+        with self._cond:
+            self._start()
+            heapq.heappush(self._heap, (priority, next(self._seq), req))
+            self.depth[priority] += 1
+            self._cond.notify_all()
+        return req.future
+
+    def call(self, priority, method, path, payload, headers, timeout=DEFAULT_TIMEOUT):
+        future = self.submit(priority, method, path, payload, headers, timeout)
+        try:
+            return future.result(timeout=timeout + 1)
+        except Exception as e:
+            return {"status": "ERROR", "message": f"Dispatch: {e or 'no response before timeout'}"}
+
+    def _eligible(self, max_priority):
+        return bool(self._heap) and self._heap[0][0] <= max_priority
+
+    def _loop(self, max_priority):
+        bucket = order_bucket()
+        while True:
+            with self._cond:
+                while not self._eligible(max_priority):
+                    self._cond.wait()
+            bucket.acquire()
+            with self._cond:
+                if not self._eligible(max_priority):
+                    bucket.refund()
+                    continue
+                _, _, req = heapq.heappop(self._heap)
+                self.depth[req.priority] -= 1
+                now = time.monotonic()
+                self.waits[req.priority].append((now - req.enqueued) * 1000)
+                if now > req.deadline:
+                    self.expired[req.priority] += 1
+                    bucket.refund()
+                    req.future.set_result({"status": "TIMEOUT", "message": "Not sent before deadline"})
+                    continue
+                self.sent[req.priority] += 1
+                self.in_flight += 1
+            remaining = max(0.5, req.deadline - now)
+            try:
+                resp = api_request(req.method, req.path, req.headers, req.payload,
+                                   timeout=(min(3, remaining), remaining))
+            except Exception as e:
+                resp = {"status": "ERROR", "message": str(e)}
+            with self._cond:
+                self.in_flight -= 1
+            req.future.set_result(resp)
+
+    def metrics(self):
+        rows = []
+        with self._cond:
+            waits = {p: np.array(w) for p, w in self.waits.items()}
+            for p, name in PRIORITY_NAMES.items():
+                arr = waits[p]
+                rows.append({
+                    "priority": name,
+                    "queued": self.depth[p],
+                    "sent": self.sent[p],
+                    "expired": self.expired[p],
+                    "wait_p50_ms": round(float(np.percentile(arr, 50)), 1) if len(arr) else None,
+                    "wait_p99_ms": round(float(np.percentile(arr, 99)), 1) if len(arr) else None,
+                    "wait_max_ms": round(float(arr.max()), 1) if len(arr) else None,
+                })
+        return {"in_flight": self.in_flight, "workers": len(self._threads), "classes": rows}
+
+_dispatcher = OrderDispatcher()
+
+def get_dispatcher():
+    return _dispatcher
+
+def dispatch(priority, method, path, payload, headers, timeout=DEFAULT_TIMEOUT):
+    # Blocking single call through the shared queue (pages)
+    return _dispatcher.call(priority, method, path, payload, headers, timeout)
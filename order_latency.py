@@ -0,0 +1,170 @@
+import csv
+import io
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+import numpy as np
+
+# Order endpoints whose lifecycle is timed
+TRACKED_PATHS = ("/placeorder", "/modify", "/ocoplaceorder")
+STAGES = ("ack", "first_event", "fill")
+SAMPLES_PER_KEY = 2000
+MAX_RECORDS = 5000
+# Histogram bucket edges in ms (roughly log-spaced)
+BUCKETS_MS = (0, 25, 50, 100, 200, 350, 500, 750, 1000, 2000, 5000, 10000, float("inf"))
+
+class LatencyTracker:
+    # Times each order from submit to HTTP ack, first order-update event and fill.
+    # All timestamps use time.time() so they line up with websocket event times.
+    def __init__(self):
+        self.records = OrderedDict()  # client_id -> record
+        self.by_order_id = {}
+        self.samples = {}  # (endpoint, price_type, stage) -> deque of ms
+        # Events for orders whose HTTP ack has not returned yet (the websocket can be faster)
+        self.unmatched = OrderedDict()  # order_id -> {"first_event": ts, "fill": ts, "status": str}
+        self._lock = threading.Lock()
+
+    def submit(self, path, payload):
+        client_id = uuid.uuid4().hex[:12]
+        payload = payload or {}
+        record = {
+            "client_id": client_id,
+            "endpoint": path,
+            "price_type": payload.get("price_type") or ("OCO" if path == "/ocoplaceorder" else ""),
+            "side": payload.get("order_type", ""),
+            "tradingsymbol": payload.get("tradingsymbol", ""),
+            "order_id": payload.get("order_id"),
+            "submit": time.time(),
+            "ack": None,
+            "first_event": None,
+            "fill": None,
+            "status": "SUBMITTED",
+            "message": "",
+        }
+        with self._lock:
+            self.records[client_id] = record
+            while len(self.records) > MAX_RECORDS:
+                _, old = self.records.popitem(last=False)
+                self.by_order_id.pop(str(old.get("order_id")), None)
+        return client_id
+
+    def response(self, client_id, resp):
+        now = time.time()
+        with self._lock:
+            record = self.records.get(client_id)
+            if record is None:
+                return
+            record["ack"] = now
+            record["status"] = "ERROR" if resp.get("status") == "ERROR" else "ACK"
+            record["message"] = resp.get("message", "")
+            order_id = resp.get("order_id") or record.get("order_id")
+            self._sample(record, "ack", now)
+            if not order_id or record["status"] == "ERROR":
+                return
+            record["order_id"] = str(order_id)
+            self.by_order_id[str(order_id)] = client_id
+            early = self.unmatched.pop(str(order_id), None)
+            if early and early["first_event"] and early["first_event"] >= record["submit"]:
+                for stage in ("first_event", "fill"):
+                    if early[stage] and record[stage] is None:
+                        record[stage] = early[stage]
+                        self._sample(record, stage, early[stage])
+                if early["status"]:
+                    record["status"] = early["status"]
+
+    def on_order_event(self, data):
+        order_id = data.get("norenordno") or data.get("order_id")
+        if not order_id:
+            return
+        now = time.time()
+        with self._lock:
+            record = self.records.get(self.by_order_id.get(str(order_id)))
+            if record is None:
+                record = self.unmatched.get(str(order_id))
+                if record is None:
+                    record = self.unmatched[str(order_id)] = {"first_event": None, "fill": None, "status": ""}
+                    while len(self.unmatched) > 1000:
+                        self.unmatched.popitem(last=False)
+            if "submit" not in record:
+                # Not acked yet: just remember when things happened
+                record["first_event"] = record["first_event"] or now
+                self._update_status(record, data, now, sample=False)
+                return
+            if record["first_event"] is None:
+                record["first_event"] = now
+                self._sample(record, "first_event", now)
+            self._update_status(record, data, now)
+
+    def _update_status(self, record, data, now, sample=True):
+        status = str(data.get("status", "")).upper()
+        try:
+            filled = float(data.get("fillshares") or 0)
+        except (TypeError, ValueError):
+            filled = 0
+        if record["fill"] is None and (filled > 0 or status == "COMPLETE"):
+            record["fill"] = now
+            record["status"] = "FILLED"
+            if sample:
+                self._sample(record, "fill", now)
+        elif status in ("REJECTED", "CANCELED", "CANCELLED"):
+            record["status"] = status
+
+    def _sample(self, record, stage, now):
+        key = (record["endpoint"], record["price_type"], stage)
+        samples = self.samples.get(key)
+        if samples is None:
+            samples = self.samples[key] = deque(maxlen=SAMPLES_PER_KEY)
+        samples.append((now - record["submit"]) * 1000)
+
+    def percentiles(self):
+        rows = []
+        with self._lock:
+            items = [(k, np.array(v)) for k, v in self.samples.items() if v]
+        for (endpoint, price_type, stage), arr in sorted(items):
+            p50, p90, p99 = np.percentile(arr, [50, 90, 99])
+            rows.append({
+                "endpoint": endpoint, "price_type": price_type, "stage": stage, "count": len(arr),
+                "p50_ms": round(float(p50), 1), "p90_ms": round(float(p90), 1), "p99_ms": round(float(p99), 1),
+                "max_ms": round(float(arr.max()), 1),
+            })
+        return rows
+
+    def histogram(self, endpoint, price_type, stage):
+        with self._lock:
+            arr = np.array(self.samples.get((endpoint, price_type, stage), ()))
+        counts, _ = np.histogram(arr, bins=BUCKETS_MS)
+        labels = [f"{int(lo)}-{int(hi)}" if hi != float("inf") else f"{int(lo)}+" for lo, hi in zip(BUCKETS_MS, BUCKETS_MS[1:])]
+        return labels, counts.tolist()
+
+    def recent(self, n=50):
+        with self._lock:
+            records = list(self.records.values())[-n:]
+        return [self._row(r) for r in reversed(records)]
+
+    @staticmethod
+    def _row(r):
+        def ms(stage):
+            return round((r[stage] - r["submit"]) * 1000, 1) if r[stage] else None
+        return {
+            "client_id": r["client_id"], "order_id": r["order_id"], "endpoint": r["endpoint"],
+            "price_type": r["price_type"], "side": r["side"], "tradingsymbol": r["tradingsymbol"],
+            "submitted": time.strftime("%H:%M:%S", time.localtime(r["submit"])),
+            "ack_ms": ms("ack"), "first_event_ms": ms("first_event"), "fill_ms": ms("fill"),
+            "status": r["status"], "message": r["message"],
+        }
+
+    def export_csv(self):
+        with self._lock:
+            rows = [self._row(r) for r in self.records.values()]
+        buf = io.StringIO()
+        if rows:
+            writer = csv.DictWriter(buf, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        return buf.getvalue()
+
+_tracker = LatencyTracker()
+
+def get_tracker():
+    return _tracker
@@ -1,20 +1,46 @@
 import streamlit as st
-from utils import integrate_get, integrate_post
+from utils import integrate_post, get_session_headers
+from order_dispatch import dispatch, CANCEL
+from bulk_orders import cancel_orders, summarize
+from live_feed import get_order_book, get_live_feed
+from order_slicer import parent_rows
 import requests
 
 def norm_status(s):
     return str(s).replace(" ", "_").upper()
 
 def cancel_order(order_id):
-    api_session_key = st.secrets.get("integrate_api_session_key", "")
-    url = f"https://integrate.definedgesecurities.com/dart/v1/cancel/{order_id}"
-    headers = {"Authorization": api_session_key}
-    resp = requests.get(url, headers=headers)
-    try:
-        result = resp.json()
-    except Exception:
-        result = {"status": "ERROR", "message": "Invalid API response"}
-    return result
+    return dispatch(CANCEL, "GET", f"/cancel/{order_id}", None, get_session_headers())
+
+def bulk_cancel(order_ids):
+    # Concurrent cancels; results are kept for the next rerun, which refetches the book once
+    results = cancel_orders(order_ids, get_session_headers())
+    st.session_state["cancel_results"] = results
+    for oid in order_ids:
+        st.session_state["order_selection"].pop(oid, None)
+    st.rerun()
+
+def show_cancel_results():
+    results = st.session_state.pop("cancel_results", None)
+    if not results:
+        return
+    s = summarize(results)
+    msg = f"Cancelled {s['ok']}/{s['sent']} orders (slowest {s['max_latency_ms']} ms)."
+    if s["failed"]:
+        st.warning(msg)
+    else:
+        st.success(msg)
+    st.dataframe(
+        [{k: r.get(k) for k in ("order_id", "status", "message", "latency_ms")} for r in results],
+        use_container_width=True
+    )
+
+def show_sliced_orders():
+    feed = get_live_feed()
+    rows = parent_rows(feed.orders if feed is not None and feed.is_running() else None)
+    if rows:
+        with st.expander(f"Sliced Orders ({len(rows)})"):
+            st.dataframe(rows, use_container_width=True)
 
 @st.cache_data(show_spinner=False)
 def get_ltp(tradingsymbol, exchange, api_session_key):
@@ -31,10 +57,11 @@ def get_ltp(tradingsymbol, exchange, api_session_key):
 
 def show():
     st.header("Orders Book & Manage")
+    show_cancel_results()
+    show_sliced_orders()
 
-    # Fetch orders
-    data = integrate_get("/orders")
-    orderlist = data.get("orders", [])
+    # Orders from the live order store (websocket updates), or REST when the feed is off
+    orderlist = get_order_book()
     open_statuses = {"OPEN", "PARTIALLY_FILLED", "TRIGGER_PENDING"}
     open_orders = [o for o in orderlist if norm_status(o.get("order_status", "")) in open_statuses]
 
@@ -70,22 +97,9 @@ def show():
         if not selected_ids:
             st.warning("No orders selected.")
         else:
-            for oid in selected_ids:
-                result = cancel_order(oid)
-                if result.get("status") == "ERROR":
-                    st.error(f"Cancel Failed [{oid}]: {result.get('message','Error')}")
-                else:
-                    st.success(f"Order {oid} cancelled!")
-            st.rerun()
+            bulk_cancel(selected_ids)
     if col4.button("Cancel All"):
-        for order in open_orders:
-            oid = order["order_id"]
-            result = cancel_order(oid)
-            if result.get("status") == "ERROR":
-                st.error(f"Cancel Failed [{oid}]: {result.get('message','Error')}")
-            else:
-                st.success(f"Order {oid} cancelled!")
-        st.rerun()
+        bulk_cancel([order["order_id"] for order in open_orders])
 
     # Table columns to show
     cols = [
@@ -160,7 +174,7 @@ def show():
                         "price_type": new_price_type,
                         "validity": new_validity
                     }
-                    resp = integrate_post("/modify", payload)
+                    resp = integrate_post("/modify", payload, priority=CANCEL)
                     if resp.get("status") == "ERROR":
                         st.error(f"Modify Failed: {resp.get('message','Error')}")
                     else:
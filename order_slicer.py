@@ -0,0 +1,123 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from bulk_orders import run_batch
+from order_dispatch import ENTRY
+
+MAX_PARENTS = 200
+TERMINAL = {"COMPLETE", "CANCELLED", "REJECTED"}
+
+def max_child_qty(freeze_qty, lot_size=1):
+    # Largest lot multiple strictly below the freeze quantity
+    lot = max(int(lot_size or 1), 1)
+    if not freeze_qty:
+        return 0
+    return max(((int(freeze_qty) - 1) // lot) * lot, lot)
+
+def slice_quantity(quantity, freeze_qty, lot_size=1):
+    quantity = int(quantity)
+    step = max_child_qty(freeze_qty, lot_size)
+    if not step or quantity <= step:
+        return [quantity]
+    full, rest = divmod(quantity, step)
+    return [step] * full + ([rest] if rest else [])
+
+def needs_slicing(quantity, info):
+    return info is not None and bool(info.freeze_qty) and int(quantity) >= int(info.freeze_qty)
+
+class ParentOrder:
+    # One user order split into freeze-safe children; status is aggregated from the children
+    def __init__(self, payload, quantities):
+        self.parent_id = uuid.uuid4().hex[:10]
+        self.payload = dict(payload)
+        self.created = time.time()
+        self.children = [
+            {"child": i + 1, "quantity": q, "order_id": None, "status": "PENDING", "filled_qty": 0, "message": ""}
+            for i, q in enumerate(quantities)
+        ]
+
+    @property
+    def quantity(self):
+        return sum(c["quantity"] for c in self.children)
+
+    def child_payloads(self):
+        return [dict(self.payload, quantity=str(c["quantity"])) for c in self.children]
+
+    def apply_results(self, results):
+        for child, result in zip(self.children, results):
+            resp = result.get("response") or {}
+            child["message"] = result.get("message", "")
+            if result["status"] == "OK":
+                child["order_id"] = str(resp.get("order_id", "")) or None
+                child["status"] = "SUBMITTED"
+            else:
+                child["status"] = "REJECTED" if result["status"] == "ERROR" else result["status"]
+
+    def refresh(self, order_store):
+        # Pull child state from the live order store (websocket updates)
+        if order_store is None:
+            return
+        for child in self.children:
+            order = order_store.get(child["order_id"]) if child["order_id"] else None
+            if order:
+                child["status"] = order.get("order_status", child["status"])
+                try:
+                    child["filled_qty"] = int(float(order.get("filled_qty") or 0))
+                except (TypeError, ValueError):
+                    pass
+                if child["status"] == "COMPLETE":
+                    child["filled_qty"] = child["quantity"]
+
+    @property
+    def filled_qty(self):
+        return sum(c["filled_qty"] for c in self.children)
+
+    @property
+    def status(self):
+        statuses = [c["status"] for c in self.children]
+        if all(s == "COMPLETE" for s in statuses):
+            return "COMPLETE"
+        if all(s in ("REJECTED", "TIMEOUT") for s in statuses):
+            return "REJECTED"
+        if self.filled_qty:
+            return "PARTIALLY_FILLED"
+        if all(s in TERMINAL for s in statuses):
+            return "CANCELLED"
+        if any(s in ("REJECTED", "TIMEOUT") for s in statuses):
+            return "PARTIALLY_SUBMITTED"
+        return "OPEN"
+
+    def summary(self):
+        return {
+            "parent_id": self.parent_id,
+            "tradingsymbol": self.payload.get("tradingsymbol"),
+            "side": self.payload.get("order_type"),
+            "quantity": self.quantity,
+            "children": len(self.children),
+            "filled_qty": self.filled_qty,
+            "status": self.status,
+            "created": time.strftime("%H:%M:%S", time.localtime(self.created)),
+        }
+
+parents = OrderedDict()
+_lock = threading.Lock()
+
+def place_sliced(payload, headers, info, priority=ENTRY):
+    # Split by freeze quantity / lot size and send all children concurrently (rate limited)
+    quantities = slice_quantity(int(payload["quantity"]), info.freeze_qty if info else 0, info.lot_size if info else 1)
+    parent = ParentOrder(payload, quantities)
+    calls = [(f"{parent.parent_id}:{i}", "POST", "/placeorder", p) for i, p in enumerate(parent.child_payloads())]
+    parent.apply_results(run_batch(calls, headers, priority=priority))
+    with _lock:
+        parents[parent.parent_id] = parent
+        while len(parents) > MAX_PARENTS:
+            parents.popitem(last=False)
+    return parent
+
+def parent_rows(order_store=None):
+    with _lock:
+        items = list(parents.values())
+    for parent in items:
+        parent.refresh(order_store)
+    return [p.summary() for p in reversed(items)]
@@ -0,0 +1,153 @@
+import threading
+import time
+from utils import api_request
+
+# Websocket "om" field -> REST /orders field
+OM_FIELDS = {
+    "norenordno": "order_id",
+    "tsym": "tradingsymbol",
+    "exch": "exchange",
+    "tk": "token",
+    "qty": "quantity",
+    "prc": "price",
+    "trgprc": "trigger_price",
+    "fillshares": "filled_qty",
+    "avgprc": "average_price",
+    "ret": "validity",
+    "exchordid": "exchange_orderid",
+    "rejreason": "message",
+    "remarks": "remarks",
+    "exch_tm": "order_entry_time",
+}
+TRANTYPE = {"B": "BUY", "S": "SELL"}
+PRICE_TYPE = {"LMT": "LIMIT", "MKT": "MARKET", "SL-LMT": "SL-LIMIT", "SL-MKT": "SL-MARKET"}
+PRODUCT = {"C": "CNC", "I": "INTRADAY", "M": "NORMAL"}
+
+TERMINAL = {"COMPLETE", "CANCELLED", "REJECTED"}
+OPEN_STATUSES = {"OPEN", "PARTIALLY_FILLED", "TRIGGER_PENDING"}
+# Report types that can legitimately be the first event we see for an order
+FIRST_REPORTS = {"NEW", "PENDINGNEW", "PENDING_NEW"}
+
+def norm_status(s):
+    status = str(s).replace(" ", "_").upper()
+    return "CANCELLED" if status == "CANCELED" else status
+
+def from_order_message(data):
+    # Map an "om" message onto the REST order field names used by the pages
+    order = {}
+    for src, dst in OM_FIELDS.items():
+        if src in data:
+            order[dst] = data[src]
+    if "trantype" in data:
+        order["order_type"] = TRANTYPE.get(data["trantype"], data["trantype"])
+    if "prctyp" in data:
+        order["price_type"] = PRICE_TYPE.get(data["prctyp"], data["prctyp"])
+    product = data.get("prd", data.get("pcode"))
+    if product is not None:
+        order["product_type"] = PRODUCT.get(product, product)
+    if "status" in data:
+        order["order_status"] = norm_status(data["status"])
+    return order
+
+def _filled(order):
+    try:
+        return float(order.get("filled_qty") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+class OrderStore:
+    # Orders keyed by order_id, updated from websocket order events through a
+    # small state machine. REST /orders is only used at startup and after gaps.
+    def __init__(self):
+        self.orders = {}
+        self.seq = 0  # bumped on every applied change; pages can key caches on it
+        self.events = 0
+        self.ignored = 0  # stale/out-of-order events dropped by the state machine
+        self.gap = True  # nothing loaded yet
+        self.synced_at = None
+        self.synced_reconnects = None
+        self.resync_count = 0
+        self._lock = threading.Lock()
+
+    def apply(self, data):
+        update = from_order_message(data)
+        oid = update.get("order_id")
+        if not oid:
+            return None
+        report = str(data.get("reporttype", "")).replace(" ", "").upper()
+        with self._lock:
+            self.events += 1
+            current = self.orders.get(oid)
+            if current is None:
+                if report and report not in FIRST_REPORTS:
+                    # We missed this order's earlier events
+                    self.gap = True
+                current = {"order_id": oid}
+                self.orders[oid] = current
+            elif not self._allowed(current, update):
+                self.ignored += 1
+                return current
+            current.update(update)
+            status = current.get("order_status")
+            if status == "OPEN" and _filled(current) > 0:
+                current["order_status"] = "PARTIALLY_FILLED"
+            self.seq += 1
+            current["seq"] = self.seq
+            current["updated"] = time.time()
+            return current
+
+    @staticmethod
+    def _allowed(current, update):
+        # Terminal orders never reopen and filled quantity never goes backwards
+        if current.get("order_status") in TERMINAL:
+            return False
+        if "filled_qty" in update and _filled(update) < _filled(current):
+            return False
+        return True
+
+    def resync(self, headers, reconnect_count=None):
+        data = api_request("GET", "/orders", headers)
+        if data.get("status") == "ERROR":
+            return False
+        orders = data.get("orders") or []
+        with self._lock:
+            fresh = {}
+            for o in orders:
+                o = dict(o)
+                o["order_status"] = norm_status(o.get("order_status", ""))
+                existing = self.orders.get(o.get("order_id"))
+                # An event that arrived after the REST snapshot was taken may be newer
+                if existing and existing.get("order_status") in TERMINAL and o["order_status"] not in TERMINAL:
+                    o = existing
+                fresh[o.get("order_id")] = o
+            self.orders = fresh
+            self.seq += 1
+            self.gap = False
+            self.synced_at = time.time()
+            self.synced_reconnects = reconnect_count
+            self.resync_count += 1
+        return True
+
+    def needs_resync(self, reconnect_count=None):
+        # Events can be missed while the feed is down, so a reconnect is a gap too
+        return self.gap or (reconnect_count is not None and reconnect_count != self.synced_reconnects)
+
+    def get(self, order_id):
+        return self.orders.get(order_id)
+
+    def all(self):
+        with self._lock:
+            return [dict(o) for o in self.orders.values()]
+
+    def open_orders(self):
+        return [o for o in self.all() if o.get("order_status") in OPEN_STATUSES]
+
+    def stats(self):
+        return {
+            "orders": len(self.orders),
+            "seq": self.seq,
+            "events": self.events,
+            "ignored": self.ignored,
+            "resyncs": self.resync_count,
+            "synced_at": self.synced_at,
+        }
@@ -1,14 +1,14 @@
 import streamlit as st
 import pandas as pd
 from utils import integrate_get
+from live_feed import get_order_book
 
 def app():
     st.header("Order Book & Trade Book")
 
     st.subheader("Order Book")
     try:
-        data = integrate_get("/orders")
-        orders = data.get("orders", [])
+        orders = get_order_book()
         if orders:
             st.dataframe(pd.DataFrame(orders))
         else:
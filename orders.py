@@ -1,7 +1,11 @@
 import streamlit as st
-from utils import integrate_post
+from utils import integrate_post, get_session_headers
 import requests
 import pandas as pd
+from live_feed import get_live_book
+from order_dispatch import ENTRY
+from security_info import get_security_cache, validate_order
+from order_slicer import place_sliced, needs_slicing, slice_quantity
 
 @st.cache_data
 def load_master_symbols():
@@ -13,13 +17,13 @@ def load_master_symbols():
             "unknown2", "unknown3", "series2", "unknown4", "unknown5", "unknown6",
             "isin", "unknown7", "company"
         ]
-        df = df[["symbol", "series", "segment"]]
+        df = df[["symbol", "series", "segment", "token"]]
     else:
         df.columns = [
             "segment", "token", "symbol", "instrument", "series", "isin1",
             "facevalue", "lot", "something", "zero1", "two1", "one1", "isin", "one2"
         ]
-        df = df[["symbol", "series", "segment"]]
+        df = df[["symbol", "series", "segment", "token"]]
     # Only EQ & BE series, and only NSE/BSE stocks (not derivatives, indices)
     df = df[df["series"].isin(["EQ", "BE"])]
     df = df[df["segment"].isin(["NSE", "BSE"])]
@@ -90,11 +94,33 @@ def app():
 
     api_session_key = st.secrets.get("integrate_api_session_key", "")
 
+    # Prefer live depth from the running feed; fall back to a REST quote
     ltp = 0.0
-    if tradingsymbol and exchange:
+    book = get_live_book(exchange, str(selected_row["token"])) if tradingsymbol and exchange else None
+    if book is not None:
+        ltp = book.ltp
+        default_price = book.best_ask if order_type == "BUY" else book.best_bid
+        st.caption(
+            f"Live depth — Bid: ₹{book.best_bid:.2f} | Ask: ₹{book.best_ask:.2f} | "
+            f"Spread: {book.spread():.2f} | Imbalance: {book.imbalance():+.2f}"
+        )
+    elif tradingsymbol and exchange:
         ltp = get_ltp(tradingsymbol, exchange, api_session_key)
+        default_price = ltp
+    else:
+        default_price = 0.0
+
+    # Tick/lot/freeze/circuits from the per-day security cache (no network call)
+    info = get_security_cache().get(exchange, selected_row["token"])
+    tick = info.tick_size if info else 0.05
+    if info is not None:
+        band = info.circuits()
+        st.caption(
+            f"Tick: {tick} | Lot: {info.lot_size} | Freeze Qty: {info.freeze_qty or '-'} | "
+            f"Circuit: {f'₹{band[0]:.2f} - ₹{band[1]:.2f}' if band else '-'}"
+        )
 
-    price = st.number_input("Price", min_value=0.0, value=ltp if ltp > 0 else 0.0, step=0.05, key="order_pr", format="%.2f")
+    price = st.number_input("Price", min_value=0.0, value=default_price if default_price > 0 else 0.0, step=tick, key="order_pr", format="%.2f")
 
     colQ, colA, colT, colD, colAMO = st.columns([2,2,2,2,2], gap="large")
 
@@ -122,6 +148,11 @@ def app():
 
     st.markdown('</div>', unsafe_allow_html=True)
 
+    will_slice = needs_slicing(qty, info)
+    if will_slice:
+        n_children = len(slice_quantity(qty, info.freeze_qty, info.lot_size))
+        st.info(f"Quantity is at or above the freeze limit ({info.freeze_qty}); it will be sent as {n_children} child orders.")
+
     # Preview summary
     if tradingsymbol and qty and order_type and price_type:
         st.markdown('<div class="order-summary">', unsafe_allow_html=True)
@@ -166,7 +197,18 @@ def app():
         if amo:
             data["amo"] = "Yes"
 
-        resp = integrate_post("/placeorder", data)
+        problems = validate_order(info, int(qty), float(data.get("price", 0)), float(data.get("trigger_price", 0)),
+                                  allow_slicing=True)
+        if problems:
+            for problem in problems:
+                st.error(problem)
+            return
+        if will_slice:
+            parent = place_sliced(data, get_session_headers(), info)
+            st.success(f"Parent {parent.parent_id}: {len(parent.children)} child orders — {parent.status}")
+            st.dataframe(parent.children, use_container_width=True)
+            return
+        resp = integrate_post("/placeorder", data, priority=ENTRY)
         st.success("Order submitted!")
         st.json(resp)
 
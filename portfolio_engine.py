@@ -0,0 +1,269 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from utils import api_get_many
+from stop_rules import INITIAL_SL_PCT, TRAIL_STEPS, trailing_stop
+from records import get_book
+from candle_store import IST
+from datetime import datetime
+
+RELOAD_TTL = 300  # holdings/positions are refetched at most this often
+ENGINE_SESSION = "portfolio_engine"  # interest id on the live feed
+PREV_CLOSE_WORKERS = 8
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def trailing_levels(entry, change_pct):
+    # Vectorized stop_rules.trailing_stop: (stop, status) arrays
+    stop = np.round(entry * INITIAL_SL_PCT, 2)
+    status = np.full(len(entry), "Initial SL", dtype=object)
+    for gain, multiple, label in sorted(TRAIL_STEPS):
+        hit = change_pct >= gain  # NaN (no price) never hits
+        stop = np.where(hit, np.round(entry * multiple, 2), stop)
+        status[hit] = label
+    return stop, status
+
+class PositionTable:
+    # Day positions normalized into columnar arrays (one row per exchange/token/product).
+    # Unrealized P&L is vectorized on load and updated per row on a tick like holdings.
+    NUMERIC = ("qty", "entry", "ltp", "realized", "unrealized")
+
+    def __init__(self):
+        self.keys = []
+        self.rows = {}  # (exchange, token) -> [row, ...] (one per product)
+        self.symbol = np.array([], dtype=object)
+        self.product = np.array([], dtype=object)
+        for name in self.NUMERIC:
+            setattr(self, name, np.zeros(0))
+
+    def load(self, positions, prices):
+        self.keys = [(p.exchange, p.token) for p in positions]
+        self.rows = {}
+        for i, key in enumerate(self.keys):
+            self.rows.setdefault(key, []).append(i)
+        self.symbol = np.array([p.tradingsymbol for p in positions], dtype=object)
+        self.product = np.array([p.product_type for p in positions], dtype=object)
+        self.qty = np.array([p.net_qty for p in positions], dtype=float)
+        self.entry = np.array([p.entry_price for p in positions], dtype=float)
+        # Broker last price until the feed or a quote has a fresher one
+        self.ltp = np.array([_float(prices.get(k)) or p.last_price for k, p in zip(self.keys, positions)], dtype=float)
+        self.realized = np.array([p.realized_pnl for p in positions], dtype=float)
+        self.unrealized = np.where((self.qty != 0) & (self.ltp > 0) & (self.entry > 0),
+                                   (self.ltp - self.entry) * self.qty, 0.0)
+
+    def update_price(self, key, ltp):
+        # Returns the change in unrealized P&L
+        delta = 0.0
+        for i in self.rows.get(key, ()):
+            self.ltp[i] = ltp
+            new = (ltp - self.entry[i]) * self.qty[i] if self.qty[i] and self.entry[i] > 0 else 0.0
+            delta += new - self.unrealized[i]
+            self.unrealized[i] = new
+        return delta
+
+    def frame(self):
+        return pd.DataFrame({
+            "Symbol": self.symbol, "Exchange": [e for e, _ in self.keys], "Token": [t for _, t in self.keys],
+            "Product": self.product, "Net Qty": self.qty, "Avg Price": self.entry, "LTP": self.ltp,
+            "Realized P&L": self.realized, "Unrealized P&L": self.unrealized,
+        })
+
+class PortfolioEngine:
+    # Holdings and positions normalized once into columnar arrays (one row per token). Metrics
+    # are computed vectorized on load; a price tick updates one row and the totals only.
+    # totals["realized"] is the day's realized P&L over all positions; totals["position_pnl"]
+    # is the unrealized P&L of open positions in tokens that are not holdings (e.g. intraday).
+    NUMERIC = ("qty", "entry", "ltp", "prev_close", "realized", "invested", "mark", "current",
+               "today_pnl", "pnl", "change_pct", "today_pct", "stop", "open_risk")
+    TOTALS = ("invested", "current", "today_pnl", "pnl", "open_risk")
+
+    def __init__(self):
+        self.keys = []
+        self.index = {}  # (exchange, token) -> row
+        self.symbol = np.array([], dtype=object)
+        self.exchange = np.array([], dtype=object)
+        self.extra = []  # raw display fields per row (ISIN, product, pledge...)
+        for name in self.NUMERIC:
+            setattr(self, name, np.zeros(0))
+        self.status = np.array([], dtype=object)
+        self.positions = PositionTable()
+        self.totals = dict.fromkeys(self.TOTALS + ("realized", "position_pnl"), 0.0)
+        self.prev_closes = {}  # (exchange, token) -> prev close, kept for the trading day
+        self.prev_day = None
+        self.loaded_at = 0.0
+        self.version = 0
+        self.ticks = 0
+        self._lock = threading.Lock()
+
+    def load(self, holdings, positions=(), prices=None):
+        # holdings/positions: decoded records; prices: {(exchange, token): ltp}
+        realized = {}
+        for p in positions:
+            key = (p.exchange.upper(), p.token)
+            realized[key] = realized.get(key, 0.0) + p.realized_pnl
+        keys = [(h.exchange, h.token) for h in holdings]
+        symbols = [h.tradingsymbol for h in holdings]
+        exchanges = [h.exchange for h in holdings]
+        extra = [{"ISIN": h.isin, "Product": h.product, "DP Free Qty": h.dp_free_qty, "Pledge Qty": h.pledge_qty,
+                  "Collateral Qty": h.collateral_qty, "T1 Qty": h.t1_qty} for h in holdings]
+        qty = [h.quantity for h in holdings]
+        entry = [h.avg_price for h in holdings]
+        prices = prices or {}
+        with self._lock:
+            self.keys = keys
+            self.index = {k: i for i, k in enumerate(keys)}
+            self.symbol = np.array(symbols, dtype=object)
+            self.exchange = np.array(exchanges, dtype=object)
+            self.extra = extra
+            self.qty = np.array(qty, dtype=float)
+            self.entry = np.array(entry, dtype=float)
+            self.ltp = np.array([_float(prices.get(k)) for k in keys], dtype=float)
+            self.prev_close = np.array([_float(self.prev_closes.get(k)) for k in keys], dtype=float)
+            self.realized = np.array([realized.get((e.upper(), t), 0.0) for e, t in keys], dtype=float)
+            self.positions.load(list(positions), prices)
+            self._compute()
+            self.loaded_at = time.time()
+            self.version += 1
+
+    def _compute(self):
+        # Full vectorized pass; the price falls back to the previous close when there is no LTP
+        self.invested = self.qty * self.entry
+        self.mark = np.where(self.ltp > 0, self.ltp, self.prev_close)
+        priced = self.mark > 0
+        self.current = np.where(priced, self.qty * self.mark, 0.0)
+        self.pnl = np.where(priced & (self.entry > 0), (self.mark - self.entry) * self.qty, 0.0)
+        has_prev = (self.prev_close > 0) & priced
+        self.today_pnl = np.where(has_prev, (self.mark - self.prev_close) * self.qty, 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.today_pct = np.where(has_prev, (self.mark - self.prev_close) / self.prev_close * 100, 0.0)
+            self.change_pct = np.where(priced & (self.entry > 0), (self.mark - self.entry) / self.entry * 100, np.nan)
+        self.stop, self.status = trailing_levels(self.entry, self.change_pct)
+        self.open_risk = (self.stop - self.entry) * self.qty
+        for name in self.TOTALS:
+            self.totals[name] = float(getattr(self, name).sum())
+        self.totals["realized"] = float(self.positions.realized.sum())
+        self.totals["position_pnl"] = float(self.positions.unrealized[self._position_only()].sum())
+
+    def _position_only(self):
+        # Position rows whose token is not a holding; a holding's P&L is already in "pnl"
+        return np.array([k not in self.index for k in self.positions.keys], dtype=bool)
+
+    def _row_values(self, i):
+        return [getattr(self, name)[i] for name in self.TOTALS]
+
+    def update_price(self, exchange, token, ltp, prev_close=None):
+        # One row recomputed in place; totals adjusted by the row's delta
+        key = (exchange, str(token))
+        i = self.index.get(key)
+        if not ltp or ltp <= 0:
+            return False
+        if i is None:
+            if key not in self.positions.rows:
+                return False
+            with self._lock:
+                self.totals["position_pnl"] += float(self.positions.update_price(key, ltp))
+                self.version += 1
+                self.ticks += 1
+            return True
+        with self._lock:
+            self.positions.update_price(key, ltp)
+            if ltp == self.ltp[i] and (prev_close is None or prev_close == self.prev_close[i]):
+                return False
+            before = self._row_values(i)
+            self.ltp[i] = ltp
+            if prev_close and prev_close > 0:
+                self.prev_close[i] = prev_close
+            qty, entry, prev = self.qty[i], self.entry[i], self.prev_close[i]
+            self.mark[i] = ltp
+            self.current[i] = qty * ltp
+            self.pnl[i] = (ltp - entry) * qty if entry > 0 else 0.0
+            self.today_pnl[i] = (ltp - prev) * qty if prev > 0 else 0.0
+            self.today_pct[i] = (ltp - prev) / prev * 100 if prev > 0 else 0.0
+            self.change_pct[i] = (ltp - entry) / entry * 100 if entry > 0 else np.nan
+            if entry > 0:
+                self.stop[i], self.status[i], _ = trailing_stop(entry, ltp)
+            self.open_risk[i] = (self.stop[i] - entry) * qty
+            for name, old in zip(self.TOTALS, before):
+                self.totals[name] += float(getattr(self, name)[i] - old)
+            self.version += 1
+            self.ticks += 1
+        return True
+
+    def on_touchline(self, snap):
+        key = (snap.e, snap.tk)
+        if key in self.index or key in self.positions.rows:
+            self.update_price(snap.e, snap.tk, snap.lp, snap.c)
+
+    def load_prev_closes(self, fetch, pairs=None):
+        # fetch(exchange, token) -> prev close; fetched concurrently, once per trading day
+        day = datetime.now(IST).strftime("%Y-%m-%d")
+        if self.prev_day != day:
+            self.prev_closes, self.prev_day = {}, day
+        todo = [k for k in (pairs or self.keys) if k[1] and k not in self.prev_closes]
+        if todo:
+            with ThreadPoolExecutor(max_workers=PREV_CLOSE_WORKERS) as pool:
+                for key, value in zip(todo, pool.map(lambda k: fetch(*k), todo)):
+                    self.prev_closes[key] = _float(value)
+
+    def frame(self):
+        with self._lock:
+            df = pd.DataFrame({
+                "Symbol": self.symbol, "Exchange": self.exchange,
+                "Token": [t for _, t in self.keys],
+                "Qty": self.qty, "Entry": self.entry, "LTP": self.ltp, "Prev Close": self.prev_close,
+                "Invested": self.invested, "Current Value": self.current,
+                "Today % Chg": self.today_pct, "Today P&L": self.today_pnl,
+                "P&L": self.pnl, "Change %": np.round(self.change_pct, 2), "Realized P&L": self.realized,
+                "Status": self.status, "Stop Loss": self.stop, "Open Risk": self.open_risk,
+            })
+            extra = pd.DataFrame(self.extra, index=df.index) if self.extra else pd.DataFrame(index=df.index)
+        return pd.concat([df, extra], axis=1)
+
+    def position_frame(self):
+        with self._lock:
+            return self.positions.frame()
+
+    def feed_scrips(self):
+        keys = self.keys + [k for k in self.positions.keys if k not in self.index]
+        return [f"{e}|{t}" for e, t in dict.fromkeys(keys) if t]
+
+    def stale(self):
+        return time.time() - self.loaded_at > RELOAD_TTL
+
+def fetch_book(headers, force=False):
+    # Decoded holdings/positions (shared book) and quotes for every holding, fetched concurrently
+    book = get_book(headers, force=force)
+    pairs = [(h.exchange, h.token) for h in book["holdings"] if h.token]
+    pairs += [(p.exchange, p.token) for p in book["positions"] if p.token and p.net_qty]
+    pairs = list(dict.fromkeys(pairs))
+    quotes = api_get_many([f"/quotes/{e}/{t}" for e, t in pairs], headers)
+    prices = {(e, t): _float(quotes.get(f"/quotes/{e}/{t}", {}).get("ltp")) for e, t in pairs}
+    return book["holdings"], book["positions"], prices
+
+# One engine per account, process-wide, fed by the shared live feed when it is running
+engines = {}
+
+def get_portfolio(actid, headers, prev_close_fn=None, feed=None, force=False):
+    engine = engines.get(actid)
+    if engine is None:
+        engine = engines[actid] = PortfolioEngine()
+    reloaded = force or engine.stale()
+    if reloaded:
+        holdings, positions, prices = fetch_book(headers, force=force)
+        if prev_close_fn:
+            engine.load_prev_closes(prev_close_fn, [(h.exchange, h.token) for h in holdings if h.token])
+        engine.load(holdings, positions, prices)
+    if feed is not None and feed.is_running():
+        # The feed may have started (or pruned our interest) after the last load; subscribe is idempotent
+        feed.bus.subscribe("touchline", engine.on_touchline)
+        if reloaded or ENGINE_SESSION not in feed.interest:
+            feed.set_interest(ENGINE_SESSION, touchline=engine.feed_scrips())
+        else:
+            feed.touch(ENGINE_SESSION)
+    return engine
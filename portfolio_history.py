@@ -0,0 +1,210 @@
+import glob
+import os
+import threading
+import time
+from datetime import datetime, date
+import pandas as pd
+from candle_store import IST
+from scheduler import get_scheduler
+
+# Parquet (columnar, column projection on read) when pyarrow is installed, CSV otherwise
+try:
+    import pyarrow  # noqa: F401
+    FORMAT = "parquet"
+except ImportError:
+    FORMAT = "csv"
+
+# Append-only store of portfolio snapshots, one partition per day:
+#   portfolio_history/<actid>/<table>/date=YYYY-MM-DD/<HHMMSS>.<fmt>
+# "totals" has one row per snapshot, "holdings" one row per holding per snapshot.
+# Each snapshot is a new part file; compact() folds a finished day into day.<fmt>.
+HISTORY_DIR = "portfolio_history"
+TABLES = ("totals", "holdings")
+INTRADAY_INTERVAL = 300
+MARKET_OPEN = "09:15"
+MARKET_CLOSE = "15:30"
+DAILY_AT = "15:35"
+
+def _day_dir(actid, table, day, base_dir=HISTORY_DIR):
+    return os.path.join(base_dir, str(actid), table, f"date={day}")
+
+def _write(df, path):
+    tmp = path + ".tmp"
+    if FORMAT == "parquet":
+        df.to_parquet(tmp, index=False)
+    else:
+        df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+
+def _read(paths, columns=None):
+    frames = []
+    for path in paths:
+        if path.endswith(".parquet"):
+            frames.append(pd.read_parquet(path, columns=columns))
+        else:
+            frames.append(pd.read_csv(path, usecols=columns))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns or [])
+
+def snapshot_frames(engine, kind, capital, ts=None):
+    # (totals row, per-holding rows) from a PortfolioEngine
+    ts = int(ts or time.time())
+    df = engine.frame()
+    holdings = pd.DataFrame({
+        "ts": ts, "kind": kind,
+        "instrument_id": [f"{e}|{t}" for e, t in engine.keys],
+        "symbol": df["Symbol"], "qty": df["Qty"], "price": df["LTP"].where(df["LTP"] > 0, df["Prev Close"]),
+        "invested": df["Invested"], "value": df["Current Value"], "pnl": df["P&L"], "today_pnl": df["Today P&L"],
+    })
+    t = engine.totals
+    totals = pd.DataFrame([{
+        "ts": ts, "kind": kind, "capital": float(capital), "invested": t["invested"], "value": t["current"],
+        "pnl": t["pnl"], "today_pnl": t["today_pnl"], "realized": t["realized"], "position_pnl": t["position_pnl"],
+        "open_risk": t["open_risk"], "holdings": len(engine.keys),
+    }])
+    return totals, holdings
+
+def append_snapshot(actid, totals, holdings, base_dir=HISTORY_DIR):
+    day = datetime.fromtimestamp(int(totals["ts"].iloc[0]), IST)
+    name = f"{day.strftime('%H%M%S')}_{totals['kind'].iloc[0]}.{FORMAT}"
+    for table, df in (("totals", totals), ("holdings", holdings)):
+        folder = _day_dir(actid, table, day.strftime("%Y-%m-%d"), base_dir)
+        os.makedirs(folder, exist_ok=True)
+        _write(df, os.path.join(folder, name))
+
+def compact(actid, day, base_dir=HISTORY_DIR):
+    # Fold a day's part files into one file per table (parts are removed only after the write)
+    for table in TABLES:
+        folder = _day_dir(actid, table, day, base_dir)
+        parts = sorted(p for p in glob.glob(os.path.join(folder, "*.*")) if not p.endswith(".tmp"))
+        if len(parts) <= 1:
+            continue
+        df = _read(parts).sort_values("ts").drop_duplicates()
+        target = os.path.join(folder, f"day.{FORMAT}")
+        _write(df, target)
+        for p in parts:
+            if p != target:
+                os.remove(p)
+
+def _partitions(actid, table, start=None, end=None, base_dir=HISTORY_DIR):
+    # Partition pruning: only day folders inside [start, end] are opened
+    root = os.path.join(base_dir, str(actid), table)
+    if not os.path.isdir(root):
+        return []
+    days = sorted(d[5:] for d in os.listdir(root) if d.startswith("date="))
+    start = str(start) if start else None
+    end = str(end) if end else None
+    return [os.path.join(root, f"date={d}") for d in days if (not start or d >= start) and (not end or d <= end)]
+
+def query(actid, table="totals", start=None, end=None, kind=None, columns=None, base_dir=HISTORY_DIR):
+    # start/end: date or "YYYY-MM-DD" (inclusive). Returns rows sorted by time with a "time" column (IST).
+    paths = []
+    for folder in _partitions(actid, table, start, end, base_dir):
+        paths += sorted(p for p in glob.glob(os.path.join(folder, "*.*")) if not p.endswith(".tmp"))
+    cols = None if columns is None else list(dict.fromkeys(["ts", "kind"] + list(columns)))
+    df = _read(paths, cols)
+    if df.empty:
+        return df
+    if kind:
+        df = df[df["kind"] == kind]
+    df = df.sort_values("ts").reset_index(drop=True)
+    df["time"] = pd.to_datetime(df["ts"], unit="s", utc=True).dt.tz_convert(IST)
+    return df
+
+def equity_curve(totals):
+    # Equity = capital + unrealised P&L (holdings and open positions) + realized P&L to date;
+    # drawdown from the running peak; exposure = invested / capital.
+    # The book's realized P&L restarts every trading day, so each earlier day's last value is
+    # carried forward. Snapshots from before these columns existed count as zero.
+    df = totals.reindex(columns=["time", "capital", "invested", "value", "pnl", "realized", "position_pnl"]).copy()
+    df[["realized", "position_pnl"]] = df[["realized", "position_pnl"]].fillna(0.0)
+    day = df["time"].dt.date
+    day_realized = df.groupby(day)["realized"].last()
+    carried = day_realized.cumsum().shift(fill_value=0.0)
+    df["realized_to_date"] = df["realized"] + day.map(carried).to_numpy()
+    df["equity"] = df["capital"] + df["pnl"] + df["position_pnl"] + df["realized_to_date"]
+    peak = df["equity"].cummax()
+    df["drawdown_pct"] = (df["equity"] / peak - 1) * 100
+    df["exposure_pct"] = df["invested"] / df["capital"].where(df["capital"] > 0) * 100
+    return df
+
+class HistoryRecorder:
+    # Scheduled job: an intraday snapshot every INTRADAY_INTERVAL during market hours and
+    # one "daily" snapshot after the close, which also compacts the day's parts
+    def __init__(self, actid, headers, capital, interval=INTRADAY_INTERVAL):
+        self.actid = actid
+        self.headers = headers
+        self.capital = capital
+        self.interval = interval
+        self.last_intraday = 0.0
+        self.last_daily = None
+        self.snapshots = 0
+        self.last_error = None
+        self._busy = False
+        self._job = None
+
+    def snapshot(self, kind="intraday"):
+        from portfolio_engine import get_portfolio
+        from holdings import get_prev_close  # same previous-close source as the Holdings page
+        api_key = self.headers.get("Authorization", "")
+        engine = get_portfolio(self.actid, self.headers, prev_close_fn=lambda e, t: get_prev_close(e, t, api_key),
+                               force=True)
+        totals, holdings = snapshot_frames(engine, kind, self.capital)
+        append_snapshot(self.actid, totals, holdings)
+        self.snapshots += 1
+        return totals
+
+    def tick(self):
+        # Runs on the scheduler thread: decide, then hand the work to a thread
+        if self._busy:
+            return
+        now = datetime.now(IST)
+        hhmm = now.strftime("%H:%M")
+        today = now.strftime("%Y-%m-%d")
+        work = None
+        if now.weekday() < 5 and MARKET_OPEN <= hhmm <= MARKET_CLOSE and time.time() - self.last_intraday >= self.interval:
+            self.last_intraday = time.time()
+            work = "intraday"
+        elif now.weekday() < 5 and hhmm >= DAILY_AT and self.last_daily != today:
+            self.last_daily = today
+            work = "daily"
+        if work:
+            self._busy = True
+            threading.Thread(target=self._run, args=(work, today), name="portfolio_history", daemon=True).start()
+
+    def _run(self, kind, today):
+        try:
+            self.snapshot(kind)
+            if kind == "daily":
+                compact(self.actid, today)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Portfolio history snapshot failed: {e}")
+        finally:
+            self._busy = False
+
+    def start(self):
+        self._job = get_scheduler().call_every(30, self.tick, name="portfolio_history", initial_delay=1)
+
+    def stop(self):
+        if self._job:
+            self._job.cancel()
+
+# One recorder per account, process-wide so reruns don't duplicate it
+recorders = {}
+
+def start_recorder(actid, headers, capital):
+    recorder = recorders.get(actid)
+    if recorder is None:
+        recorder = recorders[actid] = HistoryRecorder(actid, headers, capital)
+        recorder.start()
+    return recorder
+
+def stop_recorder(actid):
+    recorder = recorders.pop(actid, None)
+    if recorder:
+        recorder.stop()
+
+def default_range(days=90):
+    today = date.today()
+    return today.fromordinal(today.toordinal() - days), today
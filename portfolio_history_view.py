@@ -0,0 +1,78 @@
+import streamlit as st
+import plotly.graph_objs as go
+from utils import get_session_headers
+from holdings import TOTAL_CAPITAL
+from portfolio_history import (query, equity_curve, default_range, recorders, start_recorder, stop_recorder,
+                               HistoryRecorder, FORMAT)
+
+def _line(df, columns, title, height=300):
+    fig = go.Figure()
+    for col in columns:
+        fig.add_trace(go.Scatter(x=df["time"], y=df[col], mode="lines", name=col))
+    fig.update_layout(title=title, height=height, margin=dict(t=40, b=20))
+    return fig
+
+def app():
+    st.header("Portfolio History — Equity, Drawdown, Exposure")
+    headers = get_session_headers()
+    actid = headers.get("actid")
+    if not actid:
+        st.error("Not logged in.")
+        return
+
+    recorder = recorders.get(actid)
+    c1, c2, c3 = st.columns(3)
+    if recorder is None:
+        if c1.button("Start Snapshot Recorder"):
+            start_recorder(actid, headers, TOTAL_CAPITAL)
+            st.rerun()
+    else:
+        if c1.button("Stop Snapshot Recorder"):
+            stop_recorder(actid)
+            st.rerun()
+        c3.caption(f"Recorder on: {recorder.snapshots} snapshots this process"
+                   + (f" — last error: {recorder.last_error}" if recorder.last_error else ""))
+    if c2.button("Snapshot Now"):
+        with st.spinner("Taking snapshot..."):
+            try:
+                (recorder or HistoryRecorder(actid, headers, TOTAL_CAPITAL)).snapshot("intraday")
+                st.success("Snapshot stored.")
+            except Exception as e:
+                st.error(f"Snapshot failed: {e}")
+    st.caption(f"Stored locally as {FORMAT}, one partition per day. Intraday every 5 min in market hours, daily after close. "
+               "The recorder starts with the app once logged in. Equity includes realized P&L from the position book.")
+
+    start, end = default_range()
+    c1, c2, c3 = st.columns(3)
+    start = c1.date_input("From", start)
+    end = c2.date_input("To", end)
+    granularity = c3.radio("Granularity", ["Daily", "Intraday"], horizontal=True)
+
+    totals = query(actid, "totals", start, end)
+    if totals.empty:
+        st.info("No snapshots in this range yet.")
+        return
+    if granularity == "Daily":
+        # Last snapshot of each day (the post-close "daily" one when it exists)
+        totals = totals.groupby(totals["time"].dt.date).tail(1).reset_index(drop=True)
+    curve = equity_curve(totals)
+
+    last = curve.iloc[-1]
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Equity", f"₹{last['equity']:,.0f}")
+    m2.metric("Max Drawdown", f"{curve['drawdown_pct'].min():.2f}%")
+    m3.metric("Current Drawdown", f"{last['drawdown_pct']:.2f}%")
+    m4.metric("Exposure", f"{last['exposure_pct']:.1f}%")
+
+    st.plotly_chart(_line(curve, ["equity"], "Equity Curve"), use_container_width=True)
+    st.plotly_chart(_line(curve, ["drawdown_pct"], "Drawdown %", 240), use_container_width=True)
+    st.plotly_chart(_line(curve, ["invested", "value"], "Exposure — Invested vs Market Value"), use_container_width=True)
+
+    with st.expander("Per-holding history"):
+        rows = query(actid, "holdings", start, end, columns=["symbol", "value", "pnl"])
+        if rows.empty:
+            st.info("No holding rows in this range.")
+        else:
+            symbol = st.selectbox("Symbol", sorted(rows["symbol"].unique()))
+            sel = rows[rows["symbol"] == symbol]
+            st.plotly_chart(_line(sel, ["value", "pnl"], f"{symbol} — Value and P&L"), use_container_width=True)
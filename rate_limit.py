@@ -0,0 +1,43 @@
+import threading
+import time
+
+# Broker order endpoints allow roughly 10 requests per second per account
+ORDER_RATE = 10
+ORDER_BURST = 10
+
+class TokenBucket:
+    # Thread-safe token bucket: acquire() blocks until a token is free or the deadline passes
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, deadline=None):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def refund(self):
+        # Give back a token that was taken but not used
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + 1)
+
+_order_bucket = TokenBucket(ORDER_RATE, ORDER_BURST)
+
+def order_bucket():
+    # Shared by every order/cancel/modify call in the process
+    return _order_bucket
@@ -0,0 +1,159 @@
+import sys
+import threading
+import time
+from utils import api_get_many
+from security_info import get_security_cache
+
+# One decoding path for broker holding and position payloads. Records are slotted with
+# fixed fields; symbol, exchange and instrument id strings are interned so the many
+# copies across pages, engines and jobs share one object each.
+
+BOOK_TTL = 15  # seconds a decoded book is shared before it is fetched again
+
+_intern = sys.intern
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _first(d, keys, default=None):
+    for k in keys:
+        v = d.get(k)
+        if v not in (None, "", [], {}, "null"):
+            return v
+    return default
+
+def resolve_token(exchange, tradingsymbol):
+    info = get_security_cache().get_by_symbol(exchange, tradingsymbol) if tradingsymbol else None
+    return info.token if info else ""
+
+def instrument_id(exchange, token, tradingsymbol=""):
+    # "NSE|22", the same scrip key the live feed uses ("NSE|SYMBOL" if the token is unknown)
+    return _intern(f"{exchange}|{token or tradingsymbol}")
+
+class Listing:
+    __slots__ = ("exchange", "token", "tradingsymbol", "tick_size")
+
+    def __init__(self, d):
+        self.exchange = _intern(str(d.get("exchange") or "NSE"))
+        self.token = str(d.get("token") or "")
+        self.tradingsymbol = _intern(str(d.get("tradingsymbol") or "N/A"))
+        self.tick_size = _float(d.get("ticksize")) or 0.05
+
+class HoldingRecord:
+    __slots__ = ("instrument_id", "exchange", "token", "tradingsymbol", "isin", "listings",
+                 "dp_qty", "t1_qty", "quantity", "avg_price", "product", "haircut",
+                 "dp_free_qty", "pledge_qty", "collateral_qty", "tick_size")
+
+    def __init__(self, h):
+        ts = h.get("tradingsymbol")
+        if isinstance(ts, dict):
+            ts = [ts]
+        elif not isinstance(ts, list):
+            ts = [{"tradingsymbol": ts}] if ts else []
+        self.listings = tuple(Listing(s if isinstance(s, dict) else {"tradingsymbol": s}) for s in ts)
+        # The NSE listing is the one traded and protected; else the first one
+        main = next((s for s in self.listings if s.exchange == "NSE"), None) or \
+            (self.listings[0] if self.listings else Listing({"exchange": h.get("exchange")}))
+        self.exchange = main.exchange
+        self.tradingsymbol = main.tradingsymbol
+        self.token = main.token or resolve_token(main.exchange, main.tradingsymbol)
+        self.instrument_id = instrument_id(main.exchange, self.token, main.tradingsymbol)
+        self.tick_size = main.tick_size
+        self.isin = h.get("isin") or next((s.get("isin") for s in ts if isinstance(s, dict) and s.get("isin")), "")
+        self.dp_qty = int(_float(h.get("dp_qty")))
+        self.t1_qty = int(_float(h.get("t1_qty")))
+        self.quantity = self.dp_qty + self.t1_qty
+        self.avg_price = _float(_first(h, ("avg_buy_price", "average_price", "buy_avg_price"), 0))
+        self.product = _intern(str(h.get("product") or "CNC"))
+        self.haircut = _float(h.get("haircut"))
+        self.dp_free_qty = int(_float(h.get("dp_free_qty")))
+        self.pledge_qty = int(_float(h.get("pledge_qty")))
+        self.collateral_qty = int(_float(h.get("collateral_qty")))
+
+    def listing(self, exchange):
+        return next((s for s in self.listings if s.exchange == exchange), None)
+
+    @property
+    def sellable_qty(self):
+        # Quantity orders may sell or protect: the DP quantity, or the T1 quantity while none has
+        # settled yet (the rule auto_order always used). quantity (dp + t1) is for valuation only.
+        return self.dp_qty or self.t1_qty
+
+class PositionRecord:
+    __slots__ = ("instrument_id", "exchange", "token", "tradingsymbol", "isin", "product_type",
+                 "net_qty", "buy_avg", "sell_avg", "net_avg", "last_price", "realized_pnl",
+                 "unrealized_pnl", "tick_size")
+
+    def __init__(self, p):
+        self.exchange = _intern(str(p.get("exchange") or ""))
+        self.tradingsymbol = _intern(str(_first(p, ("tradingsymbol", "symbol"), "")))
+        self.token = str(p.get("token") or "") or resolve_token(self.exchange, self.tradingsymbol)
+        self.instrument_id = instrument_id(self.exchange, self.token, self.tradingsymbol)
+        self.isin = p.get("isin", "")
+        self.product_type = _intern(str(_first(p, ("product_type", "productType", "Product"), "INTRADAY")))
+        self.net_qty = int(_float(_first(p, ("netqty", "net_quantity", "net_qty", "quantity", "Qty"), 0)))
+        self.buy_avg = _float(_first(p, ("day_buy_avg", "total_buy_avg"), 0))
+        self.sell_avg = _float(_first(p, ("day_sell_avg", "total_sell_avg"), 0))
+        self.net_avg = _float(p.get("net_averageprice"))
+        self.last_price = _float(p.get("lastPrice"))
+        self.realized_pnl = _float(p.get("realized_pnl"))
+        self.unrealized_pnl = _float(_first(p, ("unrealized_pnl", "pnl", "Unrealised P&L"), 0))
+        self.tick_size = _float(p.get("ticksize")) or 0.05
+
+    @property
+    def entry_price(self):
+        # Average price of the open side
+        return self.buy_avg if self.net_qty > 0 else self.sell_avg
+
+def decode_holdings(raw):
+    return [HoldingRecord(h) for h in raw or () if isinstance(h, dict)]
+
+def decode_positions(raw):
+    return [PositionRecord(p) for p in raw or () if isinstance(p, dict)]
+
+def holdings_payload(resp):
+    return resp.get("data") or []
+
+def positions_payload(resp):
+    return resp.get("positions") or resp.get("data") or []
+
+class BookCache:
+    # Decoded holdings/positions per account, shared by every page and job for BOOK_TTL
+    def __init__(self):
+        self.books = {}  # actid -> {"holdings", "positions", "fetched", "errors"}
+        self._lock = threading.Lock()
+
+    def get(self, headers, max_age=BOOK_TTL, force=False):
+        actid = headers.get("actid")
+        book = self.books.get(actid)
+        if book is not None and not force and time.time() - book["fetched"] < max_age:
+            return book
+        raw = api_get_many(["/holdings", "/positions"], headers)
+        book = {
+            "holdings": decode_holdings(holdings_payload(raw["/holdings"])),
+            "positions": decode_positions(positions_payload(raw["/positions"])),
+            "errors": {p: r.get("message") for p, r in raw.items() if r.get("status") == "ERROR"},
+            "fetched": time.time(),
+        }
+        if not book["errors"]:
+            with self._lock:
+                self.books[actid] = book
+        return book
+
+    def invalidate(self, actid=None):
+        with self._lock:
+            if actid is None:
+                self.books.clear()
+            else:
+                self.books.pop(actid, None)
+
+_books = BookCache()
+
+def get_book(headers, max_age=BOOK_TTL, force=False):
+    return _books.get(headers, max_age=max_age, force=force)
+
+def invalidate_book(actid=None):
+    _books.invalidate(actid)
@@ -0,0 +1,129 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+from candle_store import load_candles
+from daily_candles import ensure_daily, today as _today
+
+# Portfolio risk from daily closes in the local candle store (timeframe "day").
+# Returns for all holdings and the benchmark are aligned into one matrix once per
+# trading day; beta, correlation, VaR and risk contributions are matrix operations on it.
+BENCHMARK = ("NSE", "26004")  # Nifty 500
+LOOKBACK = 250  # trading days of returns
+MIN_OBS = 20  # holdings with fewer returns are left out of the matrix
+Z = {95: 1.6449, 99: 2.3263}
+
+_lock = threading.Lock()
+_matrices = {}  # (day, pairs) -> (dates, returns, benchmark, columns)
+
+def load_returns(pairs, lookback=LOOKBACK, loader=load_candles):
+    # (dates, R [days x holdings], b [days], columns) aligned on the benchmark's sessions.
+    # A holding missing a session gets a zero return for it; short histories are dropped.
+    key = (_today(), tuple(pairs), lookback)
+    cached = _matrices.get(key)
+    if cached is not None:
+        return cached
+    closes = {}
+    for pair in [BENCHMARK] + list(pairs):
+        df = loader(pair[0], pair[1], "day")
+        if not df.empty:
+            closes[pair] = pd.Series(df["Close"].values, index=df["Date"].dt.normalize())
+    if BENCHMARK not in closes:
+        raise ValueError("No stored daily candles for the benchmark (Nifty 500)")
+    frame = pd.DataFrame(closes)
+    frame = frame[frame[BENCHMARK].notna()].sort_index()
+    frame = frame[frame.index.strftime("%Y-%m-%d") < _today()]
+    rets = frame.pct_change(fill_method=None).iloc[1:].tail(lookback)
+    columns = [p for p in pairs if p in rets and rets[p].notna().sum() >= MIN_OBS]
+    R = np.nan_to_num(rets[columns].to_numpy(dtype=float)) if columns else np.zeros((len(rets), 0))
+    b = rets[BENCHMARK].to_numpy(dtype=float)
+    result = (rets.index, R, b, columns)
+    with _lock:
+        if len(_matrices) > 32:
+            _matrices.clear()
+        _matrices[key] = result
+    return result
+
+def risk_metrics(R, b, values, confidence=95):
+    # R: returns [days x n], b: benchmark returns [days], values: position values [n]
+    values = np.asarray(values, dtype=float)
+    total = values.sum()
+    w = values / total if total else np.zeros_like(values)
+    n_days = R.shape[0]
+    Rc = R - R.mean(axis=0)
+    bc = b - b.mean()
+    b_var = bc @ bc
+    beta = Rc.T @ bc / b_var if b_var else np.full(R.shape[1], np.nan)
+    cov = Rc.T @ Rc / max(n_days - 1, 1)
+    std = np.sqrt(np.diag(cov))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cov / np.outer(std, std)
+    port = R @ w
+    sigma = float(np.sqrt(w @ cov @ w))
+    # Marginal contribution to risk (d sigma / d w) and each holding's share of portfolio sigma
+    mcr = cov @ w / sigma if sigma else np.zeros_like(w)
+    ccr = w * mcr
+    tail = 100 - confidence
+    return {
+        "beta": beta,
+        "corr": corr,
+        "volatility": std * np.sqrt(252),
+        "weights": w,
+        "mcr": mcr,
+        "risk_share": ccr / sigma if sigma else np.zeros_like(w),
+        "portfolio_beta": float(w @ beta) if b_var else float("nan"),
+        "portfolio_vol": sigma * np.sqrt(252),
+        "hist_var": float(-np.percentile(port, tail) * total) if n_days else 0.0,
+        "param_var": float((Z[confidence] * sigma - port.mean()) * total),
+        "total": float(total),
+        "days": n_days,
+        "confidence": confidence,
+    }
+
+# Results keyed by trading day, holdings and rounded values, so page reruns are dictionary lookups
+_results = {}
+
+def portfolio_risk(pairs, symbols, values, api_key="", confidence=95):
+    # pairs: [(exchange, token)] per holding, aligned with symbols/values
+    if api_key:
+        ensure_daily([p for p in pairs if p[1]] + [BENCHMARK], api_key)
+    key = (_today(), tuple(pairs), tuple(np.round(np.asarray(values, dtype=float), -2)), confidence)
+    cached = _results.get(key)
+    if cached is not None:
+        return cached
+    start = time.perf_counter()
+    dates, R, b, columns = load_returns(pairs)
+    index = {p: i for i, p in enumerate(pairs)}
+    rows = [index[p] for p in columns]
+    m = risk_metrics(R, b, np.asarray(values, dtype=float)[rows], confidence)
+    names = [symbols[i] for i in rows]
+    m["table"] = pd.DataFrame({
+        "Symbol": names, "Weight %": m["weights"] * 100, "Beta": m["beta"],
+        "Ann. Vol %": m["volatility"] * 100, "Risk Share %": m["risk_share"] * 100,
+        "MCR %": m["mcr"] * 100,
+    }).round(2)
+    m["corr"] = pd.DataFrame(m["corr"], index=names, columns=names)
+    m["missing"] = [symbols[i] for i, p in enumerate(pairs) if p not in set(columns)]
+    m["start"], m["end"] = (dates[0], dates[-1]) if len(dates) else (None, None)
+    m["elapsed_ms"] = (time.perf_counter() - start) * 1000
+    with _lock:
+        if len(_results) > 64:
+            _results.clear()
+        _results[key] = m
+    return m
+
+if __name__ == "__main__":
+    # Timing check on a synthetic 50-stock book
+    rng = np.random.default_rng(7)
+    days, n = LOOKBACK, 50
+    market = rng.normal(0.0005, 0.01, days)
+    betas = rng.uniform(0.5, 1.5, n)
+    R = market[:, None] * betas + rng.normal(0, 0.012, (days, n))
+    values = rng.uniform(20000, 80000, n)
+    start = time.perf_counter()
+    for _ in range(100):
+        m = risk_metrics(R, market, values)
+    print(f"risk_metrics x{n}: {(time.perf_counter() - start) * 10:.3f} ms/call")
+    print(f"beta error max {np.abs(m['beta'] - betas).max():.3f}, portfolio beta {m['portfolio_beta']:.2f}")
+    print(f"VaR95 hist {m['hist_var']:,.0f} param {m['param_var']:,.0f} on {m['total']:,.0f}")
+    print(f"risk shares sum to {m['risk_share'].sum():.6f}")
@@ -0,0 +1,178 @@
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from candle_store import IST
+from master_loader import load_watchlist
+from definedge_batch_scan import (scan_symbol, fetch_candles_definedge, get_time_range, get_nifty500_row,
+                                  WATCHLIST_FILES)
+
+# Headless batch scan: the same per-symbol logic as the Batch Symbol Scanner page, run
+# concurrently from the command line (e.g. cron after the close). Each run writes
+#   scan_results/scan_<YYYYmmdd_HHMMSS>.<parquet|json>  (matches)
+#   scan_results/scan_<YYYYmmdd_HHMMSS>.meta.json      (parameters and timing stats)
+# and the page loads the newest one.
+RESULTS_DIR = "scan_results"
+DEFAULT_WORKERS = 8
+
+try:
+    import pyarrow  # noqa: F401
+    DEFAULT_FORMAT = "parquet"
+except ImportError:
+    DEFAULT_FORMAT = "json"
+
+def fetch_nifty500(api_key, days):
+    row = get_nifty500_row(load_watchlist("master.csv"))
+    if row is None:
+        return None, "'Nifty 500' symbol not found in master.csv."
+    from_dt, to_dt = get_time_range(days)
+    try:
+        df = fetch_candles_definedge(row["segment"], row["token"], "day", from_dt, to_dt, api_key)
+        return df, "" if not df.empty else "Nifty 500 candle data empty."
+    except Exception as e:
+        return None, str(e)
+
+def run_scan(watchlist_df, api_key, params, workers=DEFAULT_WORKERS, nifty_df=None, progress=None):
+    # Returns (matches DataFrame, stats). Per-symbol time covers the candle fetch and indicators.
+    # Workers only scan; progress(done, total) is called from this (the calling) thread, so it
+    # can safely update Streamlit elements.
+    rows = [row for _, row in watchlist_df.iterrows()]
+    timings = [0.0] * len(rows)
+    result = [None] * len(rows)
+    errors = {}
+
+    def scan(i):
+        start = time.perf_counter()
+        try:
+            return scan_symbol(rows[i], api_key, nifty_df=nifty_df, **params), None
+        except Exception as e:
+            return None, str(e)[:200]
+        finally:
+            timings[i] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(scan, i): i for i in range(len(rows))}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            result[i], error = future.result()
+            if error:
+                errors[str(rows[i]["symbol"])] = error
+            if progress:
+                progress(done, len(rows))
+    elapsed = time.perf_counter() - start
+    matches = pd.DataFrame([r for r in result if r])
+    arr = np.array(timings) if timings else np.zeros(1)
+    stats = {
+        "symbols": len(rows),
+        "matched": len(matches),
+        "errors": len(errors),
+        "error_samples": dict(list(errors.items())[:20]),
+        "workers": workers,
+        "elapsed_s": round(elapsed, 2),
+        "symbols_per_s": round(len(rows) / elapsed, 1) if elapsed else None,
+        "symbol_p50_ms": round(float(np.percentile(arr, 50)), 1),
+        "symbol_p99_ms": round(float(np.percentile(arr, 99)), 1),
+        "symbol_max_ms": round(float(arr.max()), 1),
+    }
+    return matches, stats
+
+def save_results(matches, meta, fmt=DEFAULT_FORMAT, out_dir=RESULTS_DIR):
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = datetime.now(IST).strftime("%Y%m%d_%H%M%S")
+    base = os.path.join(out_dir, f"scan_{stamp}")
+    # RS_Score is "" when unavailable; keep the column numeric for Parquet
+    df = matches.copy()
+    if "RS_Score" in df:
+        df["RS_Score"] = pd.to_numeric(df["RS_Score"], errors="coerce")
+    if "token" in df:
+        df["token"] = df["token"].astype(str)
+    if fmt == "parquet":
+        path = base + ".parquet"
+        df.to_parquet(path, index=False)
+    else:
+        path = base + ".json"
+        df.to_json(path, orient="records", indent=1)
+    meta = dict(meta, created=datetime.now(IST).isoformat(timespec="seconds"), results=os.path.basename(path))
+    # The meta file is written last, so a run only becomes "latest" once its results exist
+    with open(base + ".meta.json", "w") as f:
+        json.dump(meta, f, indent=1, default=str)
+    return path
+
+def load_latest(out_dir=RESULTS_DIR):
+    # (matches DataFrame, meta) for the newest completed run, or (None, None)
+    metas = sorted(glob.glob(os.path.join(out_dir, "scan_*.meta.json")))
+    if not metas:
+        return None, None
+    with open(metas[-1]) as f:
+        meta = json.load(f)
+    path = os.path.join(out_dir, meta["results"])
+    df = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_json(path, orient="records",
+                                                                              dtype={"token": str})
+    return df, meta
+
+def _api_key(arg):
+    if arg:
+        return arg
+    if os.environ.get("INTEGRATE_API_SESSION_KEY"):
+        return os.environ["INTEGRATE_API_SESSION_KEY"]
+    from session_utils import load_session_from_file
+    session = load_session_from_file()
+    return session["api_session_key"] if session else ""
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the batch symbol scan headless and save the matches")
+    parser.add_argument("--watchlist", default="master.csv", help=f"watchlist/master file, e.g. {', '.join(WATCHLIST_FILES[:3])}")
+    parser.add_argument("--days", type=int, default=120, help="lookback days of daily candles")
+    parser.add_argument("--ema-ltp", type=float, default=0.95, help="20EMA / LTP threshold")
+    parser.add_argument("--ema-ratio", type=float, default=0.95, help="50EMA / 20EMA threshold")
+    parser.add_argument("--rsi", type=float, default=None, help="enable the RSI scan with this threshold")
+    parser.add_argument("--rsi-direction", choices=["Above", "Below"], default="Above")
+    parser.add_argument("--ema-condition", choices=["Price above 20EMA", "Price below 20EMA", "20EMA above 50EMA",
+                                                    "20EMA below 50EMA"], help="enable the EMA scan")
+    parser.add_argument("--no-rs", action="store_true", help="skip relative strength vs Nifty 500")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="concurrent candle fetches")
+    parser.add_argument("--format", choices=["parquet", "json"], default=DEFAULT_FORMAT)
+    parser.add_argument("--out-dir", default=RESULTS_DIR)
+    parser.add_argument("--api-key", help="history API key (default: $INTEGRATE_API_SESSION_KEY or session.json)")
+    parser.add_argument("--from-table", action="store_true",
+                        help="filter the post-close feature table (universe_precompute) instead of fetching candles")
+    args = parser.parse_args()
+
+    params = {"days": args.days, "ema_ltp_thr": args.ema_ltp, "ema_ratio_thr": args.ema_ratio,
+              "rsi_enabled": args.rsi is not None, "rsi_threshold": args.rsi, "rsi_direction": args.rsi_direction,
+              "ema_scan_enabled": args.ema_condition is not None,
+              "ema_condition": args.ema_condition or "Price above 20EMA", "show_rs": not args.no_rs}
+    watchlist = load_watchlist(args.watchlist)
+    if args.from_table:
+        from universe_precompute import load_features
+        from definedge_batch_scan import scan_features
+        features, features_meta = load_features()
+        if features is None:
+            raise SystemExit("No feature table yet: run `python universe_precompute.py` first.")
+        start = time.perf_counter()
+        matches = scan_features(features, watchlist, **params)
+        stats = {"symbols": len(watchlist), "matched": len(matches), "errors": 0, "workers": 0,
+                 "elapsed_s": round(time.perf_counter() - start, 3), "source": "feature table",
+                 "session": features_meta.get("session")}
+    else:
+        api_key = _api_key(args.api_key)
+        if not api_key:
+            raise SystemExit("No API key: pass --api-key, set INTEGRATE_API_SESSION_KEY or log in through the dashboard.")
+        nifty_df, nifty_error = fetch_nifty500(api_key, args.days) if params["show_rs"] else (None, "")
+        if nifty_error:
+            print(f"Relative strength unavailable: {nifty_error}")
+        matches, stats = run_scan(watchlist, api_key, params, workers=args.workers, nifty_df=nifty_df)
+    path = save_results(matches, {"watchlist": args.watchlist, "params": params, "stats": stats}, args.format,
+                        args.out_dir)
+    if args.from_table:
+        print(f"{stats['matched']}/{stats['symbols']} matched from the feature table "
+              f"(session {stats['session']}) in {stats['elapsed_s']} s -> {path}")
+    else:
+        print(f"{stats['matched']}/{stats['symbols']} matched, {stats['errors']} errors in {stats['elapsed_s']} s "
+              f"({stats['symbols_per_s']}/s, p50 {stats['symbol_p50_ms']} ms, p99 {stats['symbol_p99_ms']} ms) -> {path}")
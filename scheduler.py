@@ -0,0 +1,93 @@
+import heapq
+import itertools
+import threading
+import time
+
+# One process-wide timer thread for heartbeats, idle checks and other
+# periodic jobs. Jobs run on the scheduler thread, so they must be short and
+# must not block (hand long work off to another thread).
+
+class Job:
+    __slots__ = ("fn", "interval", "next_run", "name", "cancelled", "runs")
+
+    def __init__(self, fn, interval, next_run, name):
+        self.fn = fn
+        self.interval = interval
+        self.next_run = next_run
+        self.name = name
+        self.cancelled = False
+        self.runs = 0
+
+    def cancel(self):
+        self.cancelled = True
+
+class Scheduler:
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self.wakeups = 0
+        self.errors = 0
+
+    def _push(self, job):
+        with self._cond:
+            heapq.heappush(self._heap, (job.next_run, next(self._seq), job))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return job
+
+    def call_later(self, delay, fn, name=None):
+        return self._push(Job(fn, None, time.monotonic() + delay, name or getattr(fn, "__name__", "job")))
+
+    def call_every(self, interval, fn, name=None, initial_delay=None):
+        first = interval if initial_delay is None else initial_delay
+        return self._push(Job(fn, interval, time.monotonic() + first, name or getattr(fn, "__name__", "job")))
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                next_run, _, job = self._heap[0]
+                if job.cancelled:
+                    heapq.heappop(self._heap)
+                    continue
+                delay = next_run - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    self.wakeups += 1
+                    continue
+                heapq.heappop(self._heap)
+            try:
+                job.fn()
+            except Exception as e:
+                self.errors += 1
+                print(f"Scheduler job {job.name} error: {e}")
+            job.runs += 1
+            if job.interval and not job.cancelled:
+                # Skip missed runs instead of firing them back to back
+                job.next_run = max(job.next_run + job.interval, time.monotonic())
+                self._push(job)
+
+    def stats(self):
+        with self._cond:
+            active = [job for _, _, job in self._heap if not job.cancelled]
+        return {
+            "jobs": len(active),
+            "wakeups": self.wakeups,
+            "errors": self.errors,
+            "threads": threading.active_count(),
+        }
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
@@ -0,0 +1,273 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from utils import api_get_many
+from candle_store import IST
+
+SECINFO_DIR = "secinfo"
+MASTER_FILE = "master.csv"
+WATCHLIST_FILES = ["watchlist_1.csv", "watchlist_2.csv", "watchlist_3.csv", "watchlist_4.csv",
+                   "watchlist_5.csv", "watchlist_6.csv", "watchlist_7.csv"]
+WATCHLIST_WARM_LIMIT = 500  # skip very large watchlists when warming at session start
+FETCH_WORKERS = 8
+
+FIELDS = ("exchange", "token", "tradingsymbol", "tick_size", "lot_size", "freeze_qty",
+          "lower_circuit", "upper_circuit", "last_price", "var_margin", "elm_margin", "fetched")
+
+def trading_day():
+    return datetime.now(IST).strftime("%Y-%m-%d")
+
+def cache_path(day=None):
+    return os.path.join(SECINFO_DIR, f"{day or trading_day()}.json")
+
+def _float(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+class SecurityInfo:
+    __slots__ = FIELDS
+
+    def __init__(self, exchange, token, **kwargs):
+        self.exchange = exchange
+        self.token = str(token)
+        self.tradingsymbol = kwargs.get("tradingsymbol", "")
+        self.tick_size = kwargs.get("tick_size", 0.05)
+        self.lot_size = kwargs.get("lot_size", 1)
+        self.freeze_qty = kwargs.get("freeze_qty", 0)
+        self.lower_circuit = kwargs.get("lower_circuit", 0.0)
+        self.upper_circuit = kwargs.get("upper_circuit", 0.0)
+        self.last_price = kwargs.get("last_price", 0.0)  # LTP when fetched; reference price for estimates
+        self.var_margin = kwargs.get("var_margin", 0.0)
+        self.elm_margin = kwargs.get("elm_margin", 0.0)
+        self.fetched = kwargs.get("fetched", False)  # True once circuits/freeze came from the broker
+
+    def circuits(self):
+        if self.lower_circuit > 0 and self.upper_circuit > 0:
+            return self.lower_circuit, self.upper_circuit
+        return None
+
+    def within_circuit(self, price):
+        band = self.circuits()
+        return band is None or band[0] <= price <= band[1]
+
+    def snap(self, price):
+        tick = self.tick_size or 0.05
+        return round(round(price / tick) * tick, 2)
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in FIELDS}
+
+class SecurityInfoCache:
+    # Per trading day table of tick/lot/freeze/circuit data keyed by (exchange, token),
+    # seeded from master.csv, completed from the broker in bulk and kept on disk
+    def __init__(self):
+        self.day = None
+        self.table = {}
+        self.by_symbol = {}
+        self.fetch_count = 0
+        self._rollover = 0.0  # epoch of the next IST midnight
+        self._lock = threading.Lock()
+
+    def _ensure_day(self):
+        if time.time() < self._rollover:
+            return
+        with self._lock:
+            day = trading_day()
+            if self.day != day:
+                self.table = {}
+                self.by_symbol = {}
+                self._load_master()
+                self._load_disk(day)
+                self.day = day
+            now = datetime.now(IST)
+            midnight = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+            self._rollover = time.time() + (midnight - now).total_seconds()
+
+    def _add(self, info):
+        key = (info.exchange, info.token)
+        self.table[key] = info
+        if info.tradingsymbol:
+            self.by_symbol[(info.exchange, info.tradingsymbol)] = key
+
+    def _load_master(self):
+        # Tick size (in paise, scaled by price precision) and lot size are static master data
+        if not os.path.exists(MASTER_FILE):
+            return
+        with open(MASTER_FILE, encoding="utf-8") as f:
+            for line in f:
+                row = line.rstrip("\n").split("\t")
+                if len(row) < 11:
+                    continue
+                precision = int(_float(row[10], 2))
+                tick = _float(row[6]) / (10 ** precision) if precision >= 0 else 0.05
+                self._add(SecurityInfo(row[0], row[1], tradingsymbol=row[3],
+                                       tick_size=tick or 0.05, lot_size=int(_float(row[7], 1)) or 1))
+
+    def _load_disk(self, day):
+        path = cache_path(day)
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path) as f:
+                rows = json.load(f)
+        except (OSError, ValueError):
+            return
+        for row in rows:
+            row = dict(row)
+            self._add(SecurityInfo(row.pop("exchange"), row.pop("token"), **row))
+
+    def save(self):
+        os.makedirs(SECINFO_DIR, exist_ok=True)
+        with self._lock:
+            rows = [info.to_dict() for info in self.table.values() if info.fetched]
+        tmp = cache_path(self.day) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(rows, f)
+        os.replace(tmp, cache_path(self.day))
+
+    def get(self, exchange, token):
+        self._ensure_day()
+        return self.table.get((exchange, str(token)))
+
+    def get_by_symbol(self, exchange, tradingsymbol):
+        self._ensure_day()
+        key = self.by_symbol.get((exchange, tradingsymbol))
+        return self.table.get(key) if key else None
+
+    def tick_size(self, exchange, token, default=0.05):
+        info = self.get(exchange, token)
+        return info.tick_size if info else default
+
+    def lot_size(self, exchange, token, default=1):
+        info = self.get(exchange, token)
+        return info.lot_size if info else default
+
+    def freeze_qty(self, exchange, token):
+        info = self.get(exchange, token)
+        return info.freeze_qty if info else 0
+
+    def circuits(self, exchange, token):
+        info = self.get(exchange, token)
+        return info.circuits() if info else None
+
+    def lookup(self, exchange, token=None, tradingsymbol=None):
+        return (self.get(exchange, token) if token else None) or \
+            (self.get_by_symbol(exchange, tradingsymbol) if tradingsymbol else None)
+
+    def missing(self, pairs):
+        self._ensure_day()
+        return [(e, str(t)) for e, t in dict.fromkeys(pairs)
+                if e and t and not (self.table.get((e, str(t))) and self.table[(e, str(t))].fetched)]
+
+    def warm(self, pairs, headers, workers=FETCH_WORKERS):
+        # Fetch /securityinfo and /quotes concurrently for tokens not cached today
+        todo = self.missing(pairs)
+        if not todo:
+            return 0
+        paths = []
+        for e, t in todo:
+            paths += [f"/securityinfo/{e}/{t}", f"/quotes/{e}/{t}"]
+        responses = api_get_many(paths, headers, max_workers=workers)
+        added = 0
+        with self._lock:
+            for e, t in todo:
+                sec = responses.get(f"/securityinfo/{e}/{t}", {})
+                quote = responses.get(f"/quotes/{e}/{t}", {})
+                if sec.get("status") == "ERROR" and quote.get("status") == "ERROR":
+                    continue
+                old = self.table.get((e, t))
+                # Master tick/lot win: it is the exchange's contract file for the day
+                info = SecurityInfo(
+                    e, t,
+                    tradingsymbol=sec.get("tradingsymbol") or quote.get("tradingsymbol") or (old.tradingsymbol if old else ""),
+                    tick_size=old.tick_size if old else _float(sec.get("ticksize") or quote.get("ticksize"), 0.05),
+                    lot_size=old.lot_size if old else int(_float(sec.get("lotsize") or quote.get("lotsize"), 1)),
+                    freeze_qty=int(_float(sec.get("freeze_qty"))),
+                    lower_circuit=_float(quote.get("lower_circuit")),
+                    upper_circuit=_float(quote.get("upper_circuit")),
+                    last_price=_float(quote.get("ltp")),
+                    var_margin=_float(sec.get("varMargin")),
+                    elm_margin=_float(sec.get("elmMargin")),
+                    fetched=True,
+                )
+                self._add(info)
+                added += 1
+            self.fetch_count += added
+        if added:
+            self.save()
+        return added
+
+    def stats(self):
+        self._ensure_day()
+        return {"day": self.day, "instruments": len(self.table),
+                "fetched": sum(1 for i in self.table.values() if i.fetched), "fetch_count": self.fetch_count}
+
+_cache = SecurityInfoCache()
+
+def validate_order(info, quantity, price=0.0, trigger_price=0.0, allow_slicing=False):
+    # Pre-trade checks against the cached row only (no network); returns a list of problems.
+    # With allow_slicing the freeze limit is left to order_slicer.
+    if info is None:
+        return []
+    problems = []
+    lot = info.lot_size or 1
+    if quantity % lot:
+        problems.append(f"Quantity {quantity} is not a multiple of lot size {lot}")
+    if info.freeze_qty and quantity >= info.freeze_qty and not allow_slicing:
+        problems.append(f"Quantity {quantity} exceeds freeze quantity {info.freeze_qty}")
+    tick = info.tick_size or 0.05
+    for label, value in (("Price", price), ("Trigger price", trigger_price)):
+        if not value:
+            continue
+        if abs(value / tick - round(value / tick)) > 1e-6:
+            problems.append(f"{label} {value} is not a multiple of tick size {tick}")
+        if not info.within_circuit(value):
+            problems.append(f"{label} {value} is outside the circuit band {info.circuits()}")
+    return problems
+
+def get_security_cache():
+    return _cache
+
+def watchlist_pairs(limit=WATCHLIST_WARM_LIMIT):
+    pairs = []
+    for name in WATCHLIST_FILES:
+        if not os.path.exists(name):
+            continue
+        with open(name, encoding="utf-8") as f:
+            rows = [line.split("\t") for line in f if line.strip()]
+        if len(rows) > limit:
+            continue
+        pairs += [(r[0], r[1]) for r in rows if len(r) > 1]
+    return pairs
+
+def book_pairs(holdings, positions):
+    # holdings/positions: decoded records (every listing of a holding is warmed)
+    pairs = [(ts.exchange, ts.token) for h in holdings for ts in h.listings if ts.token]
+    pairs += [(p.exchange, p.token) for p in positions if p.token]
+    return pairs
+
+_warm_started = {}
+
+def warm_for_session(headers, actid, include_watchlists=True):
+    # Once per account and trading day, in the background: held, positioned and watchlisted tokens
+    day = trading_day()
+    if _warm_started.get(actid) == day:
+        return False
+    _warm_started[actid] = day
+
+    def run():
+        from records import get_book  # records imports this module
+        t0 = time.time()
+        book = get_book(headers)
+        pairs = book_pairs(book["holdings"], book["positions"])
+        if include_watchlists:
+            pairs += watchlist_pairs()
+        added = _cache.warm(pairs, headers)
+        print(f"Security info warmed: {added} instruments in {time.time() - t0:.1f}s")
+
+    threading.Thread(target=run, name="secinfo_warm", daemon=True).start()
+    return True
@@ -0,0 +1,378 @@
+import bisect
+import hashlib
+import time
+import threading
+import queue
+import multiprocessing
+from collections import deque
+from websocket_handler import WebSocketHandler
+from touchline import TouchlineBook, NUMERIC_FIELDS
+from depth_book import DepthBooks
+from tick_recorder import TickRecorder
+from scheduler import get_scheduler
+
+METRICS_INTERVAL = 5  # seconds between per-shard rate/lag updates
+BATCH_INTERVAL = 0.005  # process shards ship decoded messages in 5 ms batches
+SHIPPED_FIELDS = frozenset(NUMERIC_FIELDS + ("ts",))
+
+class HashRing:
+    # Consistent hashing of scrips ("NSE|22") onto shard numbers, so adding a
+    # shard only moves about 1/N of the tokens.
+    def __init__(self, shards, vnodes=64):
+        self.shards = shards
+        points = []
+        for shard in range(shards):
+            for v in range(vnodes):
+                points.append((self._hash(f"shard-{shard}-{v}"), shard))
+        points.sort()
+        self._keys = [p[0] for p in points]
+        self._shards = [p[1] for p in points]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def shard_for(self, scrip):
+        i = bisect.bisect(self._keys, self._hash(scrip)) % len(self._keys)
+        return self._shards[i]
+
+    def split(self, scrips):
+        groups = {}
+        for scrip in scrips:
+            groups.setdefault(self.shard_for(scrip), []).append(scrip)
+        return groups
+
+class ShardStats:
+    def __init__(self, shard):
+        self.shard = shard
+        self.messages = 0
+        self.rate = 0.0  # messages/sec over the last METRICS_INTERVAL
+        self.lag = 0.0  # EWMA of receive time - exchange feed time (sec)
+        self._last_messages = 0
+        self._last_time = time.time()
+
+    def on_touchline(self, snap):
+        self.messages += 1
+        if snap.ft:
+            lag = time.time() - snap.ft
+            self.lag = lag if not self.lag else 0.9 * self.lag + 0.1 * lag
+
+    def on_other(self, _item=None):
+        self.messages += 1
+
+    def roll(self):
+        now = time.time()
+        elapsed = now - self._last_time
+        if elapsed > 0:
+            self.rate = (self.messages - self._last_messages) / elapsed
+        self._last_messages = self.messages
+        self._last_time = now
+
+class _MergedBooks:
+    # Read-only view that routes lookups to the shard owning the token
+    def __init__(self, feed, attr):
+        self.feed = feed
+        self.attr = attr
+
+    def get(self, exchange, token):
+        shard = self.feed.shards[self.feed.ring.shard_for(f"{exchange}|{token}")]
+        return getattr(shard, self.attr).get(exchange, token)
+
+    def __len__(self):
+        return sum(len(getattr(s, self.attr)) for s in self.feed.shards)
+
+class ShardedFeed:
+    # Drop-in replacement for WebSocketHandler that spreads subscriptions over
+    # N connections (threads) or N child processes. Every shard publishes into
+    # the same callbacks, i.e. the same TickBus when used from LiveFeed.
+    def __init__(self, uid, actid, ws_session_key, shards=2, use_processes=False,
+                 on_touchline=None, on_depth=None, on_order=None, on_backfill=None, on_reconnect=None,
+                 recorder=None, **handler_kwargs):
+        self.ring = HashRing(shards)
+        self.use_processes = use_processes
+        self.stats = [ShardStats(i) for i in range(shards)]
+        self.on_touchline = on_touchline
+        self.on_depth = on_depth
+        self.on_order = on_order
+        self.shards = []
+        for i in range(shards):
+            stats = self.stats[i]
+            callbacks = dict(
+                on_touchline=self._wrap(stats.on_touchline, on_touchline),
+                on_depth=self._wrap(stats.on_other, on_depth),
+                on_order=self._wrap(stats.on_other, on_order),
+                on_backfill=on_backfill,
+                on_reconnect=on_reconnect,
+            )
+            # Each shard records into its own log under the recorder's directory and closes
+            # it on its own disconnect, so no shard closes a file another one is writing
+            record_dir = f"{recorder.base_dir}/shard{i}" if recorder is not None else None
+            if use_processes:
+                shard = ProcessShard(i, uid, actid, ws_session_key, record_dir=record_dir,
+                                     handler_kwargs=handler_kwargs, **callbacks)
+            else:
+                shard_recorder = TickRecorder(record_dir, recorder.flush_interval) if record_dir else None
+                shard = WebSocketHandler(uid, actid, ws_session_key, recorder=shard_recorder,
+                                         **callbacks, **handler_kwargs)
+            self.shards.append(shard)
+        self.touchlines = _MergedBooks(self, "touchlines")
+        self.depth_books = _MergedBooks(self, "depth_books")
+        self._stats_job = None
+
+    @staticmethod
+    def _wrap(stat_fn, callback):
+        def handle(item):
+            stat_fn(item)
+            if callback:
+                callback(item)
+        return handle
+
+    @property
+    def subscribed_touchline(self):
+        return set().union(*(s.subscribed_touchline for s in self.shards))
+
+    @property
+    def subscribed_depth(self):
+        return set().union(*(s.subscribed_depth for s in self.shards))
+
+    @property
+    def order_subscribed(self):
+        # Order updates are account-wide, so only shard 0 carries them
+        return self.shards[0].order_subscribed
+
+    def connect(self):
+        for shard in self.shards:
+            shard.connect()
+        self._stats_job = get_scheduler().call_every(METRICS_INTERVAL, self._roll_stats, name="shard_stats")
+
+    def disconnect(self):
+        if self._stats_job:
+            self._stats_job.cancel()
+            self._stats_job = None
+        for shard in self.shards:
+            shard.disconnect()
+
+    def _roll_stats(self):
+        for stats in self.stats:
+            stats.roll()
+
+    def subscribe_touchline(self, scriplist):
+        for shard, group in self.ring.split(scriplist).items():
+            self.shards[shard].subscribe_touchline(group)
+
+    def unsubscribe_touchline(self, scriplist):
+        for shard, group in self.ring.split(scriplist).items():
+            self.shards[shard].unsubscribe_touchline(group)
+
+    def subscribe_depth(self, scriplist):
+        for shard, group in self.ring.split(scriplist).items():
+            self.shards[shard].subscribe_depth(group)
+
+    def unsubscribe_depth(self, scriplist):
+        for shard, group in self.ring.split(scriplist).items():
+            self.shards[shard].unsubscribe_depth(group)
+
+    def subscribe_order_update(self):
+        self.shards[0].subscribe_order_update()
+
+    def unsubscribe_order_update(self):
+        self.shards[0].unsubscribe_order_update()
+
+    def change_decision_interval(self, seconds):
+        for shard in self.shards:
+            shard.change_decision_interval(seconds)
+
+    def shard_metrics(self):
+        rows = []
+        for shard, stats in zip(self.shards, self.stats):
+            m = shard.get_metrics()
+            rows.append({
+                "shard": stats.shard,
+                "connected": m.get("connected", False),
+                "tokens": len(shard.subscribed_touchline),
+                "messages": stats.messages,
+                "msg_per_sec": round(stats.rate, 1),
+                "lag_ms": round(stats.lag * 1000, 1),
+                "reconnects": m.get("reconnect_count", 0),
+            })
+        return rows
+
+    def get_metrics(self):
+        per_shard = [s.get_metrics() for s in self.shards]
+        return {
+            "connected": all(m.get("connected", False) for m in per_shard),
+            "reconnect_count": sum(m.get("reconnect_count", 0) for m in per_shard),
+            "reconnect_attempt": max(m.get("reconnect_attempt", 0) for m in per_shard),
+            "total_downtime_sec": round(sum(m.get("total_downtime_sec", 0) for m in per_shard), 2),
+            "last_downtime_sec": max(m.get("last_downtime_sec", 0) for m in per_shard),
+            "backfill_count": sum(m.get("backfill_count", 0) for m in per_shard),
+            "message_count": sum(s.messages for s in self.stats),
+            "shards": self.shard_metrics(),
+        }
+
+class _DeltaBook(TouchlineBook):
+    # Child-side touchline book: merges every message here and queues only the fields the
+    # message carried (already converted), so the parent applies a few setattrs per tick
+    def __init__(self, out):
+        super().__init__()
+        self.out = out
+
+    def apply(self, data, now=None):
+        snap = super().apply(data, now)
+        fields = {k: getattr(snap, k) for k in data if k in SHIPPED_FIELDS}
+        fields["ft"] = snap.ft  # merge() may set it from the receive time
+        self.out.append(("tf", (snap.e, snap.tk, fields, snap.updated)))
+        return snap
+
+def _shard_worker(shard, uid, actid, ws_session_key, record_dir, handler_kwargs, cmd_q, out_q):
+    # Runs in a child process: owns one connection, decodes and merges messages,
+    # and ships the changed fields to the parent in small batches.
+    buffer = deque()
+    handler = WebSocketHandler(
+        uid, actid, ws_session_key,
+        on_depth=lambda book: buffer.append(("df", book.to_message())),
+        on_order=lambda data: buffer.append(("om", data)),
+        on_backfill=lambda scrip, bars: buffer.append(("backfill", (scrip, bars))),
+        on_reconnect=lambda scrips: buffer.append(("reconnect", scrips)),
+        recorder=TickRecorder(record_dir) if record_dir else None,
+        **handler_kwargs
+    )
+    handler.touchlines = _DeltaBook(buffer)
+    handler.connect()
+    last_metrics = 0.0
+    while True:
+        try:
+            cmd, arg = cmd_q.get(timeout=BATCH_INTERVAL)
+            if cmd == "stop":
+                break
+            getattr(handler, cmd)(*arg)
+        except queue.Empty:
+            pass
+        batch = []
+        while buffer:
+            batch.append(buffer.popleft())
+        now = time.time()
+        if now - last_metrics >= 1:
+            batch.append(("metrics", handler.get_metrics()))
+            last_metrics = now
+        if batch:
+            out_q.put(batch)
+    handler.disconnect()
+
+class ProcessShard:
+    # Parent-side proxy with the WebSocketHandler subscription API for a child-process shard
+    def __init__(self, shard, uid, actid, ws_session_key, record_dir=None, handler_kwargs=None,
+                 on_touchline=None, on_depth=None, on_order=None, on_backfill=None, on_reconnect=None):
+        self.shard = shard
+        self.args = (uid, actid, ws_session_key, record_dir, handler_kwargs or {})
+        self.on_touchline = on_touchline
+        self.on_depth = on_depth
+        self.on_order = on_order
+        self.on_backfill = on_backfill
+        self.on_reconnect = on_reconnect
+        self.subscribed_touchline = set()
+        self.subscribed_depth = set()
+        self.order_subscribed = False
+        self.touchlines = TouchlineBook()
+        self.depth_books = DepthBooks()
+        self.metrics = {"connected": False}
+        self._ctx = multiprocessing.get_context("spawn")
+        self._cmd_q = None
+        self._out_q = None
+        self._process = None
+        self._stop = threading.Event()
+
+    def connect(self):
+        self._stop.clear()
+        self._cmd_q = self._ctx.Queue()
+        self._out_q = self._ctx.Queue()
+        self._process = self._ctx.Process(
+            target=_shard_worker, args=(self.shard, *self.args, self._cmd_q, self._out_q), daemon=True
+        )
+        self._process.start()
+        threading.Thread(target=self._drain, daemon=True).start()
+        # Replay subscriptions made before connect
+        if self.subscribed_touchline:
+            self._command("subscribe_touchline", sorted(self.subscribed_touchline))
+        if self.subscribed_depth:
+            self._command("subscribe_depth", sorted(self.subscribed_depth))
+        if self.order_subscribed:
+            self._cmd_q.put(("subscribe_order_update", ()))
+
+    def disconnect(self):
+        self._stop.set()
+        if self._cmd_q:
+            self._cmd_q.put(("stop", ()))
+        if self._process:
+            self._process.join(timeout=5)
+        self.metrics = {"connected": False}
+
+    def _command(self, name, scrips):
+        if self._cmd_q:
+            self._cmd_q.put((name, (scrips,)))
+
+    def _drain(self):
+        while not self._stop.is_set():
+            try:
+                batch = self._out_q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            for kind, item in batch:
+                try:
+                    if kind == "tf":
+                        snap = self.touchlines.apply_fields(*item)
+                        if self.on_touchline:
+                            self.on_touchline(snap)
+                    elif kind == "df":
+                        book = self.depth_books.apply(item)
+                        if self.on_depth:
+                            self.on_depth(book)
+                    elif kind == "om":
+                        if self.on_order:
+                            self.on_order(item)
+                    elif kind == "backfill":
+                        if self.on_backfill:
+                            self.on_backfill(*item)
+                    elif kind == "reconnect":
+                        # Queued ahead of the resubscribed ticks, so the order is kept
+                        if self.on_reconnect:
+                            self.on_reconnect(item)
+                    elif kind == "metrics":
+                        self.metrics = item
+                except Exception as e:
+                    print(f"Shard {self.shard} dispatch error: {e}")
+
+    def get_metrics(self):
+        return dict(self.metrics)
+
+    def subscribe_touchline(self, scriplist):
+        self.subscribed_touchline.update(scriplist)
+        self._command("subscribe_touchline", list(scriplist))
+
+    def unsubscribe_touchline(self, scriplist):
+        self.subscribed_touchline.difference_update(scriplist)
+        self._command("unsubscribe_touchline", list(scriplist))
+
+    def subscribe_depth(self, scriplist):
+        self.subscribed_depth.update(scriplist)
+        self._command("subscribe_depth", list(scriplist))
+
+    def unsubscribe_depth(self, scriplist):
+        self.subscribed_depth.difference_update(scriplist)
+        self._command("unsubscribe_depth", list(scriplist))
+
+    def subscribe_order_update(self):
+        self.order_subscribed = True
+        if self._cmd_q:
+            self._cmd_q.put(("subscribe_order_update", ()))
+
+    def unsubscribe_order_update(self):
+        self.order_subscribed = False
+        if self._cmd_q:
+            self._cmd_q.put(("unsubscribe_order_update", ()))
+
+    def change_decision_interval(self, seconds):
+        if self._cmd_q:
+            self._cmd_q.put(("change_decision_interval", (seconds,)))
@@ -1,29 +1,19 @@
 import streamlit as st
-from utils import integrate_get, integrate_post
-
-def extract_first_valid(d, keys, default=""):
-    for k in keys:
-        v = d.get(k)
-        if v not in (None, "", [], {}, "null"):
-            return v
-    return default
-
-def extract_qty(pos):
-    for k in ['netqty', 'net_quantity', 'net_qty', 'quantity', 'Qty']:
-        v = pos.get(k)
-        if v is not None and v != "":
-            try:
-                return int(float(v))
-            except Exception:
-                continue
-    return 0
-
-def squareoff_form(item, qty, ts_info, is_position=False):
+from utils import integrate_post, get_session_headers
+from records import get_book, invalidate_book
+from live_feed import get_live_book
+from kill_switch import flatten
+from order_dispatch import EXIT
+from security_info import get_security_cache
+from order_slicer import place_sliced, needs_slicing, slice_quantity
+
+def squareoff_form(rec, qty, is_position=False):
+    # rec: decoded HoldingRecord / PositionRecord
     label = "Position" if is_position else "Holding"
-    unique_id = f"{label}_{ts_info['tradingsymbol']}"
+    unique_id = f"{label}_{rec.tradingsymbol}"
 
     qty_option = st.radio(
-        f"Quantity to Square Off for {ts_info['tradingsymbol']}",
+        f"Quantity to Square Off for {rec.tradingsymbol}",
         ["Full", "Partial"],
         horizontal=True,
         key=f"qtyopt_{unique_id}"
@@ -48,19 +38,15 @@ def squareoff_form(item, qty, ts_info, is_position=False):
     )
 
     # Correct default price for limit orders
-    if is_position:
-        net_qty = extract_qty(item)
-        if net_qty > 0:
-            default_price = float(
-                extract_first_valid(item, ["day_buy_avg", "total_buy_avg"], 0)
-            )
-        else:
-            default_price = float(
-                extract_first_valid(item, ["day_sell_avg", "total_sell_avg"], 0)
-            )
-    else:
-        default_price = float(
-            extract_first_valid(item, ["avg_buy_price", "average_price", "buy_avg_price"], 0)
+    default_price = rec.entry_price if is_position else rec.avg_price
+
+    # Live best bid (the exit is a SELL) beats the average price as a limit default
+    book = get_live_book(rec.exchange, rec.token)
+    if book is not None and book.best_bid > 0:
+        default_price = float(book.best_bid)
+        st.caption(
+            f"Live depth — Bid: ₹{book.best_bid:.2f} | Ask: ₹{book.best_ask:.2f} | "
+            f"Bid size to ₹{book.best_bid:.2f}: {book.cum_size_to(book.best_bid, 'SELL'):.0f}"
         )
 
     if price_option == "Limit Order":
@@ -83,13 +69,19 @@ def squareoff_form(item, qty, ts_info, is_position=False):
     else:
         disclosed_quantity = None
 
+    info = get_security_cache().lookup(rec.exchange, rec.token, rec.tradingsymbol)
+    will_slice = needs_slicing(squareoff_qty, info)
+    if will_slice:
+        n_children = len(slice_quantity(squareoff_qty, info.freeze_qty, info.lot_size))
+        st.caption(f"Above freeze quantity {info.freeze_qty}: will be sent as {n_children} child orders in one go.")
+
     st.markdown("---")
     with st.form(f"squareoff_form_{unique_id}"):
         submitted = st.form_submit_button("🟢 Place Square Off Order")
         if submitted:
             payload = {
-                "exchange": ts_info['exchange'],
-                "tradingsymbol": ts_info["tradingsymbol"],
+                "exchange": rec.exchange,
+                "tradingsymbol": rec.tradingsymbol,
                 "order_type": "SELL",
                 "quantity": str(squareoff_qty),
                 "price": str(squareoff_price),
@@ -102,26 +94,57 @@ def squareoff_form(item, qty, ts_info, is_position=False):
             if disclosed_quantity:
                 payload["disclosed_quantity"] = str(disclosed_quantity)
             with st.spinner("Placing order..."):
-                resp = integrate_post("/placeorder", payload)
-            status = resp.get('status') or resp.get('message') or resp
+                if will_slice:
+                    parent = place_sliced(payload, get_session_headers(), info, priority=EXIT)
+                    failed = [c for c in parent.children if c["status"] in ("REJECTED", "TIMEOUT")]
+                    resp = {"status": "ERROR" if failed else "SUCCESS",
+                            "message": f"{len(parent.children) - len(failed)}/{len(parent.children)} child orders placed"}
+                else:
+                    resp = integrate_post("/placeorder", payload, priority=EXIT)
+            status = resp.get('message') if will_slice else resp.get('status') or resp.get('message') or resp
             if resp.get("status") == "ERROR":
                 st.error(f"Order Failed: {resp.get('message','Error')}")
             else:
                 st.success(f"Order Response: {status}")
+                invalidate_book(get_session_headers().get("actid"))
             st.session_state["sq_id"] = None
             st.session_state["sqp_id"] = None
             st.rerun()
 
+def kill_switch_panel():
+    with st.expander("🛑 Kill Switch — cancel everything and exit at market"):
+        include_holdings = st.checkbox("Also sell delivery holdings", True, key="kill_holdings")
+        confirm = st.checkbox("I understand this cancels all orders/GTTs and places MARKET exits", key="kill_confirm")
+        if st.button("FLATTEN NOW", type="primary", disabled=not confirm):
+            with st.spinner("Flattening..."):
+                st.session_state["kill_report"] = flatten(get_session_headers(), include_holdings=include_holdings)
+            st.session_state.pop("kill_confirm", None)
+            st.rerun()
+        report = st.session_state.get("kill_report")
+        if report:
+            s = report["summary"]
+            st.write(
+                f"Snapshot {report['snapshot_ms']} ms | cancels {report.get('cancel_ms', 0)} ms | legs {report['legs_ms']} ms | "
+                f"**total {report['total_ms']} ms** — {s['ok']}/{s['sent']} legs OK"
+            )
+            for name, msg in report["snapshot_errors"].items():
+                st.error(f"Snapshot of {name} failed: {msg}")
+            if report.get("cancel_failures"):
+                st.warning(f"Cancels not confirmed (their exits may be rejected): {', '.join(report['cancel_failures'])}")
+            if report["legs"]:
+                st.dataframe(report["legs"], use_container_width=True)
+
 def show():
     st.title("⚡ Definedge Integrate Dashboard")
     st.subheader("💼 Square Off Positions & Holdings")
+    kill_switch_panel()
     st.markdown("---")
     # --- Holdings Table ---
     st.header("📦 Holdings")
-    data = integrate_get("/holdings")
-    holdings = data.get("data", [])
+    book = get_book(get_session_headers())
+    for path, message in book["errors"].items():
+        st.error(f"{path} failed: {message}")
 
-    hold_cols = ["tradingsymbol", "exchange", "isin", "dp_qty", "t1_qty", "avg_buy_price", "haircut"]
     col_labels = ["Symbol", "Exch", "ISIN", "DP Qty", "T1 Qty", "Avg Price", "Haircut"]
     st.markdown("#### Holdings List")
     columns = st.columns([1.5, 1.2, 1.5, 1.1, 1.1, 1.2, 1.1, 1.2])
@@ -129,33 +152,26 @@ def show():
         columns[i].markdown(f"**{label}**")
     columns[-1].markdown("**Square Off**")
 
-    user_holdings = []
-    for h in holdings:
-        qty = int(float(h.get("dp_qty", 0) or 0))
-        tradingsymbols = h.get("tradingsymbol", [])
-        if qty > 0 and tradingsymbols and isinstance(tradingsymbols, list):
-            user_holdings.append((h, qty, tradingsymbols))
+    user_holdings = [h for h in book["holdings"] if h.dp_qty > 0 and h.listings]
     if not user_holdings:
         st.info("No holdings to square off.")
     else:
         sq_id = st.session_state.get("sq_id", None)
-        for idx, (holding, qty, tradingsymbols) in enumerate(user_holdings):
-            ts_info = tradingsymbols[0]
+        for idx, holding in enumerate(user_holdings):
             columns = st.columns([1.5, 1.2, 1.5, 1.1, 1.1, 1.2, 1.1, 1.2])
-            for i, key in enumerate(hold_cols):
-                val = ts_info.get(key) if key in ts_info else holding.get(key)
+            col_vals = [holding.tradingsymbol, holding.exchange, holding.isin, holding.dp_qty,
+                        holding.t1_qty, holding.avg_price, holding.haircut]
+            for i, val in enumerate(col_vals):
                 columns[i].write(val)
-            if columns[-1].button("Square Off", key=f"squareoff_btn_{ts_info['tradingsymbol']}"):
+            if columns[-1].button("Square Off", key=f"squareoff_btn_{holding.tradingsymbol}"):
                 st.session_state["sq_id"] = f"HOLD_{idx}"
                 st.session_state["sqp_id"] = None
                 st.rerun()
             if sq_id == f"HOLD_{idx}":
-                squareoff_form(holding, qty, ts_info, is_position=False)
+                squareoff_form(holding, holding.dp_qty, is_position=False)
 
     # --- Positions Table ---
     st.header("📝 Positions")
-    pdata = integrate_get("/positions")
-    positions = pdata.get("positions") or pdata.get("data") or []
 
     col_labels = ["Symbol", "Exch", "Product", "Qty", "Buy Avg", "Sell Avg", "Net Qty", "PnL"]
     st.markdown("#### Positions List")
@@ -164,52 +180,34 @@ def show():
         columns[i].markdown(f"**{label}**")
     columns[-1].markdown("**Square Off**")
 
-    user_positions = []
-    for p in positions:
-        qty = extract_qty(p)
-        if qty != 0:
-            user_positions.append(p)
+    user_positions = [p for p in book["positions"] if p.net_qty != 0]
     sqp_id = st.session_state.get("sqp_id", None)
     if not user_positions:
         st.info("No open positions to square off.")
     else:
         for idx, pos in enumerate(user_positions):
             columns = st.columns([1.5, 1.2, 1.2, 1, 1.2, 1.2, 1, 1.3, 1.2])
-            net_qty = extract_qty(pos)
             # Show correct Buy Avg / Sell Avg based on position side
-            if net_qty > 0:
-                buy_avg = extract_first_valid(pos, ["day_buy_avg", "total_buy_avg"], "-")
-                sell_avg = "-"
-            elif net_qty < 0:
-                buy_avg = "-"
-                sell_avg = extract_first_valid(pos, ["day_sell_avg", "total_sell_avg"], "-")
-            else:
-                buy_avg = "-"
-                sell_avg = "-"
+            buy_avg = pos.buy_avg if pos.net_qty > 0 else "-"
+            sell_avg = pos.sell_avg if pos.net_qty < 0 else "-"
             col_vals = [
-                extract_first_valid(pos, ["tradingsymbol", "symbol"], "-"),
-                extract_first_valid(pos, ["exchange"], "-"),
-                extract_first_valid(pos, ["product_type", "productType", "Product"], "-"),
-                str(net_qty),
+                pos.tradingsymbol or "-",
+                pos.exchange or "-",
+                pos.product_type,
+                str(pos.net_qty),
                 buy_avg,
                 sell_avg,
-                str(net_qty),
-                extract_first_valid(pos, ["pnl", "unrealized_pnl", "Unrealised P&L"], "-"),
+                str(pos.net_qty),
+                pos.unrealized_pnl,
             ]
             for i, val in enumerate(col_vals):
                 columns[i].write(val)
-            if columns[-1].button("Square Off", key=f"squareoff_btn_pos_{extract_first_valid(pos,['tradingsymbol','symbol'],'')}_{idx}"):
+            if columns[-1].button("Square Off", key=f"squareoff_btn_pos_{pos.tradingsymbol}_{idx}"):
                 st.session_state["sqp_id"] = f"POS_{idx}"
                 st.session_state["sq_id"] = None
                 st.rerun()
             if sqp_id == f"POS_{idx}":
-                ts_info = {
-                    "tradingsymbol": extract_first_valid(pos, ["tradingsymbol","symbol"]),
-                    "exchange": extract_first_valid(pos, ["exchange"]),
-                    "isin": extract_first_valid(pos, ["isin"], ""),
-                }
-                qty = abs(extract_qty(pos))
-                squareoff_form(pos, qty, ts_info, is_position=True)
+                squareoff_form(pos, abs(pos.net_qty), is_position=True)
 
 if __name__ == "__main__":
     show()
@@ -0,0 +1,22 @@
+# Trailing stop rules for delivery holdings (shared by Holdings Details,
+# GTT reconciliation and the live trailing-stop engine)
+
+INITIAL_SL_PCT = 0.98
+
+# (gain % reached, SL as multiple of entry, status), checked top-down
+TRAIL_STEPS = (
+    (30, 1.20, "Excellent Profit (SL at Entry +20%)"),
+    (20, 1.10, "Good Profit (SL at Entry +10%)"),
+    (10, 1.00, "Safe (Breakeven SL)"),
+)
+
+def trailing_stop(entry, ltp):
+    # Returns (stop_loss, status, change_pct); change_pct is None without a valid price
+    initial_sl = round(entry * INITIAL_SL_PCT, 2)
+    if not (ltp and ltp > 0 and entry and entry > 0):
+        return initial_sl, "Initial SL", None
+    change_pct = 100 * (ltp - entry) / entry
+    for gain, multiple, status in TRAIL_STEPS:
+        if change_pct >= gain:
+            return round(entry * multiple, 2), status, change_pct
+    return initial_sl, "Initial SL", change_pct
@@ -4,6 +4,8 @@ import numpy as np
 import requests
 import io
 from datetime import datetime, timedelta
+from candle_store import load_candles
+from universe_precompute import lookup as feature_row
 
 @st.cache_data
 def load_master():
@@ -119,11 +121,15 @@ def show():
         st.warning("Symbol-token mapping not found in master file. Try exact symbol or instrument code.")
         return
 
+    # Table row and stored candles only when they are current; otherwise fetch
+    features = feature_row(segment, token, fresh=True)
     try:
-        from_dt, to_dt = get_time_range(420)
-        daily = fetch_candles_definedge(segment, token, "day", from_dt, to_dt, api_key)
+        daily = load_candles(segment, token, "day") if features is not None else pd.DataFrame()
+        if daily.empty:
+            from_dt, to_dt = get_time_range(420)
+            daily = fetch_candles_definedge(segment, token, "day", from_dt, to_dt, api_key)
         week_df = daily.copy().set_index("Date").resample("W").agg({"Open":"first","High":"max","Low":"min","Close":"last","Volume":"sum"}).dropna().reset_index()
-        month_df = daily.copy().set_index("Date").resample("M").agg({"Open":"first","High":"max","Low":"min","Close":"last","Volume":"sum"}).dropna().reset_index()
+        month_df = daily.copy().set_index("Date").resample("ME").agg({"Open":"first","High":"max","Low":"min","Close":"last","Volume":"sum"}).dropna().reset_index()
     except Exception as e:
         st.error(f"Error fetching candles: {e}")
         return
@@ -132,21 +138,30 @@ def show():
     daily["EMA50"] = compute_ema(daily["Close"], 50)
     daily["EMA200"] = compute_ema(daily["Close"], 200)
     daily["RSI"] = compute_rsi(daily["Close"], 14)
-    week_df["RSI"] = compute_rsi(week_df["Close"], 14)
-    month_df["RSI"] = compute_rsi(month_df["Close"], 14)
 
-    ltp = daily["Close"].iloc[-1]
-    ema20 = daily["EMA20"].iloc[-1]
-    ema50 = daily["EMA50"].iloc[-1]
-    ema200 = daily["EMA200"].iloc[-1]
-    rsi_daily = daily["RSI"].dropna().iloc[-1] if daily["RSI"].notna().any() else np.nan
-    rsi_weekly = week_df["RSI"].dropna().iloc[-1] if week_df["RSI"].notna().any() else np.nan
-    rsi_monthly = month_df["RSI"].dropna().iloc[-1] if month_df["RSI"].notna().any() else np.nan
+    if features is not None:
+        # Post-close feature table: no candle fetch or indicator pass needed
+        ltp, ema20, ema50, ema200 = features["LTP"], features["EMA20"], features["EMA50"], features["EMA200"]
+        rsi_daily, rsi_weekly, rsi_monthly = features["RSI14"], features["RSI14_W"], features["RSI14_M"]
+        updays, downdays = int(features["Updays"]), int(features["Downdays"])
+        st.caption(f"From the precomputed feature table, session {pd.Timestamp(features['Date']):%d %b %Y}. "
+                   f"52W high {features['High52W']:.2f} / low {features['Low52W']:.2f}, "
+                   f"RS vs Nifty 500 (6M) {features['RS_6M']:.3f}")
+    else:
+        week_df["RSI"] = compute_rsi(week_df["Close"], 14)
+        month_df["RSI"] = compute_rsi(month_df["Close"], 14)
+        ltp = daily["Close"].iloc[-1]
+        ema20 = daily["EMA20"].iloc[-1]
+        ema50 = daily["EMA50"].iloc[-1]
+        ema200 = daily["EMA200"].iloc[-1]
+        rsi_daily = daily["RSI"].dropna().iloc[-1] if daily["RSI"].notna().any() else np.nan
+        rsi_weekly = week_df["RSI"].dropna().iloc[-1] if week_df["RSI"].notna().any() else np.nan
+        rsi_monthly = month_df["RSI"].dropna().iloc[-1] if month_df["RSI"].notna().any() else np.nan
+        updays = count_updays(daily, 15)
+        downdays = count_downdays(daily, 15)
 
     ema20_ltp = ema20 / ltp if ltp else np.nan
     ema50_ema20 = ema50 / ema20 if ema20 else np.nan
-    updays = count_updays(daily, 15)
-    downdays = count_downdays(daily, 15)
 
     colm = st.columns(3)
     with colm[0]:
@@ -167,7 +182,7 @@ def show():
     st.markdown("#### Recent Daily Candles")
     st.dataframe(daily.tail(15)[["Date", "Open", "High", "Low", "Close", "EMA20", "EMA50", "EMA200", "RSI"]])
 
-    st.info("All data is fetched from Definedge Historical Data API using your master file.")
+    st.info("Data comes from the post-close feature table and local candle store when available, else from the Definedge Historical Data API.")
 
 if __name__ == "__main__":
     show()
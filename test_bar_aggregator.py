@@ -0,0 +1,50 @@
+from datetime import datetime
+from candle_store import ist_to_epoch
+from bar_aggregator import BarAggregator
+
+DAY = datetime(2026, 10, 16)
+SCRIP = "NSE|22"
+
+def at(hh, mm, ss=0):
+    return ist_to_epoch(DAY.replace(hour=hh, minute=mm, second=ss))
+
+def minute(mm, o, h, l, c, v):
+    return (DAY.replace(hour=9, minute=mm), o, h, l, c, v)
+
+def test_reconnect_backfill_counts_outage_volume_once():
+    # The outage's volume comes from the history bars, and the forming bar opens at the earliest price
+    agg = BarAggregator(timeframes=(1, 5), store=False)
+    agg.on_tick(SCRIP, 100.0, 1000.0, at(9, 15, 5))
+    agg.on_tick(SCRIP, 101.0, 1100.0, at(9, 15, 30))
+    agg.on_tick(SCRIP, 102.0, 1200.0, at(9, 16, 10))
+    agg.reset_volume([SCRIP])  # feed drops at 09:16:20 and comes back at 09:19:15
+    agg.on_tick(SCRIP, 110.0, 5000.0, at(9, 19, 20))  # first tick after the reconnect
+    agg.on_tick(SCRIP, 111.0, 5050.0, at(9, 19, 40))
+    agg.backfill(SCRIP, [
+        minute(16, 102.0, 103.0, 101.5, 103.0, 300.0),
+        minute(17, 103.0, 106.0, 103.0, 105.0, 1500.0),
+        minute(18, 105.0, 109.0, 104.0, 108.0, 1500.0),
+        minute(19, 108.0, 110.0, 107.5, 109.5, 600.0),
+    ])
+    agg.flush(at(9, 25))
+    one = agg.get_bars(SCRIP, 1)
+    assert one["Volume"].tolist() == [100.0, 100.0, 1500.0, 1500.0, 650.0]
+    assert one["Open"].tolist()[-1] == 108.0 and one["Close"].tolist()[-1] == 111.0
+    five = agg.get_bars(SCRIP, 5)
+    assert five["Volume"].tolist() == [3850.0]
+    assert five.iloc[0][["Open", "High", "Low", "Close"]].tolist() == [100.0, 111.0, 100.0, 111.0]
+
+def test_bar_opened_after_reconnect_takes_open_from_backfill():
+    # A 5-minute boundary passes during the outage
+    agg = BarAggregator(timeframes=(5,), store=False)
+    agg.on_tick(SCRIP, 200.0, 10.0, at(9, 19, 50))
+    agg.reset_volume([SCRIP])
+    agg.on_tick(SCRIP, 206.0, 900.0, at(9, 22, 15))
+    agg.backfill(SCRIP, [
+        minute(20, 201.0, 204.0, 199.0, 203.0, 400.0),
+        minute(21, 203.0, 207.0, 202.0, 205.0, 390.0),
+    ])
+    agg.flush(at(9, 30))
+    five = agg.get_bars(SCRIP, 5)
+    assert five["Volume"].tolist() == [0.0, 790.0]
+    assert five.iloc[1][["Open", "High", "Low", "Close"]].tolist() == [201.0, 207.0, 199.0, 206.0]
@@ -0,0 +1,37 @@
+from auto_order import oco_payload
+from gtt_reconcile import plan
+
+# A GTT book holding an auto_order OCO: the OCO must survive every trailing sync
+LEG = {"symbol": "ACC-EQ", "exchange": "NSE", "product_type": "CNC", "qty": 10,
+       "entry_price": 2000.0, "tick_size": 0.05}
+OCO = dict(oco_payload(LEG), condition="LMT_OCO", alert_id="OCO1", quantity="10")
+WANT = {"exchange": "NSE", "tradingsymbol": "ACC-EQ", "quantity": 10, "product_type": "CNC", "tick_size": 0.05}
+OCO_STOP = float(OCO["stoploss_price"])
+
+def actions(items):
+    return [(a["action"], a["path"]) for a in items]
+
+def test_oco_stop_at_or_above_desired_is_left_alone():
+    assert plan([dict(WANT, stop=OCO_STOP)], [OCO], ratchet=True) == []
+    assert plan([dict(WANT, stop=OCO_STOP - 50)], [OCO], ratchet=True) == []
+
+def test_higher_stop_modifies_the_oco_stop_leg():
+    higher = plan([dict(WANT, stop=2000.0)], [OCO], ratchet=True)
+    assert actions(higher) == [("modify", "/ocomodify")]
+    payload = higher[0]["payload"]
+    assert payload["alert_id"] == "OCO1" and payload["target_price"] == OCO["target_price"]
+    assert payload["stoploss_price"] == "2000.0"
+    assert (payload["target_quantity"], payload["stoploss_quantity"]) == (OCO["target_quantity"], OCO["stoploss_quantity"])
+
+def test_bare_stop_next_to_oco_is_cancelled():
+    # It would sell the quantity twice
+    bare = {"condition": "LTP_BELOW", "order_type": "SELL", "exchange": "NSE", "tradingsymbol": "ACC-EQ",
+            "alert_id": "G1", "alert_price": "1900", "quantity": "10"}
+    both = plan([dict(WANT, stop=OCO_STOP)], [OCO, bare], ratchet=True)
+    assert actions(both) == [("cancel", "/gttcancel/G1")]
+
+def test_stop_above_oco_target_is_not_pushed():
+    assert plan([dict(WANT, stop=float(OCO["target_price"]) + 10)], [OCO], ratchet=True) == []
+
+def test_bare_stop_placed_without_oco():
+    assert actions(plan([dict(WANT, stop=1960.0)], [], ratchet=True)) == [("place", "/gttplaceorder")]
@@ -0,0 +1,131 @@
+import os
+import glob
+import struct
+import time
+import threading
+import argparse
+from candle_store import epoch_to_ist
+
+# Append-only binary tick log. Each record is
+#   <float64 receive time><uint32 payload length><payload: raw websocket message, UTF-8>
+# and files rotate daily (exchange date): ticks/20250102.tlog
+TICK_DIR = "ticks"
+RECORD_HEADER = struct.Struct("<dI")
+
+def log_path(ts, base_dir=TICK_DIR):
+    return os.path.join(base_dir, epoch_to_ist(ts).strftime("%Y%m%d") + ".tlog")
+
+class TickRecorder:
+    def __init__(self, base_dir=TICK_DIR, flush_interval=1.0):
+        self.base_dir = base_dir
+        self.flush_interval = flush_interval
+        self.records = 0
+        self.bytes_written = 0
+        self._file = None
+        self._path = None
+        self._last_flush = 0.0
+        self._closed = False  # set by close(); writes are dropped until open()
+        self._lock = threading.Lock()
+
+    def _rotate(self, ts):
+        path = log_path(ts, self.base_dir)
+        if path != self._path:
+            if self._file:
+                self._file.close()
+            os.makedirs(self.base_dir, exist_ok=True)
+            self._file = open(path, "ab")
+            self._path = path
+
+    def write(self, message, recv_ts=None):
+        recv_ts = recv_ts or time.time()
+        payload = message.encode("utf-8") if isinstance(message, str) else bytes(message)
+        with self._lock:
+            if self._closed:
+                return
+            self._rotate(recv_ts)
+            self._file.write(RECORD_HEADER.pack(recv_ts, len(payload)))
+            self._file.write(payload)
+            self.records += 1
+            self.bytes_written += RECORD_HEADER.size + len(payload)
+            if recv_ts - self._last_flush >= self.flush_interval:
+                self._file.flush()
+                self._last_flush = recv_ts
+
+    def open(self):
+        # The file itself is opened (or rotated) by the next write
+        with self._lock:
+            self._closed = False
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+            self._file = None
+            self._path = None
+            self._closed = True
+
+def read_records(path):
+    # Yields (receive_time, raw_message_bytes); a truncated last record is ignored
+    header_size = RECORD_HEADER.size
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(header_size)
+            if len(header) < header_size:
+                return
+            recv_ts, length = RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield recv_ts, payload
+
+def list_logs(base_dir=TICK_DIR):
+    return sorted(glob.glob(os.path.join(base_dir, "*.tlog")))
+
+class TickReplayer:
+    # Feeds recorded messages back through WebSocketHandler so the usual
+    # callbacks (touchline snapshots, depth, orders, bar aggregation) run offline.
+    def __init__(self, paths):
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.messages = 0
+        self.elapsed = 0.0
+
+    def records(self):
+        for path in self.paths:
+            yield from read_records(path)
+
+    def replay(self, handler, speed=None, stop_event=None):
+        # speed=None or 0: as fast as possible; 1.0: real time; 10.0: ten times faster
+        start = time.perf_counter()
+        first_ts = None
+        for recv_ts, payload in self.records():
+            if stop_event is not None and stop_event.is_set():
+                break
+            if speed:
+                if first_ts is None:
+                    first_ts = recv_ts
+                wait = (recv_ts - first_ts) / speed - (time.perf_counter() - start)
+                if wait > 0:
+                    time.sleep(wait)
+            handler.feed(payload, recv_ts)
+            self.messages += 1
+        self.elapsed = time.perf_counter() - start
+        return self.messages
+
+    def rate(self):
+        return self.messages / self.elapsed if self.elapsed else 0.0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded tick log through WebSocketHandler")
+    parser.add_argument("paths", nargs="*", help="tick log files (default: all files in ticks/)")
+    parser.add_argument("--speed", type=float, default=0, help="0 = as fast as possible, 1 = real time")
+    args = parser.parse_args()
+
+    from websocket_handler import WebSocketHandler
+    from bar_aggregator import BarAggregator
+
+    aggregator = BarAggregator(store=False)
+    handler = WebSocketHandler("replay", "replay", "", on_touchline=aggregator.on_touchline)
+    replayer = TickReplayer(args.paths or list_logs())
+    replayer.replay(handler, speed=args.speed)
+    print(f"messages={replayer.messages} tokens={len(handler.touchlines)} "
+          f"elapsed={replayer.elapsed:.2f}s rate={replayer.rate():,.0f} msg/s")
@@ -0,0 +1,158 @@
+import json
+import time
+import random
+import argparse
+
+# Use orjson when it is installed (several times faster on small messages),
+# otherwise fall back to the standard library decoder.
+try:
+    import orjson
+    loads = orjson.loads
+    JSON_DECODER = "orjson"
+except ImportError:
+    loads = json.loads
+    JSON_DECODER = "json"
+
+# Numeric touchline fields kept per token. Noren "tf" messages only carry the
+# fields that changed since the previous message for that token.
+NUMERIC_FIELDS = (
+    "lp", "pc", "v", "o", "h", "l", "c", "ap", "oi",
+    "bp1", "bq1", "sp1", "sq1", "uc", "lc", "ft",
+)
+TEXT_FIELDS = ("e", "tk", "ts")
+_NUMERIC = frozenset(NUMERIC_FIELDS)
+
+class TouchlineSnapshot:
+    __slots__ = TEXT_FIELDS + NUMERIC_FIELDS + ("updated",)
+
+    def __init__(self, e, tk):
+        self.e = e
+        self.tk = tk
+        self.ts = None
+        for k in NUMERIC_FIELDS:
+            setattr(self, k, None)
+        self.updated = 0.0
+
+    def merge(self, data, now=None):
+        # Apply a (partial) touchline message in place; now is its receive time
+        for k, v in data.items():
+            if k in _NUMERIC:
+                try:
+                    setattr(self, k, float(v))
+                except (TypeError, ValueError):
+                    pass
+            elif k == "ts":
+                self.ts = v
+        self.updated = now or time.time()
+        if "ft" not in data and ("lp" in data or "v" in data):
+            # A trade without a feed time happened now, not at the last message's ft
+            self.ft = float(int(self.updated))
+        return self
+
+    def update(self, fields, updated):
+        # Apply already-converted fields (merged elsewhere, e.g. in a shard process)
+        for k, v in fields.items():
+            setattr(self, k, v)
+        self.updated = updated
+        return self
+
+    def get(self, key, default=None):
+        # Dict-style access so callbacks written for raw messages keep working
+        value = getattr(self, key, None) if key in _NUMERIC or key in TEXT_FIELDS else None
+        return default if value is None else value
+
+    @property
+    def scrip(self):
+        return f"{self.e}|{self.tk}"
+
+    def to_dict(self):
+        d = {k: getattr(self, k) for k in TEXT_FIELDS + NUMERIC_FIELDS}
+        d["updated"] = self.updated
+        return d
+
+class TouchlineBook:
+    # Latest full touchline per scrip ("NSE|22"), built from delta messages
+    def __init__(self):
+        self.snapshots = {}
+
+    def apply(self, data, now=None):
+        key = (data.get("e"), data.get("tk"))
+        snap = self.snapshots.get(key)
+        if snap is None:
+            snap = TouchlineSnapshot(*key)
+            self.snapshots[key] = snap
+        return snap.merge(data, now)
+
+    def apply_fields(self, e, tk, fields, updated):
+        snap = self.snapshots.get((e, tk))
+        if snap is None:
+            snap = TouchlineSnapshot(e, tk)
+            self.snapshots[(e, tk)] = snap
+        return snap.update(fields, updated)
+
+    def get(self, exchange, token):
+        return self.snapshots.get((exchange, str(token)))
+
+    def to_rows(self):
+        return [s.to_dict() for s in self.snapshots.values()]
+
+    def __len__(self):
+        return len(self.snapshots)
+
+def synthetic_feed(n_tokens=500, n_messages=200000, seed=1):
+    # Recorded-feed stand-in: one full "tk" per token, then small "tf" deltas
+    rnd = random.Random(seed)
+    messages = []
+    prices = {}
+    for i in range(n_tokens):
+        tk = str(1000 + i)
+        prices[tk] = 100.0 + i
+        messages.append(json.dumps({
+            "t": "tk", "e": "NSE", "tk": tk, "ts": f"SYM{i}-EQ", "lp": f"{prices[tk]:.2f}",
+            "pc": "0.00", "v": "0", "o": f"{prices[tk]:.2f}", "h": f"{prices[tk]:.2f}",
+            "l": f"{prices[tk]:.2f}", "c": f"{prices[tk]:.2f}", "ap": f"{prices[tk]:.2f}",
+            "bp1": f"{prices[tk] - 0.05:.2f}", "sp1": f"{prices[tk] + 0.05:.2f}",
+            "bq1": "10", "sq1": "10", "ft": str(int(time.time())),
+        }))
+    volume = {tk: 0 for tk in prices}
+    for _ in range(n_messages - n_tokens):
+        tk = str(1000 + rnd.randrange(n_tokens))
+        prices[tk] += rnd.choice((-0.05, 0.05))
+        volume[tk] += rnd.randint(1, 500)
+        msg = {"t": "tf", "e": "NSE", "tk": tk, "lp": f"{prices[tk]:.2f}", "v": str(volume[tk])}
+        if rnd.random() < 0.3:
+            msg["bp1"] = f"{prices[tk] - 0.05:.2f}"
+            msg["sp1"] = f"{prices[tk] + 0.05:.2f}"
+        messages.append(json.dumps(msg))
+    return messages
+
+def load_recorded_feed(path):
+    # Binary tick log from TickRecorder, or one raw websocket message (JSON text) per line
+    if path.endswith(".tlog"):
+        from tick_recorder import read_records
+        return [payload for _, payload in read_records(path)]
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def benchmark(messages, repeat=3):
+    # Messages per second through the same decode + merge path used by WebSocketHandler
+    from websocket_handler import WebSocketHandler
+    best = 0.0
+    for _ in range(repeat):
+        handler = WebSocketHandler("bench", "bench", "", on_touchline=lambda snap: None)
+        start = time.perf_counter()
+        for raw in messages:
+            handler._on_message(None, raw)
+        elapsed = time.perf_counter() - start
+        best = max(best, len(messages) / elapsed if elapsed else 0.0)
+    return best
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Touchline decode/merge throughput benchmark")
+    parser.add_argument("feed", nargs="?", help="recorded feed (.tlog tick log, or one JSON message per line)")
+    parser.add_argument("--tokens", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=200000)
+    args = parser.parse_args()
+    feed = load_recorded_feed(args.feed) if args.feed else synthetic_feed(args.tokens, args.messages)
+    rate = benchmark(feed)
+    print(f"decoder={JSON_DECODER} messages={len(feed)} rate={rate:,.0f} msg/s")
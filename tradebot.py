@@ -1,5 +1,7 @@
 import streamlit as st
-from websocket_handler import WebSocketHandler
+import plotly.graph_objs as go
+from live_feed import get_live_feed, get_session_id
+from scheduler import get_scheduler
 
 def app():
     st.header("Tradebot — Automated Trading & Live Tracking (New)")
@@ -8,56 +10,110 @@ def app():
         st.error("No active session found!")
         return
 
-    uid, actid, ws_session_key = session["uid"], session["actid"], session["ws_session_key"]
+    # One feed per account, shared by every session/tab of this process
+    feed = get_live_feed(session)
+    session_id = get_session_id()
+    feed.touch(session_id)
 
     # UI for handler settings
     st.subheader("WebSocket Handler Controls")
     strategy = st.selectbox("Strategy", ["Scalping", "Intraday", "Swing", "Position"])
     decision_interval = st.slider("Decision Interval (sec)", 1, 300, 5)
-    max_idle_time = st.slider("Auto Disconnect (sec)", 30, 600, 300)
-    auto_disconnect = st.checkbox("Disconnect on Blur/Idle", True)
+    max_idle_time = st.slider("Idle Timeout (sec)", 30, 600, 300)
+    idle_reconnect = st.checkbox("Reconnect if Feed Goes Idle", False)
+    auto_reconnect = st.checkbox("Auto Reconnect (with backfill)", True)
+    record_ticks = st.checkbox("Record Feed to Disk (ticks/)", False)
+    shards = st.number_input("Feed Shards (connections)", min_value=1, max_value=8, value=1,
+                             help="Spread subscribed tokens over several connections for large watchlists")
+    use_processes = st.checkbox("Decode Shards in Separate Processes", False, disabled=shards < 2)
+    scrips_text = st.text_input("Scrips to follow (EXCHANGE|TOKEN, comma separated)", "NSE|22")
+    scrips = [s.strip() for s in scrips_text.split(",") if s.strip()]
 
-    # Handler callbacks
-    def on_touchline(data):
-        st.session_state['last_touchline'] = data
-
-    def on_depth(data):
-        st.session_state['last_depth'] = data
-
-    def on_order(data):
-        st.session_state['last_order'] = data
-
-    if "ws_handler" not in st.session_state:
-        st.session_state["ws_handler"] = None
-
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
     with col1:
         if st.button("Start Live Feed"):
-            ws_handler = WebSocketHandler(
-                uid, actid, ws_session_key,
-                on_touchline=on_touchline,
-                on_depth=on_depth,
-                on_order=on_order,
-                decision_interval=decision_interval,
-                auto_disconnect_on_blur=auto_disconnect,
-                max_idle_time=max_idle_time
+            started = feed.start(
+                max_idle_time=max_idle_time if idle_reconnect else 0,
+                auto_reconnect=auto_reconnect,
+                record_ticks=record_ticks,
+                shards=int(shards),
+                use_processes=use_processes
             )
-            ws_handler.connect()
-            ws_handler.subscribe_touchline(['NSE|22'])  # Example scrip
-            ws_handler.subscribe_order_update()
-            st.session_state["ws_handler"] = ws_handler
-            st.success("Live WebSocket Feed Started.")
+            feed.set_interest(session_id, touchline=scrips, depth=scrips[:1], orders=True)
+            if started:
+                st.success("Live WebSocket Feed Started.")
+            else:
+                st.info("Live feed already running — subscribed this session's scrips.")
 
     with col2:
         if st.button("Stop Live Feed"):
-            if st.session_state["ws_handler"]:
-                st.session_state["ws_handler"].disconnect()
-                st.session_state["ws_handler"] = None
+            # Only drop this session's interest; the connection stays up for other sessions
+            feed.unregister(session_id)
+            if not feed.interest:
+                feed.stop()
                 st.success("WebSocket Feed Stopped.")
+            else:
+                st.info(f"Unsubscribed this session. {len(feed.interest)} other session(s) still use the feed.")
 
-    # Live data panel
+    with col3:
+        if st.button("Stop Feed for All Sessions"):
+            feed.stop()
+            feed.interest.clear()
+            st.success("WebSocket Feed Stopped.")
+
+    if feed.is_running():
+        if session_id in feed.interest:
+            # Keep depth registered by other pages (Orders, Square Off) for this session
+            depth = feed.interest[session_id]["depth"] | set(scrips[:1])
+            feed.set_interest(session_id, touchline=scrips, depth=depth, orders=True)
+        feed.handler.change_decision_interval(decision_interval)
+        st.subheader("Feed Health")
+        metrics = feed.metrics()
+        m1, m2, m3, m4, m5 = st.columns(5)
+        m1.metric("Connected", "Yes" if metrics["connected"] else "No")
+        m2.metric("Sessions", metrics["sessions"])
+        m3.metric("Reconnects", metrics["reconnect_count"])
+        m4.metric("Total Downtime (sec)", metrics["total_downtime_sec"])
+        m5.metric("Backfills", metrics["backfill_count"])
+        sched = get_scheduler().stats()
+        st.caption(
+            f"Tokens: {metrics['touchline_tokens']} touchline / {metrics['depth_tokens']} depth | "
+            f"Scheduler: {sched['jobs']} jobs, {sched['threads']} threads, {sched['wakeups']} wakeups"
+        )
+        if metrics.get("shards"):
+            st.dataframe(metrics["shards"], use_container_width=True)
+
+    # Live data panel (read from the shared feed, not from per-session callbacks)
     st.subheader("Live Updates")
-    if 'last_touchline' in st.session_state:
-        st.json(st.session_state['last_touchline'])
-    if 'last_order' in st.session_state:
-        st.json(st.session_state['last_order'])
+    if feed.is_running():
+        rows = [feed.get_touchline(*s.split("|", 1)) for s in scrips if "|" in s]
+        rows = [snap.to_dict() for snap in rows if snap is not None]
+        if rows:
+            st.dataframe(rows, use_container_width=True)
+        if scrips and "|" in scrips[0]:
+            book = feed.get_depth(*scrips[0].split("|", 1))
+            if book is not None and book.is_ready():
+                st.caption(f"Depth {book.e}|{book.tk} — Spread: {book.spread():.2f} | Mid: {book.mid():.2f} | Imbalance: {book.imbalance():+.2f}")
+                st.dataframe(book.to_frame_rows(), use_container_width=True)
+        if feed.last_order:
+            st.json(feed.last_order)
+
+    # Live intraday candles (no extra API calls)
+    aggregator = feed.aggregator
+    if aggregator.series:
+        st.subheader("Live Candles")
+        c1, c2 = st.columns(2)
+        scrip = c1.selectbox("Scrip", sorted(aggregator.series.keys()))
+        minutes = c2.selectbox("Timeframe (min)", list(aggregator.timeframes))
+        bars = aggregator.get_bars(scrip, minutes)
+        if not bars.empty:
+            fig = go.Figure(data=[go.Candlestick(
+                x=bars["Date"].dt.strftime("%H:%M"),
+                open=bars["Open"],
+                high=bars["High"],
+                low=bars["Low"],
+                close=bars["Close"],
+                name=scrip
+            )])
+            fig.update_layout(height=400, xaxis_rangeslider_visible=False, xaxis=dict(type="category"))
+            st.plotly_chart(fig, use_container_width=True)
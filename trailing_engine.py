@@ -0,0 +1,263 @@
+import json
+import os
+import threading
+import time
+from stop_rules import trailing_stop, TRAIL_STEPS
+from utils import api_request
+from gtt_reconcile import nse_holdings, reconcile, leg_key, book_stops, needs_push
+from security_info import get_security_cache
+from scheduler import get_scheduler
+
+STATE_DIR = "trailing_state"
+DEBOUNCE = 3.0  # push once stops have been quiet this long...
+MAX_WAIT = 15.0  # ...but never hold a ratchet back longer than this
+HOLDINGS_REFRESH = 900
+ENGINE_SESSION = "trailing_engine"  # interest id on the live feed
+# Gain thresholds in ascending order; a stop can only move when LTP crosses the next one
+GAINS = sorted(gain for gain, _, _ in TRAIL_STEPS)
+
+class TrailState:
+    __slots__ = ("exchange", "token", "tradingsymbol", "quantity", "entry", "stop", "status",
+                 "next_trigger", "pushed_stop", "tick_size", "updated")
+
+    def __init__(self, exchange, token, tradingsymbol, quantity, entry, stop=None, status="Initial SL",
+                 pushed_stop=None, tick_size=0.05, updated=0.0):
+        self.exchange = exchange
+        self.token = str(token)
+        self.tradingsymbol = tradingsymbol
+        self.quantity = quantity
+        self.entry = entry
+        self.stop = stop if stop is not None else trailing_stop(entry, None)[0]
+        self.status = status
+        self.pushed_stop = pushed_stop
+        self.tick_size = tick_size
+        self.updated = updated
+        self.next_trigger = self._next_trigger()
+
+    def _next_trigger(self):
+        # LTP at which the next step would lift the stop above where it is now
+        for gain in GAINS:
+            # Slightly low so float rounding never skips an exact hit; evaluate() has the final say
+            trigger = self.entry * (100 + gain) / 100 * (1 - 1e-9)
+            if trailing_stop(self.entry, trigger)[0] > self.stop:
+                return trigger
+        return float("inf")
+
+    def evaluate(self, ltp):
+        # True when the stop ratcheted up
+        stop, status, _ = trailing_stop(self.entry, ltp)
+        if stop <= self.stop:
+            self.next_trigger = self._next_trigger()
+            return False
+        self.stop, self.status, self.updated = stop, status, time.time()
+        self.next_trigger = self._next_trigger()
+        return True
+
+    def desired(self):
+        return {"exchange": self.exchange, "tradingsymbol": self.tradingsymbol, "quantity": self.quantity,
+                "stop": self.stop, "product_type": "CNC", "tick_size": self.tick_size}
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__ if k != "next_trigger"}
+
+class TrailingEngine:
+    # Keeps a trailing stop per NSE holding, re-evaluated on every touchline tick from the
+    # shared live feed. The tick path is one float comparison unless a step is crossed.
+    # Ratchets are persisted and pushed to the GTT book in debounced batches.
+    def __init__(self, feed):
+        self.feed = feed
+        self.actid = feed.actid
+        self.states = {}  # (exchange, token) -> TrailState
+        self.dirty = set()
+        self.first_dirty = None
+        self.last_dirty = None
+        self.pushing = False
+        self.unsaved = False
+        self.last_report = None
+        self.ticks = 0
+        self.ratchets = 0
+        self.pushes = 0
+        self.push_errors = 0
+        self._lock = threading.Lock()
+        self._jobs = []
+
+    def state_path(self):
+        return os.path.join(STATE_DIR, f"{self.actid}.json")
+
+    def load(self):
+        if not os.path.exists(self.state_path()):
+            return {}
+        try:
+            with open(self.state_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        os.makedirs(STATE_DIR, exist_ok=True)
+        with self._lock:
+            rows = {f"{s.exchange}|{s.token}": s.to_dict() for s in self.states.values()}
+            self.unsaved = False
+        tmp = self.state_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(rows, f)
+        os.replace(tmp, self.state_path())
+
+    def refresh_holdings(self):
+        headers = self.feed.api_headers()
+        items = nse_holdings(headers)
+        book = api_request("GET", "/gttorders", headers)
+        # Without the book nothing new is pushed; the next refresh compares again
+        stops = None if book.get("status") == "ERROR" else book_stops(book.get("pendingGTTOrderBook") or [])
+        if stops is None:
+            print(f"Trailing engine: GTT book unavailable ({book.get('message')})")
+        saved = self.load()
+        cache = get_security_cache()
+        states = {}
+        with self._lock:
+            for h in items:
+                key, qty, entry = (h.exchange, h.token), h.sellable_qty, h.avg_price
+                old = self.states.get(key)
+                if old is None and h.instrument_id in saved:
+                    row = dict(saved[h.instrument_id])
+                    old = TrailState(row.pop("exchange"), row.pop("token"), **row)
+                if old is not None and abs(old.entry - entry) < 0.01:
+                    # Same position: keep the ratcheted stop
+                    state = old
+                    if state.quantity != qty:
+                        state.quantity = qty
+                        self._mark(key)
+                else:
+                    state = TrailState(key[0], key[1], h.tradingsymbol, qty, entry,
+                                       tick_size=cache.tick_size(key[0], key[1], h.tick_size))
+                if stops is not None:
+                    # The book is the truth: a LTP_BELOW GTT or an OCO stop leg at or above
+                    # this stop already protects the holding
+                    state.pushed_stop = stops.get(leg_key(key[0], state.tradingsymbol))
+                    if needs_push(state.stop, state.pushed_stop, state.tick_size):
+                        self._mark(key)
+                states[key] = state
+            self.states = states
+            self.dirty &= set(states)
+            self.unsaved = True
+        # Evaluate against whatever prices the feed already has
+        for key, state in states.items():
+            snap = self.feed.get_touchline(*key)
+            if snap is not None and snap.lp:
+                self.on_touchline(snap)
+        self.feed.set_interest(ENGINE_SESSION, touchline=[f"{e}|{t}" for e, t in states])
+        return len(states)
+
+    def _mark(self, key):
+        now = time.monotonic()
+        self.dirty.add(key)
+        self.first_dirty = self.first_dirty or now
+        self.last_dirty = now
+
+    def on_touchline(self, snap):
+        state = self.states.get((snap.e, snap.tk))
+        if state is None:
+            return
+        self.ticks += 1
+        lp = snap.lp
+        if lp is None or lp < state.next_trigger:
+            return
+        with self._lock:
+            if state.evaluate(lp):
+                self.ratchets += 1
+                self.unsaved = True
+                if needs_push(state.stop, state.pushed_stop, state.tick_size):
+                    self._mark((snap.e, snap.tk))
+
+    def flush(self):
+        # Scheduler job: persist and push a debounced batch; the push runs on its own thread
+        self.feed.touch(ENGINE_SESSION)
+        if self.unsaved:
+            self.save()
+        if not self.dirty or self.pushing:
+            return
+        now = time.monotonic()
+        if now - self.last_dirty < DEBOUNCE and now - self.first_dirty < MAX_WAIT:
+            return
+        with self._lock:
+            batch = {key: self.states[key].desired() for key in self.dirty if key in self.states}
+            self.dirty = set()
+            self.first_dirty = self.last_dirty = None
+            self.pushing = True
+        threading.Thread(target=self._push, args=(batch,), name="trailing_push", daemon=True).start()
+
+    def _push(self, batch):
+        try:
+            report = reconcile(list(batch.values()), self.feed.api_headers(), ratchet=True)
+        except Exception as e:
+            report = {"error": str(e), "rows": [], "actions": 0, "summary": None, "elapsed_ms": 0}
+        failed = set() if not report["error"] else set(batch)
+        by_leg = {leg_key(d["exchange"], d["tradingsymbol"]): key for key, d in batch.items()}
+        for row in report["rows"]:
+            if row["status"] != "OK" and row["key"] in by_leg:
+                failed.add(by_leg[row["key"]])
+        with self._lock:
+            for key, desired in batch.items():
+                state = self.states.get(key)
+                if state is None:
+                    continue
+                if key in failed:
+                    self._mark(key)
+                else:
+                    state.pushed_stop = desired["stop"]
+            self.unsaved = True
+            self.pushing = False
+        self.pushes += 1
+        self.push_errors += len(failed)
+        self.last_report = report
+
+    def start(self):
+        self.refresh_holdings()
+        self.feed.bus.subscribe("touchline", self.on_touchline)
+        scheduler = get_scheduler()
+        self._jobs = [
+            scheduler.call_every(1, self.flush, name="trailing_flush"),
+            scheduler.call_every(HOLDINGS_REFRESH, lambda: threading.Thread(
+                target=self.refresh_holdings, name="trailing_holdings", daemon=True).start(),
+                name="trailing_holdings"),
+        ]
+
+    def stop(self):
+        self.feed.bus.unsubscribe("touchline", self.on_touchline)
+        for job in self._jobs:
+            job.cancel()
+        self._jobs = []
+        self.feed.unregister(ENGINE_SESSION)
+        if self.unsaved:
+            self.save()
+
+    def rows(self):
+        with self._lock:
+            states = list(self.states.values())
+        return [{"tradingsymbol": s.tradingsymbol, "quantity": s.quantity, "entry": s.entry, "stop": s.stop,
+                 "status": s.status, "pushed_stop": s.pushed_stop,
+                 "next_step_at": None if s.next_trigger == float("inf") else round(s.next_trigger, 2),
+                 "synced": not needs_push(s.stop, s.pushed_stop, s.tick_size)} for s in states]
+
+    def stats(self):
+        return {"holdings": len(self.states), "ticks": self.ticks, "ratchets": self.ratchets,
+                "pending": len(self.dirty), "pushes": self.pushes, "push_errors": self.push_errors}
+
+# One engine per account, process-wide like the live feed
+engines = {}
+
+def start_engine(feed):
+    engine = engines.get(feed.actid)
+    if engine is None:
+        engine = TrailingEngine(feed)
+        engine.start()
+        engines[feed.actid] = engine
+    return engine
+
+def stop_engine(actid):
+    engine = engines.pop(actid, None)
+    if engine:
+        engine.stop()
+
+def get_engine(actid):
+    return engines.get(actid)
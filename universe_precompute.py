@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from candle_store import IST, load_candles
+from daily_candles import ensure_daily, today, last_session
+from master_loader import load_watchlist
+from scheduler import get_scheduler
+
+# Post-close precompute over the whole equity universe: refresh daily candles for every
+# EQ/BE instrument in master.csv, then compute one feature row per instrument from the
+# candle store. Scanners and pages filter/look up this table instead of fetching candles.
+#   universe/features.<parquet|csv>  one row per instrument, keyed "NSE|22"
+#   universe/features.meta.json      build time, session date, timing
+UNIVERSE_DIR = "universe"
+SERIES = ("EQ", "BE")
+BENCHMARK = ("NSE", "26004")  # Nifty 500
+BACKFILL_DAYS = 730  # enough history for EMA200 and a monthly RSI14
+UPDOWN_WINDOW = 15
+RS_WINDOWS = {"RS_3M": 63, "RS_6M": 126, "RS_1Y": 252}  # sessions
+RUN_AFTER = "15:45"
+FETCH_WORKERS = 8
+
+try:
+    import pyarrow  # noqa: F401
+    FORMAT = "parquet"
+except ImportError:
+    FORMAT = "csv"
+
+def features_path(base_dir=UNIVERSE_DIR):
+    return os.path.join(base_dir, f"features.{FORMAT}")
+
+def meta_path(base_dir=UNIVERSE_DIR):
+    return os.path.join(base_dir, "features.meta.json")
+
+def universe(master_file="master.csv"):
+    df = load_watchlist(master_file)
+    df = df[df["series"].str.upper().isin(SERIES)]
+    return df.drop_duplicates(subset=["segment", "token"]).reset_index(drop=True)
+
+def _rsi(closes, period=14):
+    # Same SMA-based RSI as the scanners, on every column at once
+    delta = closes.diff()
+    up = delta.clip(lower=0).rolling(window=period, min_periods=period).mean()
+    down = (-delta.clip(upper=0)).rolling(window=period, min_periods=period).mean()
+    rsi = 100 - 100 / (1 + up / (down + 1e-10))
+    return rsi.where(closes.notna())
+
+def _last(frame):
+    # Last non-null value per column
+    return frame.ffill().iloc[-1] if len(frame) else pd.Series(np.nan, index=frame.columns)
+
+def compute_features(bars, benchmark=None):
+    # bars: {id: DataFrame with Date, High, Low, Close, Volume}. Columns are aligned on dates
+    # into wide frames (dates x instruments) so each indicator is one vectorized pass.
+    fields = {}
+    for name in ("Close", "High", "Low", "Volume"):
+        fields[name] = pd.DataFrame({k: pd.Series(df[name].values, index=df["Date"].values) for k, df in bars.items()})
+    C, H, L, V = (fields[n].sort_index() for n in ("Close", "High", "Low", "Volume"))
+    ids = list(C.columns)
+    out = pd.DataFrame(index=ids)
+    valid = C.notna()
+    out["Date"] = [C.index[valid[k].to_numpy()][-1] if valid[k].any() else pd.NaT for k in ids]
+    out["Bars"] = valid.sum()
+    out["LTP"] = _last(C)
+    out["PrevClose"] = C.apply(lambda s: s.dropna().iloc[-2] if s.count() >= 2 else np.nan)
+    for span in (20, 50, 200):
+        out[f"EMA{span}"] = _last(C.ewm(span=span, adjust=False).mean())
+    out["RSI14"] = _last(_rsi(C))
+    out["RSI14_W"] = _last(_rsi(C.resample("W").last()))
+    out["RSI14_M"] = _last(_rsi(C.resample("ME").last()))
+    recent_h, recent_l = H.tail(UPDOWN_WINDOW + 1), L.tail(UPDOWN_WINDOW + 1)
+    out["Updays"] = (recent_h.diff() > 0).iloc[1:].sum()
+    out["Downdays"] = (recent_l.diff() < 0).iloc[1:].sum()
+    year = C.index >= C.index[-1] - pd.Timedelta(days=365) if len(C) else []
+    out["High52W"] = H[year].max()
+    out["Low52W"] = L[year].min()
+    out["AvgVol20"] = V.tail(20).mean()
+    out["AvgVol50"] = V.tail(50).mean()
+    out["EMA20/LTP"] = out["EMA20"] / out["LTP"]
+    out["EMA50/EMA20"] = out["EMA50"] / out["EMA20"]
+    out["From52WHigh%"] = (out["LTP"] / out["High52W"] - 1) * 100
+    if benchmark is not None and not benchmark.empty:
+        b = pd.Series(benchmark["Close"].values, index=benchmark["Date"].values).sort_index()
+        Cb = C.reindex(b.index).ffill()
+        for col, n in RS_WINDOWS.items():
+            if len(b) > n:
+                out[col] = (Cb.iloc[-1] / Cb.iloc[-1 - n]) / (b.iloc[-1] / b.iloc[-1 - n])
+            else:
+                out[col] = np.nan
+    else:
+        for col in RS_WINDOWS:
+            out[col] = np.nan
+    return out
+
+def build(api_key, master_file="master.csv", base_dir=UNIVERSE_DIR, workers=FETCH_WORKERS, refresh=True):
+    started = time.perf_counter()
+    uni = universe(master_file)
+    pairs = [(str(s).upper(), str(t)) for s, t in zip(uni["segment"], uni["token"])]
+    added = ensure_daily(pairs + [BENCHMARK], api_key, BACKFILL_DAYS, workers) if refresh else 0
+    fetched = time.perf_counter()
+    bars = {}
+    for pair in pairs:
+        df = load_candles(pair[0], pair[1], "day")
+        if not df.empty:
+            bars[f"{pair[0]}|{pair[1]}"] = df
+    bench = load_candles(*BENCHMARK, "day")
+    loaded = time.perf_counter()
+    feats = compute_features(bars, bench) if bars else pd.DataFrame()
+    computed = time.perf_counter()
+    info = uni.assign(id=[f"{e}|{t}" for e, t in pairs], exchange=[e for e, _ in pairs], token=[t for _, t in pairs])
+    table = info[["id", "exchange", "token", "symbol", "series", "company"]].merge(
+        feats, left_on="id", right_index=True, how="inner")
+    os.makedirs(base_dir, exist_ok=True)
+    tmp = features_path(base_dir) + ".tmp"
+    if FORMAT == "parquet":
+        table.to_parquet(tmp, index=False)
+    else:
+        table.to_csv(tmp, index=False)
+    os.replace(tmp, features_path(base_dir))
+    meta = {
+        "built": datetime.now(IST).isoformat(timespec="seconds"),
+        "built_for": today(),
+        "session": str(pd.Timestamp(table["Date"].max()).date()) if len(table) else None,
+        "instruments": len(uni), "rows": len(table), "bars_added": added,
+        "refresh_s": round(fetched - started, 1), "load_s": round(loaded - fetched, 1),
+        "compute_s": round(computed - loaded, 2), "total_s": round(time.perf_counter() - started, 1),
+    }
+    with open(meta_path(base_dir), "w") as f:
+        json.dump(meta, f, indent=1)
+    return table, meta
+
+_cache = {"mtime": None, "table": None, "rows": None, "meta": None}
+_cache_lock = threading.Lock()
+
+def load_features(base_dir=UNIVERSE_DIR):
+    # (table, meta), re-read only when the file changes; (None, None) before the first build
+    path = features_path(base_dir)
+    if not os.path.exists(path):
+        return None, None
+    mtime = os.path.getmtime(path)
+    with _cache_lock:
+        if _cache["mtime"] != mtime:
+            table = pd.read_parquet(path) if FORMAT == "parquet" else pd.read_csv(path, dtype={"token": str},
+                                                                                   parse_dates=["Date"])
+            meta = {}
+            if os.path.exists(meta_path(base_dir)):
+                with open(meta_path(base_dir)) as f:
+                    meta = json.load(f)
+            _cache.update(mtime=mtime, table=table, meta=meta,
+                          rows=dict(zip(table["id"], table.to_dict("records"))))
+        return _cache["table"], _cache["meta"]
+
+def _session(row):
+    return None if pd.isna(row["Date"]) else str(pd.Timestamp(row["Date"]).date())
+
+def lookup(exchange, token, fresh=False):
+    # Feature row for one instrument as a dict, or None. With fresh=True only a row whose
+    # session is the last completed one (i.e. the table and the candle store are current)
+    table, _ = load_features()
+    if table is None:
+        return None
+    row = _cache["rows"].get(f"{str(exchange).upper()}|{token}")
+    if row is not None and fresh and _session(row) not in (last_session(), today()):
+        return None
+    return row
+
+def prev_close(exchange, token):
+    # Previous session's close from the table: the last stored close, unless that session is today.
+    # A row from an older session is not trusted; callers fall back to the history API.
+    row = lookup(exchange, token)
+    if row is None:
+        return None
+    session = _session(row)
+    if session == today():
+        value = row["PrevClose"]
+    elif session == last_session():
+        value = row["LTP"]
+    else:
+        return None
+    return None if pd.isna(value) else float(value)
+
+class PrecomputeJob:
+    # Scheduled once per trading day after RUN_AFTER; the build runs on its own thread
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.running = False
+        self.last_error = None
+        self._job = None
+
+    def tick(self):
+        now = datetime.now(IST)
+        if self.running or now.weekday() >= 5 or now.strftime("%H:%M") < RUN_AFTER:
+            return
+        _, meta = load_features()
+        if meta and meta.get("built_for") == today():
+            return
+        self.running = True
+        threading.Thread(target=self._run, name="universe_precompute", daemon=True).start()
+
+    def _run(self):
+        try:
+            _, meta = build(self.api_key)
+            self.last_error = None
+            print(f"Universe precompute: {meta['rows']} rows in {meta['total_s']} s")
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Universe precompute failed: {e}")
+        finally:
+            self.running = False
+
+    def start(self):
+        self._job = get_scheduler().call_every(60, self.tick, name="universe_precompute", initial_delay=5)
+
+_job = None
+
+def schedule_precompute(api_key):
+    # One job per process; started from app.py once a session exists
+    global _job
+    if _job is None and api_key:
+        _job = PrecomputeJob(api_key)
+        _job.start()
+    return _job
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh daily candles for the EQ/BE universe and rebuild the feature table")
+    parser.add_argument("--master", default="master.csv")
+    parser.add_argument("--workers", type=int, default=FETCH_WORKERS, help="concurrent candle fetches")
+    parser.add_argument("--no-refresh", action="store_true", help="compute from stored candles only")
+    parser.add_argument("--api-key", help="history API key (default: $INTEGRATE_API_SESSION_KEY or session.json)")
+    args = parser.parse_args()
+
+    api_key = args.api_key or os.environ.get("INTEGRATE_API_SESSION_KEY", "")
+    if not api_key and not args.no_refresh:
+        from session_utils import load_session_from_file
+        session = load_session_from_file()
+        api_key = session["api_session_key"] if session else ""
+        if not api_key:
+            raise SystemExit("No API key: pass --api-key, set INTEGRATE_API_SESSION_KEY or use --no-refresh.")
+    _, meta = build(api_key, args.master, workers=args.workers, refresh=not args.no_refresh)
+    print(json.dumps(meta, indent=1))
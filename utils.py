@@ -1,10 +1,22 @@
 import streamlit as st
 import requests
 import os
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from debug_utils import debug_log
+from order_latency import get_tracker, TRACKED_PATHS
+
+BASE_URL = "https://integrate.definedgesecurities.com/dart/v1"
+
+# One pooled HTTP session for all broker calls, so concurrent requests reuse
+# keep-alive connections instead of opening a new one per call
+_http = requests.Session()
+_http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
 
 def get_session_headers():
-    session = st.session_state.get("integrate_session")
+    return session_headers(st.session_state.get("integrate_session"))
+
+def session_headers(session):
     if not session:
         return {}
     return {
@@ -13,24 +25,49 @@ def get_session_headers():
         "uid": session["uid"]
     }
 
+def api_request(method, path, headers, payload=None, timeout=(3, 10)):
+    # Thread-safe broker call: takes explicit headers and never touches
+    # st.session_state, so it can run on worker threads
+    client_id = get_tracker().submit(path, payload) if path in TRACKED_PATHS else None
+    data = _api_request(method, path, headers, payload, timeout)
+    if client_id:
+        get_tracker().response(client_id, data)
+    return data
+
+def _api_request(method, path, headers, payload, timeout):
+    url = BASE_URL + path
+    debug_log(f"{method} {url} payload {payload}")
+    try:
+        resp = _http.request(method, url, json=payload, headers=headers, timeout=timeout)
+        debug_log(f"{method} response: {resp.status_code} - {resp.text}")
+        resp.raise_for_status()
+        try:
+            return resp.json()
+        except Exception:
+            return {"status": "ERROR", "message": f"Non-JSON response: {resp.text}"}
+    except Exception as e:
+        debug_log(f"{method} error: {e}")
+        return {"status": "ERROR", "message": str(e)}
+
+def api_get_many(paths, headers, max_workers=8):
+    # Concurrent GETs for independent read calls (quotes, books); {path: response}
+    paths = list(dict.fromkeys(paths))
+    if not paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+        return dict(zip(paths, pool.map(lambda p: api_request("GET", p, headers), paths)))
+
 def integrate_get(path):
-    base_url = "https://integrate.definedgesecurities.com/dart/v1"
     headers = get_session_headers()
-    url = base_url + path
+    url = BASE_URL + path
     debug_log(f"GET {url} with headers {headers}")
     try:
-        resp = requests.get(url, headers=headers, timeout=15)
+        resp = _http.get(url, headers=headers, timeout=15)
         debug_log(f"GET response: {resp.status_code} - {resp.text}")
         resp.raise_for_status()
         try:
             data = resp.json()
-            if data.get("status") == "ERROR" and "session" in data.get("message", "").lower():
-                debug_log("Session expired error detected in API response.")
-                st.session_state.pop("integrate_session", None)
-                try:
-                    os.remove("session.json")
-                except Exception:
-                    pass
+            _check_session(data)
             return data
         except Exception:
             return {"status": "ERROR", "message": f"Non-JSON response: {resp.text}"}
@@ -38,24 +75,39 @@ def integrate_get(path):
         debug_log(f"GET error: {e}")
         return {"status": "ERROR", "message": str(e)}
 
-def integrate_post(path, payload):
-    base_url = "https://integrate.definedgesecurities.com/dart/v1"
+def integrate_post(path, payload, priority=None):
+    # With a priority the call goes through the shared order dispatch queue
+    if priority is not None:
+        from order_dispatch import dispatch  # order_dispatch imports this module
+        data = dispatch(priority, "POST", path, payload, get_session_headers())
+        _check_session(data)
+        return data
+    client_id = get_tracker().submit(path, payload) if path in TRACKED_PATHS else None
+    data = _integrate_post(path, payload)
+    if client_id:
+        get_tracker().response(client_id, data)
+    return data
+
+def _check_session(data):
+    if data.get("status") == "ERROR" and "session" in data.get("message", "").lower():
+        debug_log("Session expired error detected in API response.")
+        st.session_state.pop("integrate_session", None)
+        try:
+            os.remove("session.json")
+        except Exception:
+            pass
+
+def _integrate_post(path, payload):
     headers = get_session_headers()
-    url = base_url + path
+    url = BASE_URL + path
     debug_log(f"POST {url} payload {payload} headers {headers}")
     try:
-        resp = requests.post(url, json=payload, headers=headers, timeout=15)
+        resp = _http.post(url, json=payload, headers=headers, timeout=15)
         debug_log(f"POST response: {resp.status_code} - {resp.text}")
         resp.raise_for_status()
         try:
             data = resp.json()
-            if data.get("status") == "ERROR" and "session" in data.get("message", "").lower():
-                debug_log("Session expired error detected in API response.")
-                st.session_state.pop("integrate_session", None)
-                try:
-                    os.remove("session.json")
-                except Exception:
-                    pass
+            _check_session(data)
             return data
         except Exception:
             return {"status": "ERROR", "message": f"Non-JSON response: {resp.text}"}
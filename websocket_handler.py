@@ -2,33 +2,66 @@ import websocket
 import threading
 import json
 import time
+import random
+from datetime import datetime
+import requests
+from touchline import TouchlineBook, loads
+from depth_book import DepthBooks
+from candle_store import epoch_to_ist
+from scheduler import get_scheduler
+
+HISTORY_URL = "https://data.definedgesecurities.com/sds/history"
+HEARTBEAT_INTERVAL = 50  # seconds between "h" messages
+HOUSEKEEPING_INTERVAL = 5  # heartbeat / idle check period on the shared scheduler
 
 class WebSocketHandler:
-    def __init__(self, uid, actid, ws_session_key, 
+    def __init__(self, uid, actid, ws_session_key,
                  on_touchline=None, on_depth=None, on_order=None,
-                 decision_interval=5, auto_disconnect_on_blur=True, max_idle_time=300):
+                 decision_interval=5, auto_disconnect_on_blur=True, max_idle_time=300,
+                 auto_reconnect=True, reconnect_base_delay=1.0, reconnect_max_delay=60.0,
+                 api_session_key=None, on_backfill=None, on_reconnect=None, recorder=None):
         self.url = "wss://trade.definedgesecurities.com/NorenWSTRTP/"
         self.uid = uid
         self.actid = actid
         self.ws_session_key = ws_session_key
         self.ws = None
         self.connected = False
+        self.session_ready = False  # set once the broker acknowledges the connect ("ck")
         self.last_heartbeat = time.time()
         self.last_message = time.time()
         self.subscribed_touchline = set()
         self.subscribed_depth = set()
         self.order_subscribed = False
+        self.touchlines = TouchlineBook()  # merged full snapshot per token
+        self.depth_books = DepthBooks()  # 5-level depth per token
         self.on_touchline = on_touchline
         self.on_depth = on_depth
         self.on_order = on_order
         self.decision_interval = decision_interval
         self.auto_disconnect_on_blur = auto_disconnect_on_blur
         self.max_idle_time = max_idle_time
+        # Reconnect / backfill settings
+        self.auto_reconnect = auto_reconnect
+        self.reconnect_base_delay = reconnect_base_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.api_session_key = api_session_key
+        self.on_backfill = on_backfill
+        self.on_reconnect = on_reconnect  # on_reconnect(scrips) before subscriptions are restored
+        self.recorder = recorder  # optional TickRecorder capturing every raw message
+        # Reconnect metrics
+        self.reconnect_count = 0
+        self.total_downtime = 0.0
+        self.last_downtime = 0.0
+        self.backfill_count = 0
+        self.message_count = 0
+        self._attempt = 0
+        self._disconnected_at = None
         self._stop = threading.Event()
         self._thread = None
+        self._housekeeping_job = None
 
     def _on_open(self, ws):
-        # Send connect request
+        # Send connect request (also restores the session after a reconnect)
         ws.send(json.dumps({
             "t": "c",
             "uid": self.uid,
@@ -38,103 +71,235 @@ class WebSocketHandler:
         }))
         self.connected = True
         self.last_heartbeat = time.time()
-
-    def _on_message(self, ws, message):
         self.last_message = time.time()
-        data = json.loads(message)
+
+    def _on_message(self, ws, message, recv_ts=None):
+        self.last_message = recv_ts or time.time()
+        self.message_count += 1
+        if self.recorder:
+            self.recorder.write(message, self.last_message)
+        data = loads(message)
         t = data.get("t")
-        if t == "ck":
-            self.connected = True
-        elif t == "tf":
+        if t == "tf" or t == "tk":
+            # "tk" carries the full touchline on subscribe, "tf" only the changed fields
+            snap = self.touchlines.apply(data, self.last_message)
             if self.on_touchline:
-                self.on_touchline(data)
-        elif t == "df":
+                self.on_touchline(snap)
+        elif t == "ck":
+            self.connected = True
+            self._on_session_ready()
+        elif t == "df" or t == "dk":
+            book = self.depth_books.apply(data)
             if self.on_depth:
-                self.on_depth(data)
+                self.on_depth(book)
         elif t == "om":
             if self.on_order:
                 self.on_order(data)
         # Handle more types as needed
 
+    def feed(self, message, recv_ts=None):
+        # Dispatch a message without a socket (used by TickReplayer, with the recorded receive time)
+        self._on_message(None, message, recv_ts)
+
     def _on_error(self, ws, error):
         print(f"WebSocket error: {error}")
 
     def _on_close(self, ws, close_status_code, close_msg):
         self.connected = False
+        self.session_ready = False
+        if not self._stop.is_set() and self._disconnected_at is None:
+            self._disconnected_at = time.time()
         print("WebSocket closed:", close_status_code, close_msg)
-        # Optionally auto-reconnect here
+
+    def _on_session_ready(self):
+        self.session_ready = True
+        self._attempt = 0
+        if self._disconnected_at is not None and self.on_reconnect and self.subscribed_touchline:
+            try:
+                self.on_reconnect(list(self.subscribed_touchline))
+            except Exception as e:
+                print("Reconnect callback error:", e)
+        self._restore_subscriptions()
+        if self._disconnected_at is not None:
+            down_from = self._disconnected_at
+            down_to = time.time()
+            self._disconnected_at = None
+            self.last_downtime = down_to - down_from
+            self.total_downtime += self.last_downtime
+            self.reconnect_count += 1
+            print(f"WebSocket reconnected after {self.last_downtime:.1f}s (reconnect #{self.reconnect_count})")
+            if self.on_backfill and self.subscribed_touchline:
+                threading.Thread(target=self._backfill, args=(down_from, down_to), daemon=True).start()
+
+    def _restore_subscriptions(self):
+        if self.subscribed_touchline:
+            self._send({"t": "t", "k": '#'.join(self.subscribed_touchline)})
+        if self.subscribed_depth:
+            self._send({"t": "d", "k": '#'.join(self.subscribed_depth)})
+        if self.order_subscribed:
+            self._send({"t": "o", "actid": self.actid})
+
+    def _send(self, msg):
+        # Subscriptions made before the session is ready are sent by _restore_subscriptions
+        if not (self.ws and self.session_ready):
+            return False
+        try:
+            self.ws.send(json.dumps(msg))
+            return True
+        except Exception as e:
+            print("WebSocket send error:", e)
+            return False
+
+    def _backoff_delay(self, attempt):
+        # Exponential backoff with "equal jitter": half fixed, half random
+        delay = min(self.reconnect_max_delay, self.reconnect_base_delay * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.ws = websocket.WebSocketApp(
+                self.url,
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_error=self._on_error,
+                on_close=self._on_close
+            )
+            try:
+                self.ws.run_forever()
+            except Exception as e:
+                print("WebSocket run error:", e)
+            self.connected = False
+            self.session_ready = False
+            if self._stop.is_set() or not self.auto_reconnect:
+                break
+            if self._disconnected_at is None:
+                self._disconnected_at = time.time()
+            delay = self._backoff_delay(self._attempt)
+            self._attempt += 1
+            print(f"WebSocket reconnecting in {delay:.1f}s (attempt {self._attempt})")
+            if self._stop.wait(delay):
+                break
+
+    def _backfill(self, down_from, down_to):
+        # Fetch the minute bars missed while the feed was down, for every subscribed scrip
+        if not self.api_session_key:
+            return
+        from_str = epoch_to_ist(down_from - 60).strftime("%d%m%Y%H%M")
+        to_str = epoch_to_ist(down_to).strftime("%d%m%Y%H%M")
+        headers = {"Authorization": self.api_session_key}
+        for scrip in list(self.subscribed_touchline):
+            try:
+                exchange, token = scrip.split("|", 1)
+                url = f"{HISTORY_URL}/{exchange}/{token}/minute/{from_str}/{to_str}"
+                resp = requests.get(url, headers=headers, timeout=10)
+                if resp.status_code != 200:
+                    continue
+                bars = parse_history_rows(resp.text)
+                if bars:
+                    self.on_backfill(scrip, bars)
+                    self.backfill_count += 1
+            except Exception as e:
+                print(f"Backfill error for {scrip}:", e)
 
     def connect(self):
         self._stop.clear()
-        self.ws = websocket.WebSocketApp(
-            self.url,
-            on_open=self._on_open,
-            on_message=self._on_message,
-            on_error=self._on_error,
-            on_close=self._on_close
-        )
-        self._thread = threading.Thread(target=self.ws.run_forever, daemon=True)
+        if self.recorder:
+            # Closed by a previous disconnect(); messages still in flight from that socket are dropped
+            self.recorder.open()
+        self._thread = threading.Thread(target=self._run, daemon=True)
         self._thread.start()
-        # Start heartbeat thread
-        threading.Thread(target=self._heartbeat_loop, daemon=True).start()
-        # Start idle checker
-        threading.Thread(target=self._idle_checker, daemon=True).start()
+        # Heartbeat and idle checks run on the shared scheduler thread
+        if self._housekeeping_job is None:
+            self._housekeeping_job = get_scheduler().call_every(HOUSEKEEPING_INTERVAL, self._housekeeping)
 
     def disconnect(self):
         self._stop.set()
+        if self._housekeeping_job:
+            self._housekeeping_job.cancel()
+            self._housekeeping_job = None
         if self.ws:
             self.ws.close()
         self.connected = False
+        self.session_ready = False
+        if self.recorder:
+            self.recorder.close()
 
-    def _heartbeat_loop(self):
-        while not self._stop.is_set():
-            if self.connected and (time.time() - self.last_heartbeat > 50):
-                try:
-                    self.ws.send(json.dumps({"t": "h"}))
-                    self.last_heartbeat = time.time()
-                except Exception as e:
-                    print("Heartbeat error:", e)
-            time.sleep(5)
-
-    def _idle_checker(self):
-        while not self._stop.is_set():
-            if self.max_idle_time and (time.time() - self.last_message > self.max_idle_time):
+    def get_metrics(self):
+        downtime = self.total_downtime
+        if self._disconnected_at is not None:
+            downtime += time.time() - self._disconnected_at
+        return {
+            "connected": self.connected,
+            "reconnect_count": self.reconnect_count,
+            "reconnect_attempt": self._attempt,
+            "total_downtime_sec": round(downtime, 2),
+            "last_downtime_sec": round(self.last_downtime, 2),
+            "backfill_count": self.backfill_count,
+            "message_count": self.message_count,
+        }
+
+    def _housekeeping(self):
+        if self._stop.is_set():
+            return
+        now = time.time()
+        if self.connected and (now - self.last_heartbeat > HEARTBEAT_INTERVAL):
+            try:
+                self.ws.send(json.dumps({"t": "h"}))
+                self.last_heartbeat = now
+            except Exception as e:
+                print("Heartbeat error:", e)
+        if self.max_idle_time and self.connected and (now - self.last_message > self.max_idle_time):
+            if self.auto_disconnect_on_blur or not self.auto_reconnect:
                 print("Idle timeout, disconnecting WebSocket.")
                 self.disconnect()
-            time.sleep(5)
+            else:
+                # Treat a silent socket as dead and let _run reconnect it
+                print("Idle timeout, forcing WebSocket reconnect.")
+                self.last_message = now
+                self.ws.close()
 
     def subscribe_touchline(self, scriplist):
-        k_str = '#'.join(scriplist)
-        self.ws.send(json.dumps({"t": "t", "k": k_str}))
         self.subscribed_touchline.update(scriplist)
+        self._send({"t": "t", "k": '#'.join(scriplist)})
 
     def unsubscribe_touchline(self, scriplist):
-        k_str = '#'.join(scriplist)
-        self.ws.send(json.dumps({"t": "u", "k": k_str}))
         self.subscribed_touchline.difference_update(scriplist)
+        self._send({"t": "u", "k": '#'.join(scriplist)})
 
     def subscribe_depth(self, scriplist):
-        k_str = '#'.join(scriplist)
-        self.ws.send(json.dumps({"t": "d", "k": k_str}))
         self.subscribed_depth.update(scriplist)
+        self._send({"t": "d", "k": '#'.join(scriplist)})
 
     def unsubscribe_depth(self, scriplist):
-        k_str = '#'.join(scriplist)
-        self.ws.send(json.dumps({"t": "ud", "k": k_str}))
         self.subscribed_depth.difference_update(scriplist)
+        self._send({"t": "ud", "k": '#'.join(scriplist)})
 
     def subscribe_order_update(self):
         if not self.order_subscribed:
-            self.ws.send(json.dumps({"t": "o", "actid": self.actid}))
             self.order_subscribed = True
+            self._send({"t": "o", "actid": self.actid})
 
     def unsubscribe_order_update(self):
         if self.order_subscribed:
-            self.ws.send(json.dumps({"t": "uo"}))
             self.order_subscribed = False
+            self._send({"t": "uo"})
 
     def change_decision_interval(self, seconds):
         self.decision_interval = seconds
 
     def change_idle_timeout(self, seconds):
         self.max_idle_time = seconds
+
+def parse_history_rows(text):
+    # History API CSV rows: Dateandtime(ddmmyyyyHHMM),Open,High,Low,Close,Volume[,OI]
+    bars = []
+    for line in text.strip().split("\n"):
+        parts = line.strip().split(",")
+        if len(parts) < 6:
+            continue
+        try:
+            dt = datetime.strptime(parts[0].strip(), "%d%m%Y%H%M")
+            bars.append((dt, float(parts[1]), float(parts[2]), float(parts[3]), float(parts[4]), float(parts[5])))
+        except ValueError:
+            continue
+    return bars